@@ -1,3 +1,22 @@
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from jokes import qr
+from .models import User
+
+
+class TwoFactorSetupTests(TestCase):
+    """The 2FA setup page"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'pw-12345678')
+        self.client.force_login(self.user)
+
+    def test_provisioning_qr_code_is_never_cached(self):
+        with mock.patch.object(qr.QRCache, 'get') as get, mock.patch.object(qr.QRCache, 'set') as cache_set:
+            response = self.client.get('/auth/setup-2fa/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['qr_code'])
+        get.assert_not_called()
+        cache_set.assert_not_called()
@@ -6,9 +6,8 @@ from django.db import IntegrityError
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, TwoFactorForm
 from .models import User
 import pyotp
-import qrcode
-from io import BytesIO
 import base64
+from jokes.qr import get_qr
 from django.views.decorators.csrf import csrf_protect
 from django.utils import timezone
 from datetime import timedelta
@@ -155,16 +154,9 @@ def setup_2fa_view(request):
         issuer_name='Security System'
     )
     
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(totp_uri)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    qr_code = base64.b64encode(buffer.getvalue()).decode()
+    # Not cached: the URI holds the user's secret, which must not be kept in
+    # memory or reach the shared cache tier
+    qr_code = base64.b64encode(get_qr(totp_uri, error_correction='M', border=5, use_cache=False)).decode()
     
     context = {
         'form': form,
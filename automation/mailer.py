@@ -0,0 +1,144 @@
+"""
+Bulk email over one reused SMTP connection
+
+send_mail() opens a connection, does the STARTTLS handshake and logs in for
+every message. BulkMailer opens one connection from get_connection() and
+sends every message of a run over it, so a run costs one handshake instead of
+one per recipient.
+
+The body is built once and shared by the messages, which are built in
+batches of EMAIL_BATCH_SIZE so a long recipient list is never held as
+messages all at once. Messages are handed to the backend one by one so a
+failure is tied to its recipient: a refused recipient is counted as failed,
+and a connection dropped by the server is reopened and the message sent
+again, once; a second drop interrupts the batch (DeliveryInterrupted). send_batch() returns the outcome of every message, for the
+delivery ledger (automation.models.Delivery). Every message waits for a
+token of the SMTP rate limit (automation.ratelimit) first.
+"""
+import logging
+import smtplib
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from .ratelimit import get_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def batches(iterable, size):
+    """Yield lists of up to ``size`` items of an iterable"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class DeliveryInterrupted(Exception):
+    """
+    The SMTP connection was lost during a batch: it could not be reopened,
+    or dropped again once reopened
+
+    ``errors`` holds the outcome of the messages of the batch tried before.
+    """
+
+    def __init__(self, error, errors):
+        super().__init__(str(error))
+        self.errors = errors
+
+
+class BulkMailer:
+    """Send one message to many recipients over a single SMTP connection"""
+
+    def __init__(self, subject, body, from_email=None, batch_size=None, connection=None, limiter=False):
+        self.subject = subject
+        self.body = body
+        self.from_email = from_email or settings.EMAIL_HOST_USER
+        self.batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+        self.connection = connection or get_connection()
+        # The SMTP rate limit by default; None sends without one
+        self.limiter = get_limiter('smtp') if limiter is False else limiter
+        self.throttled = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.reconnects = 0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.connection.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.connection.close()
+        finally:
+            self.elapsed += time.perf_counter() - self._started
+
+    def send(self, addresses):
+        """Send the message to every address and return the stats of the run"""
+        with self:
+            for batch in batches(addresses, self.batch_size):
+                self.send_batch(batch)
+        return self.stats()
+
+    def send_batch(self, addresses):
+        """
+        Send the message to a batch of addresses over the open connection
+
+        Returns the error of every address, None for the ones sent. Raises
+        DeliveryInterrupted when the connection is lost for good.
+        """
+        messages = [EmailMessage(self.subject, self.body, self.from_email, [address]) for address in addresses]
+        errors = []
+        try:
+            for message in messages:
+                errors.append(self._deliver(message))
+        except OSError as e:
+            raise DeliveryInterrupted(e, errors) from e
+        finally:
+            failed = sum(error is not None for error in errors)
+            self.sent += len(errors) - failed
+            self.failed += failed
+        elapsed = self.elapsed + time.perf_counter() - self._started
+        logger.info(f"Sent {self.sent} emails ({self.sent / elapsed:.1f} msgs/sec)")
+        return errors
+
+    def _deliver(self, message):
+        """
+        Send a message, reconnecting once if the server dropped us
+
+        Returns the error of a refused message, or None. Raises OSError when
+        the connection can't be reopened or drops again.
+        """
+        for attempt in range(2):
+            if self.limiter is not None:
+                self.throttled += self.limiter.acquire()
+            try:
+                self.connection.send_messages([message])
+                return None
+            except smtplib.SMTPServerDisconnected as e:
+                error = e
+            except smtplib.SMTPException as e:
+                logger.error(f"Failed to send email to {message.to[0]}: {str(e)}")
+                return str(e)
+            except OSError as e:
+                error = e
+            if attempt:
+                # Dropped again right after reconnecting: lost for good
+                raise error
+            logger.warning(f"SMTP connection dropped ({str(error)}), reconnecting")
+            self.connection.close()
+            self.connection.open()
+            self.reconnects += 1
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'reconnects': self.reconnects,
+            'throttled': round(self.throttled, 3),
+            'seconds': round(self.elapsed, 3),
+            'per_second': self.sent / self.elapsed if self.elapsed else 0.0,
+        }
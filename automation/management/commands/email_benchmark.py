@@ -0,0 +1,83 @@
+"""
+Benchmark bulk joke emails against a local SMTP stand-in
+
+Sends the same message to generated recipients twice: once with send_mail()
+per recipient, as send_joke_emails used to, and once with BulkMailer over a
+single connection. The stand-in (automation.testing.SMTPStandIn) is a
+minimal SMTP server on localhost that waits --handshake-ms before greeting
+each connection, standing for the TCP, STARTTLS and login round trips of a
+real server, and that can drop the connection every --drop-after messages to
+exercise reconnects.
+
+Both runs must deliver every message; the run fails when the speed-up is
+below --min-speedup.
+"""
+import time
+
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand, CommandError
+
+from automation.mailer import BulkMailer
+from automation.testing import SMTPStandIn
+
+SUBJECT = 'Your Daily Joke - Security System'
+BODY = 'Benchmark joke\n\n' + 'Why did the cipher cross the road? ' * 20
+
+
+def _send_one_by_one(addresses):
+    """The former send_joke_emails loop: one send_mail() per recipient"""
+    sent = 0
+    for address in addresses:
+        sent += send_mail(SUBJECT, BODY, 'bench@localhost', [address], fail_silently=False)
+    return sent
+
+
+class Command(BaseCommand):
+    help = 'Compare per-recipient send_mail() with BulkMailer on a local SMTP stand-in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=200, help='Messages per run')
+        parser.add_argument('--batch-size', type=int, default=100, help='BulkMailer batch size')
+        parser.add_argument('--handshake-ms', type=float, default=50,
+                            help='Delay of the stand-in before greeting a connection')
+        parser.add_argument('--drop-after', type=int, default=0,
+                            help='Drop each connection after this many messages (0: never)')
+        parser.add_argument('--min-speedup', type=float, default=10,
+                            help='Fail when BulkMailer is not this many times faster')
+
+    def handle(self, *args, **options):
+        addresses = [f'recipient{number}@example.com' for number in range(options['recipients'])]
+        with SMTPStandIn(options['handshake_ms'] / 1000, options['drop_after']) as server, server.settings():
+            started = time.perf_counter()
+            _send_one_by_one(addresses)
+            baseline = self._result('send_mail per recipient', server, time.perf_counter() - started)
+
+            server.reset()
+            stats = BulkMailer(SUBJECT, BODY, batch_size=options['batch_size'], limiter=None).send(addresses)
+            bulk = self._result('BulkMailer', server, stats['seconds'])
+            bulk['reconnects'] = stats['reconnects']
+
+        self.stdout.write(f"{'':<26}{'messages':>10}{'connections':>13}{'seconds':>10}{'msgs/sec':>11}")
+        for result in (baseline, bulk):
+            self.stdout.write(
+                f"{result['name']:<26}{result['messages']:>10}{result['connections']:>13}"
+                f"{result['seconds']:>10.3f}{result['per_second']:>11.1f}"
+            )
+        speedup = bulk['per_second'] / baseline['per_second']
+        self.stdout.write(f"Speed-up: {speedup:.1f}x ({bulk['reconnects']} reconnects)")
+
+        for result in (baseline, bulk):
+            if result['messages'] != len(addresses):
+                raise CommandError(f"{result['name']} delivered {result['messages']} of {len(addresses)} messages")
+        if speedup < options['min_speedup']:
+            raise CommandError(f"Speed-up {speedup:.1f}x is below {options['min_speedup']}x")
+
+    @staticmethod
+    def _result(name, server, seconds):
+        return {
+            'name': name,
+            'messages': server.messages,
+            'connections': server.connections,
+            'seconds': seconds,
+            'per_second': server.messages / seconds if seconds else 0.0,
+        }
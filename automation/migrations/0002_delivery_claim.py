@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-17 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='claim',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='delivery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Being sent'), ('sent', 'Sent'), ('retry', 'Waiting for a retry'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
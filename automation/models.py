@@ -1,3 +1,186 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+
+class Campaign(models.Model):
+    """A joke sent to the recipients, once per key (by default once a day)"""
+    key = models.CharField(max_length=64, unique=True)
+    subject = models.CharField(max_length=200)
+    email_body = models.TextField()
+    sms_text = models.CharField(max_length=160)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        db_table = 'campaigns'
+        verbose_name = 'Campaign'
+        verbose_name_plural = 'Campaigns'
+
+
+class DeliveryManager(models.Manager):
+    """Manager claiming and recording deliveries in bulk"""
+
+    def claim(self, campaign, channel, recipients):
+        """
+        Claim the deliveries still to make to recipients, creating them
+
+        ``recipients`` are (recipient id, address) pairs. Recipients already
+        sent to, being sent to by another run, or whose delivery waits in
+        the retry queue, are left out, which makes a resumed, repeated or
+        concurrent run skip them.
+        """
+        self.bulk_create(
+            [
+                self.model(campaign=campaign, channel=channel, recipient_id=recipient_id, address=address)
+                for recipient_id, address in recipients
+            ],
+            ignore_conflicts=True,
+        )
+        return self._take(
+            Delivery.PENDING,
+            campaign=campaign,
+            channel=channel,
+            recipient_id__in=[recipient_id for recipient_id, _ in recipients],
+        )
+
+    def claim_due(self, campaign, channel, limit):
+        """Claim up to ``limit`` deliveries of a campaign and channel due for a retry"""
+        ids = list(self.filter(
+            campaign=campaign,
+            channel=channel,
+            status=Delivery.RETRY,
+            next_attempt_at__lte=timezone.now(),
+        ).order_by('id').values_list('id', flat=True)[:limit])
+        return self._take(Delivery.RETRY, id__in=ids)
+
+    def _take(self, status, **lookups):
+        """
+        Move the deliveries matching lookups from ``status`` to SENDING and
+        return the ones this call moved
+
+        The conditional UPDATE is atomic, so of two runs taking the same
+        deliveries each delivery goes to one of them only.
+        """
+        claim = uuid.uuid4().hex
+        self.filter(status=status, **lookups).update(
+            status=Delivery.SENDING, claim=claim, updated_at=timezone.now()
+        )
+        return list(self.filter(claim=claim, **lookups).order_by('recipient_id'))
+
+    def release(self, deliveries, error):
+        """Put claimed deliveries that were not attempted on the retry queue"""
+        now = timezone.now()
+        return self.filter(id__in=[delivery.id for delivery in deliveries], status=Delivery.SENDING).update(
+            status=Delivery.RETRY,
+            next_attempt_at=now + timedelta(seconds=settings.DELIVERY_RETRY_DELAY),
+            last_error=str(error)[:1000],
+            updated_at=now,
+        )
+
+    def release_stale(self):
+        """
+        Put the deliveries claimed more than DELIVERY_CLAIM_TIMEOUT seconds
+        ago, by a run that died before recording them, on the retry queue
+        """
+        now = timezone.now()
+        return self.filter(
+            status=Delivery.SENDING,
+            updated_at__lt=now - timedelta(seconds=settings.DELIVERY_CLAIM_TIMEOUT),
+        ).update(
+            status=Delivery.RETRY,
+            next_attempt_at=now,
+            last_error='Claim expired before the delivery was recorded',
+            updated_at=now,
+        )
+
+    def record(self, deliveries, errors):
+        """
+        Store the outcome of delivery attempts: an error, or None when sent
+
+        Failed deliveries go to the retry queue, due after DELIVERY_RETRY_DELAY
+        seconds doubled on every attempt, until DELIVERY_MAX_ATTEMPTS.
+        """
+        now = timezone.now()
+        for delivery, error in zip(deliveries, errors):
+            delivery.attempts += 1
+            delivery.updated_at = now
+            if error is None:
+                delivery.status = Delivery.SENT
+                delivery.sent_at = now
+                delivery.next_attempt_at = None
+                delivery.last_error = ''
+            else:
+                delivery.last_error = str(error)[:1000]
+                if delivery.attempts >= settings.DELIVERY_MAX_ATTEMPTS:
+                    delivery.status = Delivery.FAILED
+                    delivery.next_attempt_at = None
+                else:
+                    delivery.status = Delivery.RETRY
+                    delay = settings.DELIVERY_RETRY_DELAY * 2 ** (delivery.attempts - 1)
+                    delivery.next_attempt_at = now + timedelta(seconds=delay)
+        self.bulk_update(
+            deliveries[:len(errors)],
+            ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at', 'updated_at'],
+        )
+
+
+class Delivery(models.Model):
+    """The delivery of a campaign to one recipient over one channel"""
+    EMAIL = 'email'
+    SMS = 'sms'
+    CHANNEL_CHOICES = [
+        (EMAIL, 'Email'),
+        (SMS, 'SMS'),
+    ]
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    RETRY = 'retry'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Being sent'),
+        (SENT, 'Sent'),
+        (RETRY, 'Waiting for a retry'),
+        (FAILED, 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='deliveries')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    # Id of the EmailRecipient or SMSRecipient, depending on the channel
+    recipient_id = models.PositiveBigIntegerField()
+    address = models.CharField(max_length=254)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Token of the run that last claimed the delivery
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DeliveryManager()
+
+    def __str__(self):
+        return f"{self.campaign_id} {self.channel} {self.address}: {self.status}"
 
-# Create your models here.
+    class Meta:
+        db_table = 'deliveries'
+        verbose_name = 'Delivery'
+        verbose_name_plural = 'Deliveries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['campaign', 'channel', 'recipient_id'], name='deliveries_campaign_channel_recipient_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='deliveries_retry_idx'),
+        ]
@@ -0,0 +1,101 @@
+"""
+Token-bucket rate limits for the outbound email and SMS providers
+
+Every Celery worker sending email or SMS takes a token from the provider's
+bucket before each message, so the relay and gateway see the configured rate
+(RATE_LIMITS) however many workers send at once. The buckets live in Redis,
+by default the Celery broker's (RATE_LIMIT_REDIS_URL).
+
+A bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per
+second, on the clock of the Redis server so workers on different hosts agree.
+Taking tokens is an optimistic transaction (WATCH/MULTI) rather than a Lua
+script, so any client with redis-py's interface works, including an
+in-process fake such as fakeredis.FakeRedis(). A sender short of tokens
+reserves them anyway, driving the bucket into debt, and sleeps until they
+are due: waiting senders queue up behind each other instead of polling, and
+none of them fails.
+
+When Redis can't be reached the limit is not applied, since refused
+deliveries go to the retry queue anyway.
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ratelimit'
+
+_client = None
+
+
+def get_client():
+    """The Redis client the buckets are kept with"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.RATE_LIMIT_REDIS_URL)
+    return _client
+
+
+class TokenBucket:
+    """A token bucket shared through Redis"""
+
+    def __init__(self, name, rate, burst, client=None):
+        if rate <= 0 or burst < 1:
+            raise ValueError("A token bucket needs a positive rate and a burst of at least 1")
+        self.name = name
+        self.rate = float(rate)
+        self.burst = burst
+        self.client = client or get_client()
+        self.key = f'{KEY_PREFIX}:{name}'
+        # A bucket left alone refills completely; its key can go by then
+        self.idle_timeout = int(burst / self.rate) + 60
+
+    def acquire(self, tokens=1):
+        """Take tokens, sleeping until they are available; returns the seconds slept"""
+        try:
+            wait = self._reserve(tokens)
+        except redis.RedisError as e:
+            logger.warning(f"Rate limit {self.name} not applied, Redis unavailable: {str(e)}")
+            return 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _reserve(self, tokens):
+        """Take tokens from the bucket, in debt if need be; returns the seconds until they are due"""
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key)
+                    level, stamp = pipe.hmget(self.key, 'tokens', 'stamp')
+                    seconds, microseconds = pipe.time()
+                    now = seconds + microseconds / 1e6
+                    if level is None:
+                        level = self.burst
+                    else:
+                        elapsed = max(0.0, now - float(stamp))
+                        level = min(self.burst, float(level) + elapsed * self.rate)
+                    level -= tokens
+                    pipe.multi()
+                    pipe.hset(self.key, mapping={'tokens': level, 'stamp': now})
+                    pipe.expire(self.key, self.idle_timeout + int(max(0.0, -level) / self.rate))
+                    pipe.execute()
+                    return max(0.0, -level / self.rate)
+                except redis.WatchError:
+                    # Another sender took tokens meanwhile
+                    continue
+
+
+def get_limiter(provider, client=None):
+    """
+    Return the bucket of a provider ('smtp' or 'sms'), or None without a limit
+
+    Buckets are configured by RATE_LIMITS; a rate of 0 means no limit.
+    """
+    limit = settings.RATE_LIMITS.get(provider, {})
+    if limit.get('rate', 0) <= 0:
+        return None
+    return TokenBucket(provider, limit['rate'], limit.get('burst', 1), client)
@@ -4,7 +4,7 @@ class EmailTaskResponseSerializer(serializers.Serializer):
     """Serializer for email task response"""
     success = serializers.BooleanField()
     message = serializers.CharField(required=False)
-    result = serializers.CharField(required=False)
+    task_id = serializers.CharField(required=False, help_text="Id of the queued Celery task")
     error = serializers.CharField(required=False)
 
 class JokeAPIResponseSerializer(serializers.Serializer):
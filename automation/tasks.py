@@ -1,78 +1,148 @@
-from celery import shared_task
-from django.core.mail import send_mail
+from celery import chord, group, shared_task
 from django.conf import settings
-import requests
+from django.core.cache import cache
+from django.utils import timezone
+from jokes import buffer
+from jokes import variants as joke_variants
+from jokes.sources import format_joke
 from auth_app.models import EmailRecipient, SMSRecipient
-from ciphers.utils import CipherUtils
+from .mailer import BulkMailer, DeliveryInterrupted, batches
+from .models import Campaign, Delivery
+from .ratelimit import get_limiter
+from datetime import timedelta
 import logging
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+EMAIL_SUBJECT = 'Your Daily Joke - Security System'
+
+# Recipient field holding the address, per delivery channel
+DELIVERY_ADDRESS_FIELDS = {Delivery.EMAIL: 'email', Delivery.SMS: 'phone_number'}
+
+# Deliveries claimed and recorded at a time, outside of the email batches
+DELIVERY_BATCH_SIZE = 100
+
+# Most deliveries of a campaign and channel retried per retry_deliveries run
+RETRY_BATCH_LIMIT = 5000
+
+RETRY_LOCK_KEY = 'automation:retry-deliveries'
+RETRY_LOCK_TIMEOUT = 30 * 60
+
+# Recipients read per query while streaming them
+STREAM_PAGE_SIZE = 2000
+
+
+def stream_values(queryset, *fields, page_size=STREAM_PAGE_SIZE):
+    """
+    Yield (id, *fields) tuples of a queryset in id order, a page at a time
+
+    Pages are read by primary key (id > last id of the previous page), so
+    memory stays flat whatever the size of the queryset and on every
+    backend: QuerySet.iterator() only streams from a server-side cursor on
+    PostgreSQL and Oracle, MySQL's client buffers the whole result.
+    """
+    queryset = queryset.order_by('id')
+    last_id = None
+    while True:
+        page = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(page.values_list('id', *fields)[:page_size])
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1][0]
+
+
+def manual_campaign_key():
+    """A new campaign key, for a send triggered by hand rather than by beat"""
+    return f"manual-{timezone.now():%Y-%m-%dT%H:%M:%S}-{uuid.uuid4().hex[:8]}"
+
+
+def get_campaign(key=None):
+    """
+    Return the campaign of the day (or of ``key``), creating it on first use
+
+    The joke is taken and its texts built when the campaign is created, so
+    every channel, chunk and retry of a campaign sends the same joke.
+    """
+    key = key or f"joke-{timezone.localdate().isoformat()}"
+    campaign = Campaign.objects.filter(key=key).first()
+    if campaign is not None:
+        return campaign
+    
+    # Take a prefetched joke from the local buffer
+    joke_data = buffer.get_joke()
+    joke_text = format_joke(joke_data)
+    
+    # Prepare email content with original and encrypted versions,
+    # computed once per joke
+    variants = joke_variants.materialize(joke_data)
+    atbash_text = variants['atbash']
+    caesar_text = variants['caesar']
+    vigenere_text = variants['vigenere']
+    
+    email_content = f"""
+    Daily Joke from Security System!
+    
+    Original Joke:
+    {joke_text}
+    
+    ===== Encrypted Versions =====
+    
+    Atbash Cipher:
+    {atbash_text}
+    
+    Caesar Cipher (shift={settings.JOKE_CAESAR_SHIFT}):
+    {caesar_text}
+    
+    Vigenere Cipher (key={settings.JOKE_VIGENERE_KEY}):
+    {vigenere_text}
+    
+    Category: {joke_data.get('category', 'Unknown')}
+    
+    Have a great day!
+    """
+    
+    campaign, _ = Campaign.objects.get_or_create(key=key, defaults={
+        'subject': EMAIL_SUBJECT,
+        'email_body': email_content,
+        'sms_text': variants['sms'],
+    })
+    return campaign
+
 
 @shared_task
-def send_joke_emails():
+def send_joke_emails(campaign_key=None):
     """
-    Celery task to fetch jokes and send them to email recipients
+    Celery task to fan the email of the day's joke out to the recipients
+
+    The active recipients are split into ranges of EMAIL_CHUNK_SIZE primary
+    keys, each sent by a send_joke_email_chunk task on whichever worker picks
+    it up, and aggregate_joke_emails adds up the results once every chunk is
+    done. Deliveries are recorded per recipient, so running the task again
+    for the same campaign only sends to the recipients not reached yet.
     """
     try:
-        # Fetch a joke from JokeAPI
-        response = requests.get('https://v2.jokeapi.dev/joke/Any?safe-mode')
-        joke_data = response.json()
+        # First id of every chunk of active email recipients, streamed
+        starts = []
+        count = 0
+        for recipient_id, in stream_values(EmailRecipient.objects.filter(is_active=True)):
+            if count % settings.EMAIL_CHUNK_SIZE == 0:
+                starts.append(recipient_id)
+            count += 1
         
-        # Format joke text
-        if joke_data.get('type') == 'single':
-            joke_text = joke_data.get('joke', '')
-        else:
-            setup = joke_data.get('setup', '')
-            delivery = joke_data.get('delivery', '')
-            joke_text = f"{setup}\n\n{delivery}"
-        
-        # Get active email recipients
-        recipients = EmailRecipient.objects.filter(is_active=True)
-        
-        if recipients.exists():
-            # Prepare email content with original and encrypted versions
-            atbash_text = CipherUtils.atbash_cipher(joke_text)
-            caesar_text = CipherUtils.caesar_cipher(joke_text, shift=3)
-            vigenere_text = CipherUtils.vigenere_cipher(joke_text, key="JOKE")
-            
-            email_content = f"""
-            Daily Joke from Security System!
-            
-            Original Joke:
-            {joke_text}
-            
-            ===== Encrypted Versions =====
+        if count:
+            campaign = get_campaign(campaign_key)
             
-            Atbash Cipher:
-            {atbash_text}
+            # One chunk task per id range [start, next start), the last one open ended
+            chunks = group(
+                send_joke_email_chunk.s(campaign.id, start, end)
+                for start, end in zip(starts, starts[1:] + [None])
+            )
+            chord(chunks)(aggregate_joke_emails.s(time.time()))
             
-            Caesar Cipher (shift=3):
-            {caesar_text}
-            
-            Vigenere Cipher (key=JOKE):
-            {vigenere_text}
-            
-            Category: {joke_data.get('category', 'Unknown')}
-            
-            Have a great day!
-            """
-            
-            # Send email to each recipient
-            for recipient in recipients:
-                try:
-                    send_mail(
-                        subject='Your Daily Joke - Security System',
-                        message=email_content,
-                        from_email=settings.EMAIL_HOST_USER,
-                        recipient_list=[recipient.email],
-                        fail_silently=False,
-                    )
-                    logger.info(f"Joke email sent to {recipient.email}")
-                except Exception as e:
-                    logger.error(f"Failed to send email to {recipient.email}: {str(e)}")
-            
-            return f"Jokes sent to {recipients.count()} recipients"
+            return f"Sending the {campaign.key} email to {count} recipients in {len(starts)} chunks"
         else:
             return "No active email recipients found"
             
@@ -82,45 +152,142 @@ def send_joke_emails():
 
 
 @shared_task
-def send_joke_sms():
+def send_joke_email_chunk(campaign_id, start_id, end_id=None):
     """
-    Celery task to send jokes via SMS (simulated or using Twilio)
+    Celery task to send a campaign email to the active recipients with ids
+    in [start_id, end_id), over one SMTP connection
+
+    Recipients already sent to are skipped and failed ones are left to
+    retry_deliveries. If the SMTP server can't be reached, the recipients not
+    reached yet go to the retry queue too, rather than the chunk being run
+    again. Returns the counts of the chunk for aggregate_joke_emails.
     """
+    campaign = Campaign.objects.get(id=campaign_id)
+    recipients = EmailRecipient.objects.filter(is_active=True, id__gte=start_id)
+    if end_id is not None:
+        recipients = recipients.filter(id__lt=end_id)
+    
+    mailer = BulkMailer(campaign.subject, campaign.email_body)
+    skipped = 0
     try:
-        # Fetch a joke from JokeAPI
-        response = requests.get('https://v2.jokeapi.dev/joke/Any?safe-mode')
-        joke_data = response.json()
+        with mailer:
+            for batch in batches(stream_values(recipients, 'email'), mailer.batch_size):
+                deliveries = Delivery.objects.claim(campaign, Delivery.EMAIL, batch)
+                skipped += len(batch) - len(deliveries)
+                try:
+                    errors = mailer.send_batch([delivery.address for delivery in deliveries])
+                except DeliveryInterrupted as e:
+                    Delivery.objects.record(deliveries, e.errors)
+                    Delivery.objects.release(deliveries[len(e.errors):], e)
+                    raise
+                Delivery.objects.record(deliveries, errors)
+    except Exception as e:
+        deferred = _defer_pending(campaign, Delivery.EMAIL, recipients, e)
+        logger.error(f"Email chunk from id {start_id} moved {deferred} recipients to the retry queue: {str(e)}")
+        mailer.failed += deferred
+    
+    return {
+        'sent': mailer.sent,
+        'failed': mailer.failed,
+        'skipped': skipped,
+        'reconnects': mailer.reconnects,
+        'throttled': round(mailer.throttled, 3),
+    }
+
+
+def _defer_pending(campaign, channel, recipients, error):
+    """Move the deliveries of recipients not made yet to the retry queue"""
+    for batch in batches(stream_values(recipients, DELIVERY_ADDRESS_FIELDS[channel]), DELIVERY_BATCH_SIZE):
+        Delivery.objects.bulk_create(
+            [
+                Delivery(campaign=campaign, channel=channel, recipient_id=recipient_id, address=address)
+                for recipient_id, address in batch
+            ],
+            ignore_conflicts=True,
+        )
+    now = timezone.now()
+    pending = Delivery.objects.filter(campaign=campaign, channel=channel, status=Delivery.PENDING)
+    first_id = recipients.order_by('id').values_list('id', flat=True).first()
+    last_id = recipients.order_by('-id').values_list('id', flat=True).first()
+    if first_id is None:
+        return 0
+    return pending.filter(recipient_id__gte=first_id, recipient_id__lte=last_id).update(
+        status=Delivery.RETRY,
+        next_attempt_at=now + timedelta(seconds=settings.DELIVERY_RETRY_DELAY),
+        last_error=str(error)[:1000],
+        updated_at=now,
+    )
+
+
+@shared_task
+def aggregate_joke_emails(results, started):
+    """
+    Celery chord callback adding up the counts of the email chunks
+    """
+    keys = ('sent', 'failed', 'skipped', 'reconnects', 'throttled')
+    totals = {key: sum(result[key] for result in results) for key in keys}
+    elapsed = time.time() - started
+    logger.info(
+        f"Joke emails sent to {totals['sent']} recipients ({totals['failed']} failed, "
+        f"{totals['skipped']} already delivered, {totals['reconnects']} reconnects) in "
+        f"{len(results)} chunks, {elapsed:.1f}s, {totals['sent'] / elapsed:.1f} msgs/sec, "
+        f"{totals['throttled']:.1f}s waiting for the SMTP rate limit"
+    )
+    return (
+        f"Jokes sent to {totals['sent']} recipients ({totals['failed']} failed, "
+        f"{totals['skipped']} already delivered) in {len(results)} chunks"
+    )
+
+
+def _send_sms(phone_number, text, limiter=None):
+    """Send an SMS, within the SMS rate limit; returns the error, or None when sent"""
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        # Simulate SMS sending (replace with actual Twilio integration)
+        logger.info(f"SMS sent to {phone_number}: {text}")
         
-        # Format joke text (shorter for SMS)
-        if joke_data.get('type') == 'single':
-            joke_text = joke_data.get('joke', '')[:160]  # SMS limit
-        else:
-            setup = joke_data.get('setup', '')
-            delivery = joke_data.get('delivery', '')
-            joke_text = f"{setup} {delivery}"[:160]
+        # For actual Twilio integration, uncomment and configure:
+        # from twilio.rest import Client
+        # client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        # message = client.messages.create(
+        #     body=text,
+        #     from_=settings.TWILIO_PHONE_NUMBER,
+        #     to=phone_number
+        # )
         
-        # Get active SMS recipients
-        recipients = SMSRecipient.objects.filter(is_active=True)
+    except Exception as e:
+        logger.error(f"Failed to send SMS to {phone_number}: {str(e)}")
+        return str(e)
+    return None
+
+
+@shared_task
+def send_joke_sms(campaign_key=None):
+    """
+    Celery task to send the day's joke via SMS (simulated or using Twilio)
+
+    Deliveries are recorded per recipient like the emails', so a repeated
+    run skips the recipients already sent to.
+    """
+    try:
+        campaign = None
+        count = 0
+        sent = 0
+        limiter = get_limiter('sms')
         
-        if recipients.exists():
-            for recipient in recipients:
-                try:
-                    # Simulate SMS sending (replace with actual Twilio integration)
-                    logger.info(f"SMS sent to {recipient.phone_number}: {joke_text}")
-                    
-                    # For actual Twilio integration, uncomment and configure:
-                    # from twilio.rest import Client
-                    # client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-                    # message = client.messages.create(
-                    #     body=joke_text,
-                    #     from_=settings.TWILIO_PHONE_NUMBER,
-                    #     to=recipient.phone_number
-                    # )
-                    
-                except Exception as e:
-                    logger.error(f"Failed to send SMS to {recipient.phone_number}: {str(e)}")
-            
-            return f"SMS sent to {recipients.count()} recipients"
+        # Stream the active SMS recipients, counting them on the way
+        recipients = stream_values(SMSRecipient.objects.filter(is_active=True), 'phone_number')
+        for batch in batches(recipients, DELIVERY_BATCH_SIZE):
+            count += len(batch)
+            campaign = campaign or get_campaign(campaign_key)
+            deliveries = Delivery.objects.claim(campaign, Delivery.SMS, batch)
+            errors = [_send_sms(delivery.address, campaign.sms_text, limiter) for delivery in deliveries]
+            Delivery.objects.record(deliveries, errors)
+            sent += errors.count(None)
+        
+        if count:
+            return f"SMS sent to {sent} of {count} recipients"
         else:
             return "No active SMS recipients found"
             
@@ -129,6 +296,62 @@ def send_joke_sms():
         return f"Error: {str(e)}"
 
 
+@shared_task
+def retry_deliveries():
+    """
+    Celery task retrying the failed deliveries that are due
+
+    Runs on its own queue (see CELERY_TASK_ROUTES), one worker at a time.
+    Each attempt that fails again pushes the next one back exponentially,
+    see DeliveryManager.record.
+    """
+    if not cache.add(RETRY_LOCK_KEY, True, RETRY_LOCK_TIMEOUT):
+        return "Deliveries are being retried by another worker"
+    try:
+        stale = Delivery.objects.release_stale()
+        if stale:
+            logger.warning(f"{stale} deliveries claimed by a run that never recorded them are retried")
+        due = Delivery.objects.filter(status=Delivery.RETRY, next_attempt_at__lte=timezone.now())
+        sent = 0
+        failed = 0
+        sms_limiter = get_limiter('sms')
+        for campaign_id, channel in due.order_by().values_list('campaign_id', 'channel').distinct():
+            campaign = Campaign.objects.get(id=campaign_id)
+            # Claimed, so that a run overlapping this one (once the lock
+            # expired) can't send them too
+            deliveries = Delivery.objects.claim_due(campaign, channel, RETRY_BATCH_LIMIT)
+            for batch in batches(deliveries, DELIVERY_BATCH_SIZE):
+                if channel == Delivery.EMAIL:
+                    errors = _retry_emails(campaign, batch)
+                else:
+                    errors = [_send_sms(delivery.address, campaign.sms_text, sms_limiter) for delivery in batch]
+                Delivery.objects.record(batch, errors)
+                sent += errors.count(None)
+                failed += len(errors) - errors.count(None)
+        
+        logger.info(f"Retried deliveries: {sent} sent, {failed} failed again")
+        return f"Retried {sent + failed} deliveries, {sent} sent"
+    except Exception as e:
+        logger.error(f"Error in retry_deliveries task: {str(e)}")
+        return f"Error: {str(e)}"
+    finally:
+        cache.delete(RETRY_LOCK_KEY)
+
+
+def _retry_emails(campaign, deliveries):
+    """Send a campaign email again; a lost connection fails the rest of the batch"""
+    addresses = [delivery.address for delivery in deliveries]
+    errors = []
+    try:
+        with BulkMailer(campaign.subject, campaign.email_body) as mailer:
+            errors = mailer.send_batch(addresses)
+    except DeliveryInterrupted as e:
+        errors = e.errors + [str(e)] * (len(addresses) - len(e.errors))
+    except OSError as e:
+        errors = errors + [str(e)] * (len(addresses) - len(errors))
+    return errors
+
+
 @shared_task
 def cleanup_old_sessions():
     """
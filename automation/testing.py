@@ -0,0 +1,102 @@
+"""
+A local SMTP stand-in for the email tests and benchmarks
+
+SMTPStandIn is a minimal SMTP server on localhost: it greets each connection
+after ``handshake_delay`` seconds, standing for the TCP, STARTTLS and login
+round trips of a real server, accepts every message, and can drop the
+connection every ``drop_after`` messages to exercise reconnects. After
+``down_after`` messages it goes down, closing every connection without a
+reply. It counts the connections, logins and messages it received.
+"""
+import socketserver
+import threading
+import time
+
+from django.test import override_settings
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        if server.is_down():
+            return
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.handshake_delay)
+        self._reply(b'220 localhost SMTP stand-in')
+        received = 0
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self._reply(b'250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME')
+            elif command == b'AUTH':
+                with server.lock:
+                    server.logins += 1
+                self._reply(b'235 Authentication successful')
+            elif command == b'DATA':
+                self._reply(b'354 End data with <CR><LF>.<CR><LF>')
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                with server.lock:
+                    server.messages += 1
+                received += 1
+                self._reply(b'250 OK')
+                if server.is_down() or server.drop_after and received >= server.drop_after:
+                    # Closed between messages, as by a server limiting the
+                    # messages per connection
+                    return
+            elif command == b'QUIT':
+                self._reply(b'221 Bye')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self._reply(b'250 OK')
+
+    def _reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A local SMTP server counting what it receives, served from a thread"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_delay=0.0, drop_after=0, down_after=0):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.handshake_delay = handshake_delay
+        self.drop_after = drop_after
+        self.down_after = down_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def is_down(self):
+        return bool(self.down_after) and self.messages >= self.down_after
+
+    def reset(self):
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+
+    def settings(self):
+        """Settings sending Django's email through the stand-in"""
+        return override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER='bench@localhost',
+            EMAIL_HOST_PASSWORD='bench',
+        )
@@ -1,3 +1,247 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import redis
+from django.core.mail import send_mail
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from auth_app.models import EmailRecipient
+from .mailer import BulkMailer, DeliveryInterrupted
+from .models import Campaign, Delivery
+from .ratelimit import TokenBucket, get_limiter
+from .tasks import retry_deliveries, send_joke_email_chunk
+from .testing import SMTPStandIn
+
+
+class BulkMailerTests(SimpleTestCase):
+    """BulkMailer against a local SMTP stand-in"""
+
+    def send(self, server, addresses, batch_size=10):
+        with server.settings():
+            return BulkMailer('Subject', 'Body', 'from@localhost', batch_size=batch_size, limiter=None).send(addresses)
+
+    def addresses(self, count):
+        return [f'recipient{number}@example.com' for number in range(count)]
+
+    def test_sends_every_message_over_one_connection(self):
+        with SMTPStandIn() as server:
+            stats = self.send(server, self.addresses(25))
+        self.assertEqual(stats['sent'], 25)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['reconnects'], 0)
+        self.assertEqual(server.messages, 25)
+        self.assertEqual(server.connections, 1)
+
+    def test_one_connection_and_login_instead_of_one_per_message(self):
+        # What the bulk mailer replaced: send_mail() for every recipient
+        addresses = self.addresses(20)
+        with SMTPStandIn() as server, server.settings():
+            for address in addresses:
+                send_mail('Subject', 'Body', 'from@localhost', [address])
+            per_message = (server.connections, server.logins)
+            server.reset()
+            self.send(server, addresses)
+            bulk = (server.connections, server.logins)
+        self.assertEqual(per_message, (20, 20))
+        self.assertEqual(bulk, (1, 1))
+        self.assertEqual(server.messages, 20)
+
+    def test_reconnects_once_when_the_server_drops_the_connection(self):
+        with SMTPStandIn(drop_after=10) as server:
+            stats = self.send(server, self.addresses(15))
+        self.assertEqual(stats['sent'], 15)
+        self.assertEqual(stats['reconnects'], 1)
+        self.assertEqual(server.messages, 15)
+        self.assertEqual(server.connections, 2)
+
+    def test_lost_connection_interrupts_the_batch(self):
+        with SMTPStandIn(drop_after=5, down_after=5) as server, server.settings():
+            mailer = BulkMailer('Subject', 'Body', 'from@localhost', limiter=None)
+            with self.assertRaises(DeliveryInterrupted) as raised:
+                with mailer:
+                    mailer.send_batch(self.addresses(8))
+        # The messages sent before the drop are reported, the others aren't
+        self.assertEqual(raised.exception.errors, [None] * 5)
+        self.assertEqual(mailer.sent, 5)
+        self.assertEqual(server.messages, 5)
+
+
+@override_settings(DELIVERY_RETRY_DELAY=60, DELIVERY_MAX_ATTEMPTS=3, DELIVERY_CLAIM_TIMEOUT=3600, EMAIL_BATCH_SIZE=4)
+class DeliveryLedgerTests(TestCase):
+    """The per-recipient delivery ledger and the tasks using it"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(key='test', subject='Subject', email_body='Body', sms_text='Body')
+        EmailRecipient.objects.bulk_create(
+            EmailRecipient(email=f'recipient{number}@example.com', name=f'Recipient {number}')
+            for number in range(10)
+        )
+        self.recipients = list(EmailRecipient.objects.order_by('id').values_list('id', 'email'))
+
+    def claim(self, recipients=None):
+        return Delivery.objects.claim(self.campaign, Delivery.EMAIL, recipients or self.recipients)
+
+    def statuses(self):
+        return list(Delivery.objects.order_by('recipient_id').values_list('status', flat=True))
+
+    def send_chunk(self, server):
+        with server.settings():
+            return send_joke_email_chunk(self.campaign.id, self.recipients[0][0])
+
+    def test_two_claims_on_the_same_rows_have_one_winner(self):
+        first = self.claim()
+        self.assertEqual(len(first), 10)
+        self.assertEqual(self.claim(), [])
+        self.assertEqual({delivery.claim for delivery in first}, {first[0].claim})
+        # Retries too: both runs picked the same due rows, one takes them
+        Delivery.objects.release(first, 'down')
+        Delivery.objects.update(next_attempt_at=timezone.now())
+        ids = list(Delivery.objects.values_list('id', flat=True))
+        self.assertEqual(len(Delivery.objects._take(Delivery.RETRY, id__in=ids)), 10)
+        self.assertEqual(Delivery.objects._take(Delivery.RETRY, id__in=ids), [])
+
+    def test_claims_overlapping_in_part_split_the_rows(self):
+        first = self.claim(self.recipients[:6])
+        second = self.claim(self.recipients[4:])
+        self.assertEqual(len(first) + len(second), 10)
+        self.assertFalse({delivery.id for delivery in first} & {delivery.id for delivery in second})
+
+    def test_rerun_skips_the_recipients_sent_to(self):
+        with SMTPStandIn() as server:
+            self.assertEqual(self.send_chunk(server)['sent'], 10)
+            result = self.send_chunk(server)
+        self.assertEqual((result['sent'], result['skipped']), (0, 10))
+        self.assertEqual(server.messages, 10)
+        self.assertEqual(self.statuses(), [Delivery.SENT] * 10)
+
+    def test_resumed_run_sends_only_to_the_rest(self):
+        # The server goes down after 6 messages: the rest waits for a retry
+        with SMTPStandIn(down_after=6) as server:
+            result = self.send_chunk(server)
+        self.assertEqual(result['sent'], 6)
+        self.assertEqual(self.statuses(), [Delivery.SENT] * 6 + [Delivery.RETRY] * 4)
+        with SMTPStandIn() as server:
+            result = self.send_chunk(server)
+            self.assertEqual((result['sent'], result['skipped']), (0, 10))
+            Delivery.objects.update(next_attempt_at=timezone.now())
+            with server.settings():
+                retry_deliveries()
+        self.assertEqual(server.messages, 4)
+        self.assertEqual(self.statuses(), [Delivery.SENT] * 10)
+
+    def test_failed_deliveries_back_off_then_fail(self):
+        deliveries = self.claim(self.recipients[:1])
+        delays = []
+        for _ in range(3):
+            started = timezone.now()
+            Delivery.objects.record(deliveries, ['refused'])
+            delivery = Delivery.objects.get()
+            if delivery.next_attempt_at is not None:
+                delays.append(round((delivery.next_attempt_at - started).total_seconds()))
+        self.assertEqual(delays, [60, 120])
+        self.assertEqual((delivery.status, delivery.attempts), (Delivery.FAILED, 3))
+        self.assertEqual(delivery.last_error, 'refused')
+
+    def test_retries_wait_for_their_time(self):
+        deliveries = self.claim(self.recipients[:2])
+        Delivery.objects.record(deliveries, ['refused', 'refused'])
+        self.assertEqual(Delivery.objects.claim_due(self.campaign, Delivery.EMAIL, 10), [])
+        Delivery.objects.filter(id=deliveries[0].id).update(next_attempt_at=timezone.now())
+        due = Delivery.objects.claim_due(self.campaign, Delivery.EMAIL, 10)
+        self.assertEqual([delivery.id for delivery in due], [deliveries[0].id])
+
+    def test_retry_task_sends_due_deliveries_until_the_last_attempt(self):
+        deliveries = self.claim(self.recipients[:2])
+        Delivery.objects.record(deliveries, ['refused', 'refused'])
+        with SMTPStandIn() as server, server.settings():
+            # The server refuses messages while down: the attempts run out
+            with mock.patch.object(server, 'is_down', return_value=True):
+                for _ in range(3):
+                    Delivery.objects.filter(status=Delivery.RETRY).update(next_attempt_at=timezone.now())
+                    retry_deliveries()
+            self.assertEqual(self.statuses(), [Delivery.FAILED] * 2)
+            self.assertEqual(Delivery.objects.get(id=deliveries[0].id).attempts, 3)
+            # Failed deliveries are not retried any more
+            retry_deliveries()
+        self.assertEqual(server.messages, 0)
+        self.assertEqual(self.statuses(), [Delivery.FAILED] * 2)
+
+    def test_stale_claims_are_released(self):
+        deliveries = self.claim(self.recipients[:3])
+        Delivery.objects.filter(id=deliveries[0].id).update(updated_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(Delivery.objects.release_stale(), 1)
+        self.assertEqual(self.statuses(), [Delivery.RETRY, Delivery.SENDING, Delivery.SENDING])
+
+
+class TokenBucketTests(SimpleTestCase):
+    """The Redis token bucket, on an in-process fake Redis"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.client = fakeredis.FakeRedis(server=self.server)
+
+    def test_burst_is_free_then_tokens_are_reserved_in_turn(self):
+        bucket = TokenBucket('smtp', rate=10, burst=3, client=self.client)
+        self.assertEqual([bucket._reserve(1) for _ in range(3)], [0.0] * 3)
+        # Each sender short of tokens waits for its own, after the previous one
+        self.assertAlmostEqual(bucket._reserve(1), 0.1, delta=0.02)
+        self.assertAlmostEqual(bucket._reserve(1), 0.2, delta=0.02)
+
+    def test_refills_over_time_up_to_the_burst(self):
+        bucket = TokenBucket('smtp', rate=50, burst=2, client=self.client)
+        bucket._reserve(2)
+        # Long enough for 5 tokens, of which the bucket holds 2
+        time.sleep(0.1)
+        self.assertEqual([bucket._reserve(1) for _ in range(2)], [0.0] * 2)
+        self.assertAlmostEqual(bucket._reserve(1), 0.02, delta=0.01)
+
+    def test_limiters_of_a_provider_share_one_bucket(self):
+        first = TokenBucket('sms', rate=10, burst=2, client=self.client)
+        second = TokenBucket('sms', rate=10, burst=2, client=fakeredis.FakeRedis(server=self.server))
+        self.assertEqual(first._reserve(2), 0.0)
+        self.assertAlmostEqual(second._reserve(1), 0.1, delta=0.02)
+        # Other providers have buckets of their own
+        self.assertEqual(TokenBucket('smtp', rate=10, burst=2, client=self.client)._reserve(1), 0.0)
+
+    def test_retries_when_another_sender_takes_tokens_meanwhile(self):
+        bucket = TokenBucket('smtp', rate=10, burst=3, client=self.client)
+        other = fakeredis.FakeRedis(server=self.server)
+        reads = []
+        pipeline_time = redis.client.Pipeline.time
+
+        def time_then_empty_the_bucket(pipe):
+            # Runs between WATCH and MULTI; the first time, another client
+            # empties the bucket, so the transaction fails with WatchError
+            now = pipeline_time(pipe)
+            if not reads:
+                seconds, microseconds = now
+                other.hset(bucket.key, mapping={'tokens': 0, 'stamp': seconds + microseconds / 1e6})
+            reads.append(now)
+            return now
+
+        with mock.patch.object(redis.client.Pipeline, 'time', time_then_empty_the_bucket):
+            wait = bucket._reserve(1)
+        self.assertEqual(len(reads), 2)
+        self.assertAlmostEqual(wait, 0.1, delta=0.02)
+
+    def test_acquire_sleeps_until_the_tokens_are_due(self):
+        bucket = TokenBucket('smtp', rate=20, burst=1, client=self.client)
+        started = time.monotonic()
+        waits = [bucket.acquire() for _ in range(3)]
+        self.assertEqual(waits[0], 0.0)
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_limit_is_not_applied_without_redis(self):
+        client = mock.Mock()
+        client.pipeline.side_effect = redis.ConnectionError('unreachable')
+        self.assertEqual(TokenBucket('smtp', rate=1, burst=1, client=client).acquire(), 0.0)
+
+    def test_no_limiter_without_a_rate(self):
+        limits = {'smtp': {'rate': 0, 'burst': 10}, 'sms': {'rate': 5, 'burst': 2}}
+        with self.settings(RATE_LIMITS=limits):
+            self.assertIsNone(get_limiter('smtp', client=self.client))
+            limiter = get_limiter('sms', client=self.client)
+        self.assertEqual((limiter.rate, limiter.burst), (5.0, 2))
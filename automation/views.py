@@ -3,9 +3,10 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from auth_app.models import EmailRecipient, SMSRecipient
-from .tasks import send_joke_emails, send_joke_sms
+from .tasks import manual_campaign_key, send_joke_emails, send_joke_sms
 import json
-import requests
+from jokes import buffer
+from jokes.sources import format_joke
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.decorators import api_view
@@ -86,9 +87,9 @@ def delete_recipient(request, recipient_type, recipient_id):
 
 @swagger_auto_schema(
     method='get',
-    operation_description="Manually trigger email sending task",
+    operation_description="Manually queue the email sending task; the Celery workers send the emails",
     responses={
-        200: EmailTaskResponseSerializer,
+        202: EmailTaskResponseSerializer,
         400: "Bad Request",
         500: "Internal Server Error"
     },
@@ -99,13 +100,15 @@ def delete_recipient(request, recipient_type, recipient_id):
 def trigger_email_task(request):
     """Manually trigger email sending task"""
     try:
-        # Run the task synchronously instead of asynchronously
-        result = send_joke_emails()
+        # Queued as a campaign of its own, since the day's campaign may have
+        # been sent already; the task fans the emails out to the workers as
+        # a chord, so nothing is sent by the time this returns
+        task = send_joke_emails.delay(manual_campaign_key())
         return JsonResponse({
             'success': True,
-            'message': 'Email task triggered successfully!',
-            'result': result
-        })
+            'message': 'Email task queued, the Celery workers are sending the emails',
+            'task_id': task.id
+        }, status=202)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -117,7 +120,7 @@ def trigger_email_task(request):
 
 @swagger_auto_schema(
     method='get',
-    operation_description="Manually fetch a joke from the JokeAPI",
+    operation_description="Get a joke from the local buffer of jokes prefetched from JokeAPI",
     responses={
         200: JokeAPIResponseSerializer,
         400: "Bad Request",
@@ -128,19 +131,11 @@ def trigger_email_task(request):
 @api_view(['GET'])
 # Temporarily removed login_required for testing
 def trigger_joke_api(request):
-    """Manually fetch a joke from the API and return it"""
+    """Return a joke from the prefetch buffer"""
     try:
-        # Fetch a joke from JokeAPI
-        response = requests.get('https://v2.jokeapi.dev/joke/Any?safe-mode')
-        joke_data = response.json()
-        
-        # Format joke text
-        if joke_data.get('type') == 'single':
-            joke_text = joke_data.get('joke', '')
-        else:
-            setup = joke_data.get('setup', '')
-            delivery = joke_data.get('delivery', '')
-            joke_text = f"{setup}\n\n{delivery}"
+        # Take a prefetched joke from the local buffer
+        joke_data = buffer.get_joke()
+        joke_text = format_joke(joke_data)
         
         return JsonResponse({
             'success': True,
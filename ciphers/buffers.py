@@ -0,0 +1,167 @@
+"""
+Cipher functions over buffers (bytes, bytearray, memoryview, mmap, ...)
+
+These work on ASCII bytes without ever decoding to str: ASCII letters are
+enciphered and every other byte is left as it is. The result is written in
+place or into a caller-supplied buffer of the same length, so mmap regions
+and socket buffers can be processed without a second copy of the data.
+
+Any registered cipher with an affine() description is supported (Atbash,
+Caesar, ROT13, Vigenere).
+"""
+import functools
+import re
+import string
+
+from . import kernels
+from .registry import get_cipher
+
+# Buffers are processed in blocks of this size to bound temporary memory
+BLOCK_SIZE = 1024 * 1024
+
+ASCII_LETTERS = string.ascii_letters.encode('ascii')
+
+_NON_LETTER_RUN = re.compile(rb'([^A-Za-z]+)')
+
+if kernels.available:
+    _LETTER_MASK = kernels.np.zeros(256, dtype=bool)
+    _LETTER_MASK[list(ASCII_LETTERS)] = True
+
+
+def _byte_table(sign, offset):
+    """256-byte table mapping letter index x to sign * x + offset (mod 26)"""
+    # Same order as string.ascii_letters: lowercase first
+    mapped = bytes(
+        base + (sign * index + offset) % 26
+        for base in (ord('a'), ord('A'))
+        for index in range(26)
+    )
+    return bytes.maketrans(ASCII_LETTERS, mapped)
+
+
+def count_letters(buffer):
+    """Return how many ASCII letters a buffer holds"""
+    view = memoryview(buffer).cast('B')
+    count = 0
+    for start in range(0, len(view), BLOCK_SIZE):
+        block = view[start:start + BLOCK_SIZE]
+        if kernels.available:
+            codes = kernels.np.frombuffer(block, dtype=kernels.np.uint8)
+            count += int(kernels.np.count_nonzero(_LETTER_MASK[codes]))
+        else:
+            block = block.tobytes()
+            count += len(block) - len(block.translate(None, ASCII_LETTERS))
+    return count
+
+
+class BufferCipher:
+    """
+    A compiled cipher applied to byte buffers
+
+    Built from a cipher's affine() description: one 256-byte translation
+    table per key position.
+    """
+    __slots__ = ('tables', 'lookup')
+
+    def __init__(self, cipher):
+        description = cipher.affine()
+        if description is None:
+            raise ValueError(f"Cipher type {cipher.name} can't be applied to buffers")
+        sign, offsets = description
+        self.tables = tuple(_byte_table(sign, offset) for offset in offsets)
+        # Lookup table for the NumPy path: one row per key position
+        self.lookup = None
+        if kernels.available:
+            np = kernels.np
+            self.lookup = np.stack([np.frombuffer(table, dtype=np.uint8) for table in self.tables])
+
+    def into(self, src, out=None, position=0):
+        """
+        Encipher ``src`` into ``out`` (by default ``src`` itself, in place)
+
+        ``position`` is the number of letters that came before ``src`` in
+        the same text; it only matters for Vigenere. Returns the number of
+        letters in ``src``, so consecutive calls can carry the position on.
+        """
+        src = memoryview(src).cast('B')
+        out = src if out is None else memoryview(out).cast('B')
+        if out.readonly:
+            raise TypeError("Output buffer is read-only; pass a writable out buffer")
+        if len(out) < len(src):
+            raise ValueError("Output buffer is smaller than the input")
+
+        letters = 0
+        for start in range(0, len(src), BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, len(src))
+            if self.lookup is not None:
+                letters += self._block_numpy(src[start:end], out[start:end], position + letters)
+            else:
+                letters += self._block_python(src[start:end], out[start:end], position + letters)
+        return letters
+
+    def _block_numpy(self, src, out, position):
+        np = kernels.np
+        codes = np.frombuffer(src, dtype=np.uint8)
+        result = np.frombuffer(out, dtype=np.uint8)
+        mask = _LETTER_MASK[codes]
+        if len(self.tables) == 1:
+            # Translating byte by byte, so src and out may be the same memory
+            np.take(self.lookup[0], codes, out=result, mode='wrap')
+            return int(np.count_nonzero(mask))
+        key_index = np.cumsum(mask, dtype=np.int64)
+        letters = int(key_index[-1]) if len(key_index) else 0
+        key_index += position - 1
+        key_index %= len(self.tables)
+        result[...] = self.lookup[key_index, codes]
+        return letters
+
+    def _block_python(self, src, out, position):
+        data = src.tobytes()
+        period = len(self.tables)
+        if period == 1:
+            out[:] = data.translate(self.tables[0])
+            return len(data) - len(data.translate(None, ASCII_LETTERS))
+
+        parts = _NON_LETTER_RUN.split(data)
+        letters = b''.join(parts[::2])
+        shifted = bytearray(letters)
+        for stripe in range(min(period, len(letters))):
+            table = self.tables[(position + stripe) % period]
+            shifted[stripe::period] = letters[stripe::period].translate(table)
+
+        # Put the shifted letters back between the untouched runs
+        offset = 0
+        for index in range(0, len(parts), 2):
+            length = len(parts[index])
+            parts[index] = shifted[offset:offset + length]
+            offset += length
+        out[:] = b''.join(parts)
+        return len(letters)
+
+
+@functools.lru_cache(maxsize=64)
+def _buffer_cipher(cipher):
+    return BufferCipher(cipher)
+
+
+def get_buffer_cipher(cipher_type='caesar', mode='encrypt', **params):
+    """Return the (cached) BufferCipher for a type, mode and parameters"""
+    return _buffer_cipher(get_cipher(cipher_type, mode, **params))
+
+
+def encrypt_into(src, out=None, cipher_type='caesar', position=0, **params):
+    """
+    Encrypt the ASCII letters of a buffer, in place or into ``out``
+
+    Returns the number of letters processed (see BufferCipher.into).
+    """
+    return get_buffer_cipher(cipher_type, 'encrypt', **params).into(src, out, position)
+
+
+def decrypt_into(src, out=None, cipher_type='caesar', position=0, **params):
+    """
+    Decrypt the ASCII letters of a buffer, in place or into ``out``
+
+    Returns the number of letters processed (see BufferCipher.into).
+    """
+    return get_buffer_cipher(cipher_type, 'decrypt', **params).into(src, out, position)
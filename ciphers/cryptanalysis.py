@@ -0,0 +1,222 @@
+"""
+Cryptanalysis for the classical ciphers in CipherUtils
+
+Caesar is cracked by scoring all 26 shifts against English letter
+frequencies with the chi-squared statistic. For Vigenere the key length is
+estimated with the index of coincidence and Kasiski examination, then every
+key-length stripe is solved as a Caesar cipher.
+
+All statistics work on letter counts, so the cost is one counting pass over
+the text; scoring the 26 shifts is a 26x26 operation regardless of size.
+"""
+from collections import Counter
+
+from . import kernels
+from .utils import CipherUtils
+
+# Relative frequencies of A-Z in English text
+ENGLISH_FREQUENCIES = (
+    0.08167, 0.01492, 0.02782, 0.04253, 0.12702, 0.02228, 0.02015,
+    0.06094, 0.06966, 0.00153, 0.00772, 0.04025, 0.02406, 0.06749,
+    0.07507, 0.01929, 0.00095, 0.05987, 0.06327, 0.09056, 0.02758,
+    0.00978, 0.02360, 0.00150, 0.01974, 0.00074,
+)
+
+# Statistics are gathered from at most this many letters; more doesn't
+# change the result, it only costs time
+MAX_SAMPLE_LETTERS = 200_000
+
+# Kasiski examination only looks at the start of the text
+KASISKI_SAMPLE_LETTERS = 10_000
+
+# Key lengths leaving fewer letters than this per stripe aren't considered;
+# the statistics of shorter stripes are mostly noise
+MIN_STRIPE_LETTERS = 12
+
+# A divisor of a key length is preferred when it scores at least this
+# fraction of the longer length's score
+DIVISOR_TOLERANCE = 0.9
+
+# Length of the decrypted preview returned with each candidate
+PREVIEW_LENGTH = 200
+
+_NON_LETTERS = bytes(b for b in range(256) if not chr(b).isascii() or not chr(b).isalpha())
+
+
+def extract_letters(text, limit=MAX_SAMPLE_LETTERS):
+    """Return the ASCII letters of a text, upper-cased, as bytes"""
+    letters = text.encode('ascii', 'ignore').translate(None, _NON_LETTERS).upper()
+    return letters[:limit]
+
+
+def letter_counts(letters):
+    """Count A-Z in an upper-case letters-only bytes string"""
+    if kernels.available:
+        codes = kernels.np.frombuffer(letters, dtype=kernels.np.uint8)
+        return [int(count) for count in kernels.np.bincount(codes - ord('A'), minlength=26)]
+    return [letters.count(code) for code in range(ord('A'), ord('Z') + 1)]
+
+
+def chi_squared_scores(counts):
+    """
+    Score every Caesar shift for a vector of letter counts
+
+    Returns a list of 26 chi-squared values; index ``s`` is the score of the
+    text decrypted with shift ``s``. Lower is closer to English.
+    """
+    total = sum(counts)
+    if not total:
+        return [0.0] * 26
+    if kernels.available:
+        np = kernels.np
+        observed = np.asarray(counts, dtype=np.float64)
+        expected = np.asarray(ENGLISH_FREQUENCIES) * total
+        # Row s holds the counts as they would be after decrypting with shift s
+        index = (np.arange(26)[None, :] + np.arange(26)[:, None]) % 26
+        return (((observed[index] - expected) ** 2) / expected).sum(axis=1).tolist()
+    scores = []
+    for shift in range(26):
+        score = 0.0
+        for letter, frequency in enumerate(ENGLISH_FREQUENCIES):
+            expected = frequency * total
+            score += (counts[(letter + shift) % 26] - expected) ** 2 / expected
+        scores.append(score)
+    return scores
+
+
+def index_of_coincidence(counts):
+    """Probability that two letters drawn at random are the same"""
+    total = sum(counts)
+    if total < 2:
+        return 0.0
+    return sum(count * (count - 1) for count in counts) / (total * (total - 1))
+
+
+def kasiski_factors(letters, max_key_length):
+    """
+    Kasiski examination
+
+    Returns, for each key length 2..max_key_length, the share of distances
+    between repeated trigrams that it divides.
+    """
+    letters = letters[:KASISKI_SAMPLE_LETTERS]
+    last_seen = {}
+    distances = []
+    for position in range(len(letters) - 2):
+        trigram = letters[position:position + 3]
+        if trigram in last_seen:
+            distances.append(position - last_seen[trigram])
+        last_seen[trigram] = position
+
+    if not distances:
+        return {}
+    factors = Counter()
+    for distance in distances:
+        for length in range(2, max_key_length + 1):
+            if distance % length == 0:
+                factors[length] += 1
+    return {length: count / len(distances) for length, count in factors.items()}
+
+
+def _shortest_period(key):
+    """Reduce a key like 'ABCABC' to 'ABC'"""
+    for length in range(1, len(key)):
+        if len(key) % length == 0 and key[:length] * (len(key) // length) == key:
+            return key[:length]
+    return key
+
+
+def crack_caesar(text, top=5):
+    """
+    Rank the 26 possible Caesar shifts of a ciphertext
+
+    Returns a list of candidates sorted from most to least likely, each a
+    dict with the shift, its chi-squared score and a decrypted preview.
+    """
+    scores = chi_squared_scores(letter_counts(extract_letters(text)))
+    ranked = sorted(range(26), key=scores.__getitem__)[:top]
+    return [
+        {
+            'shift': shift,
+            'score': round(scores[shift], 3),
+            'preview': CipherUtils.caesar_cipher(text[:PREVIEW_LENGTH], shift, 'decrypt'),
+        }
+        for shift in ranked
+    ]
+
+
+def estimate_key_lengths(letters, max_key_length=20):
+    """
+    Rank possible Vigenere key lengths
+
+    Each length is scored by the mean index of coincidence of its stripes,
+    weighted by how often Kasiski examination points at it. Multiples of
+    the real key length score about as well as the length itself, so a
+    length is replaced by its smallest divisor that scores nearly as well.
+    """
+    max_key_length = max(1, min(max_key_length, len(letters) // MIN_STRIPE_LETTERS))
+    kasiski = kasiski_factors(letters, max_key_length)
+    scores = {}
+    for length in range(1, max_key_length + 1):
+        stripes = [letters[offset::length] for offset in range(length)]
+        ioc = sum(index_of_coincidence(letter_counts(stripe)) for stripe in stripes) / length
+        scores[length] = ioc * (1 + kasiski.get(length, 0))
+
+    ranked = []
+    for length in sorted(scores, key=scores.__getitem__, reverse=True):
+        length = next(
+            divisor for divisor in range(1, length + 1)
+            if length % divisor == 0 and scores[divisor] >= DIVISOR_TOLERANCE * scores[length]
+        )
+        if length not in ranked:
+            ranked.append(length)
+    return ranked
+
+
+def crack_vigenere(text, max_key_length=20, top=5):
+    """
+    Find the most likely Vigenere keys for a ciphertext
+
+    Returns a list of candidates sorted from most to least likely, each a
+    dict with the key, its chi-squared score and a decrypted preview.
+    """
+    letters = extract_letters(text)
+    if not letters:
+        return []
+
+    candidates = {}
+    for length in estimate_key_lengths(letters, max_key_length)[:top * 2]:
+        shifts = []
+        combined = [0] * 26
+        for offset in range(length):
+            counts = letter_counts(letters[offset::length])
+            scores = chi_squared_scores(counts)
+            shift = min(range(26), key=scores.__getitem__)
+            shifts.append(shift)
+            # Add the stripe's counts as they are after decryption
+            for letter in range(26):
+                combined[letter] += counts[(letter + shift) % 26]
+
+        key = _shortest_period(''.join(chr(ord('A') + shift) for shift in shifts))
+        if key not in candidates:
+            candidates[key] = chi_squared_scores(combined)[0]
+
+    ranked = sorted(candidates, key=candidates.__getitem__)[:top]
+    return [
+        {
+            'key': key,
+            'score': round(candidates[key], 3),
+            'preview': CipherUtils.vigenere_cipher(text[:PREVIEW_LENGTH], key, 'decrypt'),
+        }
+        for key in ranked
+    ]
+
+
+def crack(text, cipher_type, max_key_length=20, top=5):
+    """Crack a Caesar or Vigenere ciphertext, returning ranked candidates"""
+    if cipher_type == 'caesar':
+        return crack_caesar(text, top)
+    elif cipher_type == 'vigenere':
+        return crack_vigenere(text, max_key_length, top)
+    else:
+        raise ValueError(f"Cannot crack cipher type: {cipher_type}")
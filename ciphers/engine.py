@@ -0,0 +1,230 @@
+"""
+Table-driven cipher engine used by CipherUtils
+
+All translation tables are built once per process at import time, so
+enciphering a text is a handful of C-level ``str.translate`` calls instead
+of a Python loop over every character.
+"""
+import re
+import string
+
+from . import kernels
+
+# Texts at least this long go through the NumPy kernels when NumPy is
+# installed. Overridden by the CIPHER_NUMPY_THRESHOLD setting.
+DEFAULT_NUMPY_THRESHOLD = 64 * 1024
+
+# Characters the original per-character implementation treated as letters,
+# i.e. everything whose upper() is found in string.ascii_uppercase. Besides
+# ASCII this is dotless i, long s and the two "st" ligatures.
+EXTRA_LETTERS = 'ıſﬅﬆ'
+LETTERS = string.ascii_letters + EXTRA_LETTERS
+
+# Splits a text into alternating letter runs and non-letter runs
+_NON_LETTER_RUN = re.compile('([^%s]+)' % re.escape(LETTERS))
+
+
+def _shift_char(char, shift):
+    """Shift a single letter, preserving the original case handling"""
+    ascii_offset = ord('A') if char.isupper() else ord('a')
+    return chr((ord(char) - ascii_offset + shift) % 26 + ascii_offset)
+
+
+def _build_atbash_table():
+    """Build the A->Z, B->Y, ... translation table"""
+    table = {}
+    # The "st" ligatures upper-case to two characters and have no single
+    # mirrored letter, so they are left untouched.
+    for char in string.ascii_letters + 'ıſ':
+        new_char = chr(ord('Z') - (ord(char.upper()) - ord('A')))
+        table[ord(char)] = new_char.lower() if char.islower() else new_char
+    return table
+
+
+def _build_caesar_tables():
+    """Build one translation table per shift 0-25"""
+    return tuple(
+        {ord(char): _shift_char(char, shift) for char in LETTERS}
+        for shift in range(26)
+    )
+
+
+def _build_reflected_tables():
+    """
+    Build one table per offset o mapping letter index x to (o - x) mod 26
+
+    That is Atbash followed by a Caesar shift of o - 25, in one lookup. Only
+    ASCII letters are covered; see substitute().
+    """
+    return tuple(
+        {
+            ord(base) + index: chr(ord(base) + (offset - index) % 26)
+            for base in 'Aa'
+            for index in range(26)
+        }
+        for offset in range(26)
+    )
+
+
+ATBASH_TABLE = _build_atbash_table()
+CAESAR_TABLES = _build_caesar_tables()
+REFLECTED_TABLES = _build_reflected_tables()
+
+
+def numpy_threshold():
+    """Return the input size from which the NumPy kernels are used"""
+    from django.conf import settings
+
+    if not settings.configured:
+        return DEFAULT_NUMPY_THRESHOLD
+    return getattr(settings, 'CIPHER_NUMPY_THRESHOLD', DEFAULT_NUMPY_THRESHOLD)
+
+
+def _use_kernels(text, ascii_translate=False):
+    """
+    Whether a text is large enough to be worth vectorizing
+
+    ``ascii_translate`` marks plain table lookups: CPython translates pure
+    ASCII strings faster than the round trip through an array, so those
+    stay on str.translate.
+    """
+    if ascii_translate and text.isascii():
+        return False
+    return kernels.available and len(text) >= numpy_threshold()
+
+
+def normalize_shift(shift, mode='encrypt'):
+    """Reduce a Caesar shift to the equivalent encrypting shift in 0-25"""
+    # bool is an int subclass, but True isn't a shift of 1
+    if not isinstance(shift, int) or isinstance(shift, bool):
+        raise TypeError(f"Shift must be an integer, not {type(shift).__name__}")
+    if mode == 'decrypt':
+        shift = -shift
+    return shift % 26
+
+
+def caesar_table(shift, mode='encrypt'):
+    """Return the translation table for a Caesar shift"""
+    return CAESAR_TABLES[normalize_shift(shift, mode)]
+
+
+def key_shifts(key, mode='encrypt'):
+    """
+    Turn a Vigenere key into a tuple of shifts (0-25)
+
+    The key is cleaned the same way as before: upper-cased and stripped of
+    anything that is not alphabetic. Returns an empty tuple if nothing is left.
+    """
+    key = ''.join(filter(str.isalpha, key.upper()))
+    sign = -1 if mode == 'decrypt' else 1
+    return tuple((sign * (ord(char) - ord('A'))) % 26 for char in key)
+
+
+def has_extra_letters(text):
+    """Whether a text contains any of the non-ASCII letters"""
+    return any(char in text for char in EXTRA_LETTERS)
+
+
+def count_letters(text):
+    """Return how many characters of a text advance the Vigenere key"""
+    return len(_NON_LETTER_RUN.sub('', text))
+
+
+def atbash(text):
+    """Apply the Atbash cipher"""
+    if _use_kernels(text, ascii_translate=True):
+        return kernels.atbash(text)
+    return text.translate(ATBASH_TABLE)
+
+
+def caesar(text, shift=3, mode='encrypt'):
+    """Apply the Caesar cipher"""
+    shift = normalize_shift(shift, mode)
+    if _use_kernels(text, ascii_translate=True):
+        return kernels.caesar(text, shift)
+    return text.translate(CAESAR_TABLES[shift])
+
+
+def vigenere(text, shifts):
+    """
+    Apply a Vigenere key schedule (as returned by key_shifts)
+
+    Letters are gathered into one string and split into key-length stripes;
+    every stripe is a plain Caesar shift, so each one is a single translate.
+    Non-letters do not advance the key and are spliced back afterwards.
+    """
+    if not shifts:
+        return text
+    if _use_kernels(text):
+        return kernels.vigenere(text, shifts)
+    return _striped(text, [CAESAR_TABLES[shift] for shift in shifts])
+
+
+def substitute(text, offsets, reflect=False):
+    """
+    Map every letter index x (0-25) to (x + o) mod 26, or (o - x) mod 26
+    when ``reflect`` is set, where o is offsets[i] and i the position of
+    the letter modulo len(offsets)
+
+    Every chain of Atbash, Caesar and Vigenere layers reduces to this one
+    operation. Without ``reflect`` it is exactly vigenere(); with it, only
+    ASCII letters are handled, so texts for which has_extra_letters() is
+    true must be processed layer by layer instead.
+    """
+    if not reflect:
+        return vigenere(text, offsets)
+    if len(offsets) == 1:
+        return text.translate(REFLECTED_TABLES[offsets[0]])
+    if _use_kernels(text):
+        return kernels.vigenere(text, offsets, reflect=True)
+    return _striped(text, [REFLECTED_TABLES[offset] for offset in offsets])
+
+
+def _striped(text, tables):
+    """Translate the n-th letter of a text with tables[n % len(tables)]"""
+    parts = _NON_LETTER_RUN.split(text)
+    letters = ''.join(parts[::2]) if len(parts) > 1 else text
+    if not letters:
+        return text
+
+    period = len(tables)
+    if period == 1:
+        shifted = letters.translate(tables[0])
+    else:
+        chars = list(letters)
+        for offset, table in enumerate(tables[:len(letters)]):
+            chars[offset::period] = letters[offset::period].translate(table)
+        shifted = ''.join(chars)
+
+    if len(parts) == 1:
+        return shifted
+
+    # Put the shifted letters back between the untouched non-letter runs
+    position = 0
+    for index in range(0, len(parts), 2):
+        length = len(parts[index])
+        parts[index] = shifted[position:position + length]
+        position += length
+    return ''.join(parts)
+
+
+class VigenereStream:
+    """
+    Vigenere cipher applied to a text that arrives in pieces
+
+    Each call enciphers the next piece and remembers how far the key has
+    advanced, so the output matches enciphering the whole text at once.
+    """
+
+    def __init__(self, shifts, position=0):
+        self.shifts = tuple(shifts)
+        # Number of letters already enciphered before the next chunk
+        self.position = position
+
+    def __call__(self, chunk):
+        if not self.shifts:
+            return chunk
+        offset = self.position % len(self.shifts)
+        result = vigenere(chunk, self.shifts[offset:] + self.shifts[:offset])
+        self.position += count_letters(chunk)
+        return result
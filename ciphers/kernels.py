@@ -0,0 +1,102 @@
+"""
+NumPy kernels for enciphering large texts
+
+The text is viewed as an array of code points (uint8 for ASCII, uint32
+otherwise) and every cipher becomes a few whole-array operations. NumPy is
+optional: when it is not installed ``available`` is False and ciphers.engine
+keeps using its translation tables.
+"""
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+available = np is not None
+
+# Non-ASCII characters the original implementation treated as (lowercase)
+# letters: dotless i, long s and the two "st" ligatures.
+DOTLESS_I = 0x131
+LONG_S = 0x17F
+LIGATURES = (0xFB05, 0xFB06)
+
+
+def _to_array(text):
+    """View a string as an array of code points"""
+    if text.isascii():
+        return np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+
+
+def _to_text(codes):
+    """Turn an array produced by _to_array back into a string"""
+    if codes.dtype == np.uint8:
+        return codes.tobytes().decode('ascii')
+    return codes.tobytes().decode('utf-32-le', 'surrogatepass')
+
+
+def _letter_masks(codes):
+    """Return (uppercase mask, lowercase mask) for the letters that get shifted"""
+    upper = (codes >= ord('A')) & (codes <= ord('Z'))
+    lower = (codes >= ord('a')) & (codes <= ord('z'))
+    if codes.dtype != np.uint8:
+        lower |= np.isin(codes, (DOTLESS_I, LONG_S) + LIGATURES)
+    return upper, lower
+
+
+def _shift(codes, upper, lower, shifts, reflect=False):
+    """
+    Shift every letter by ``shifts`` (a scalar or an array aligned with codes)
+
+    With ``reflect`` the letter index x becomes (shift - x) instead.
+    """
+    # A signed working type wide enough that subtracting the case offset
+    # can't wrap around
+    work = np.int16 if codes.dtype == np.uint8 else np.int32
+    values = codes.astype(work)
+    offset = np.where(upper, work(ord('A')), work(ord('a')))
+    shifted = values - offset
+    if reflect:
+        np.negative(shifted, out=shifted)
+    shifted += shifts
+    shifted %= 26
+    shifted += offset
+    np.copyto(shifted, values, where=~(upper | lower))
+    return shifted.astype(codes.dtype)
+
+
+def atbash(text):
+    """Vectorized Atbash cipher"""
+    codes = _to_array(text)
+    upper = (codes >= ord('A')) & (codes <= ord('Z'))
+    lower = (codes >= ord('a')) & (codes <= ord('z'))
+    result = np.where(upper, ord('A') + ord('Z') - codes, codes)
+    result = np.where(lower, ord('a') + ord('z') - codes, result)
+    if codes.dtype != np.uint8:
+        result[codes == DOTLESS_I] = ord('r')
+        result[codes == LONG_S] = ord('h')
+    return _to_text(result)
+
+
+def caesar(text, shift):
+    """Vectorized Caesar cipher; ``shift`` is already normalised to 0-25"""
+    codes = _to_array(text)
+    upper, lower = _letter_masks(codes)
+    return _to_text(_shift(codes, upper, lower, shift))
+
+
+def vigenere(text, shifts, reflect=False):
+    """
+    Vectorized Vigenere cipher for a key schedule from engine.key_shifts
+
+    The key position of every letter is a running count of the letters before
+    it, so non-letters don't advance the key. ``reflect`` is passed on to
+    _shift() for engine.substitute().
+    """
+    codes = _to_array(text)
+    upper, lower = _letter_masks(codes)
+    letters = upper | lower
+    key_index = np.cumsum(letters, dtype=np.int64)
+    key_index -= 1
+    key_index %= len(shifts)
+    schedule = np.asarray(shifts, dtype=np.uint8)[key_index]
+    return _to_text(_shift(codes, upper, lower, schedule, reflect))
@@ -0,0 +1,305 @@
+"""
+Benchmark the cipher engine and the /ciphers/process/ endpoint
+
+Every CipherUtils function is timed on generated texts from 16 bytes up to
+100 MB, for three kinds of text (plain ASCII prose, prose mixed with
+non-ASCII characters, and mostly non-letter "sparse" text) and for short and
+long Vigenere keys. The endpoint is timed end to end through the Django test
+client for the sizes a request body can have.
+
+Outputs are checked against ciphers.reference, the original per-character
+implementation, so an optimisation that changes a single character fails the
+run. Results are written as JSON; pass a previous file with --compare to see
+the speed-up of every case.
+
+Texts are generated from a fixed seed, so runs on the same machine are
+comparable.
+"""
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+
+from ciphers import kernels
+from ciphers.reference import ReferenceCipherUtils
+from ciphers.registry import cache_info
+from ciphers.utils import CipherUtils
+
+DEFAULT_SIZES = [16, 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 100 * 1024 * 1024]
+
+TEXT_KINDS = ('ascii', 'unicode', 'sparse')
+
+SHORT_KEY = 'KEY'
+LONG_KEY = 'SECURITYSYSTEMBENCHMARKKEYWITHAFAIRLYLONGPERIODTOSTRESSVIGENERE'
+
+# Pipeline used for process_pipeline: fused into a single pass by the engine
+PIPELINE_STEPS = [
+    {'cipher_type': 'caesar', 'mode': 'encrypt', 'shift': 5},
+    {'cipher_type': 'vigenere', 'mode': 'encrypt', 'key': SHORT_KEY},
+    {'cipher_type': 'atbash', 'mode': 'encrypt'},
+]
+
+# Generated texts repeat a block of this many characters
+BLOCK_CHARS = 64 * 1024
+
+_ASCII_WORDS = (
+    'the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog', 'Security',
+    'System', 'cipher', 'Message', 'attack', 'at', 'dawn', 'and', 'of', 'to',
+    'in', 'is', 'it', 'Joke', 'email', 'SMS', 'Vigenere', 'Caesar', 'Atbash',
+)
+_UNICODE_WORDS = _ASCII_WORDS + (
+    'café', 'naïve', 'Straße', 'façade', 'smörgåsbord', 'jalapeño', 'Ελλάδα',
+    'Москва', '東京', 'ıstanbul', 'ſeſſion', '—', '…', '«quote»', '¿qué?',
+)
+_PUNCTUATION = (' ', ' ', ' ', ' ', ', ', '. ', '! ', '? ', '\n')
+_SPARSE_CHARS = '0123456789 .,;:-+=/()[]{}#@$%&*\n\t'
+
+
+def generate_text(kind, size, seed=0):
+    """Return ``size`` characters of text of the given kind"""
+    rng = random.Random(f'{kind}-{seed}')
+    parts = []
+    length = 0
+    while length < min(size, BLOCK_CHARS):
+        if kind == 'sparse':
+            # Roughly one letter in twenty
+            part = ''.join(rng.choice(_SPARSE_CHARS) for _ in range(19)) + rng.choice('abcXYZ')
+        else:
+            words = _UNICODE_WORDS if kind == 'unicode' else _ASCII_WORDS
+            part = rng.choice(words) + rng.choice(_PUNCTUATION)
+        parts.append(part)
+        length += len(part)
+    block = ''.join(parts)
+    return (block * (size // len(block) + 1))[:size]
+
+
+def cipher_cases():
+    """
+    Return the benchmark cases as (name, function, reference) tuples
+
+    Both callables take the text and return the enciphered text.
+    """
+    cases = [
+        ('atbash_cipher', CipherUtils.atbash_cipher, ReferenceCipherUtils.atbash_cipher),
+    ]
+    for mode in ('encrypt', 'decrypt'):
+        cases.append((
+            f'caesar_cipher/{mode}',
+            lambda text, mode=mode: CipherUtils.caesar_cipher(text, 3, mode),
+            lambda text, mode=mode: ReferenceCipherUtils.caesar_cipher(text, 3, mode),
+        ))
+        for label, key in (('short', SHORT_KEY), ('long', LONG_KEY)):
+            cases.append((
+                f'vigenere_cipher/{mode}/{label}-key',
+                lambda text, key=key, mode=mode: CipherUtils.vigenere_cipher(text, key, mode),
+                lambda text, key=key, mode=mode: ReferenceCipherUtils.vigenere_cipher(text, key, mode),
+            ))
+    for cipher_type in ('atbash', 'caesar', 'vigenere'):
+        cases.append((
+            f'process_text/{cipher_type}',
+            lambda text, cipher_type=cipher_type: CipherUtils.process_text(text, cipher_type, shift=7, key=LONG_KEY),
+            lambda text, cipher_type=cipher_type: ReferenceCipherUtils.process_text(text, cipher_type, shift=7, key=LONG_KEY),
+        ))
+    cases.append(('process_pipeline', lambda text: CipherUtils.process_pipeline(text, PIPELINE_STEPS), _reference_pipeline))
+    cases.append(('process_batch', _batch, _reference_batch))
+    return cases
+
+
+def _reference_pipeline(text):
+    for step in PIPELINE_STEPS:
+        params = {name: value for name, value in step.items() if name not in ('cipher_type', 'mode')}
+        text = ReferenceCipherUtils.process_text(text, step['cipher_type'], step['mode'], **params)
+    return text
+
+
+def _batch_items(text):
+    """Split a text into at most 100 batch items cycling through the cipher types"""
+    step = max(1, len(text) // 100)
+    cipher_types = ('atbash', 'caesar', 'vigenere')
+    return [
+        {'text': text[start:start + step], 'cipher_type': cipher_types[index % 3], 'shift': 11, 'key': SHORT_KEY}
+        for index, start in enumerate(range(0, len(text), step))
+    ]
+
+
+def _batch(text):
+    results = CipherUtils.process_batch(_batch_items(text))
+    return ''.join(result['result'] for result in results)
+
+
+def _reference_batch(text):
+    return ''.join(
+        ReferenceCipherUtils.process_text(item.pop('text'), item.pop('cipher_type'), **item)
+        for item in _batch_items(text)
+    )
+
+
+def measure(function, text, min_time, max_runs):
+    """
+    Run ``function(text)`` until ``min_time`` seconds or ``max_runs`` runs
+
+    Returns (output of the last run, list of run times in seconds).
+    """
+    times = []
+    while True:
+        started = time.perf_counter()
+        output = function(text)
+        times.append(time.perf_counter() - started)
+        if len(times) >= max_runs or sum(times) >= min_time:
+            return output, times
+
+
+def _size_label(size):
+    for unit, factor in (('MB', 1024 * 1024), ('KB', 1024)):
+        if size >= factor and size % factor == 0:
+            return f'{size // factor}{unit}'
+    return f'{size}B'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the cipher functions and /ciphers/process/, checking outputs against the reference'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                            help='Text sizes in characters')
+        parser.add_argument('--max-size', type=int, default=None, help='Skip sizes above this')
+        parser.add_argument('--kinds', nargs='+', choices=TEXT_KINDS, default=list(TEXT_KINDS))
+        parser.add_argument('--only', nargs='+', default=None,
+                            help='Only run cases whose name starts with one of these')
+        parser.add_argument('--min-time', type=float, default=0.2,
+                            help='Repeat each case for at least this many seconds')
+        parser.add_argument('--max-runs', type=int, default=5, help='Run each case at most this many times')
+        parser.add_argument('--verify-max-size', type=int, default=1024 * 1024,
+                            help='Check outputs against the (slow) reference up to this size')
+        parser.add_argument('--http-max-size', type=int, default=1024 * 1024,
+                            help='Time /ciphers/process/ up to this size; 0 to skip')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='cipher_benchmark.json', help='JSON file to write')
+        parser.add_argument('--compare', default=None, help='Previous JSON output to compare against')
+
+    def handle(self, *args, **options):
+        sizes = sorted(size for size in options['sizes'] if not options['max_size'] or size <= options['max_size'])
+        cases = cipher_cases()
+        if options['only']:
+            cases = [case for case in cases if case[0].startswith(tuple(options['only']))]
+
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = {self._case_key(result): result for result in json.load(f)['results']}
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        results = []
+        failures = []
+        for kind in options['kinds']:
+            for size in sizes:
+                text = generate_text(kind, size, options['seed'])
+                verify = size <= options['verify_max_size']
+                for name, function, reference in cases:
+                    output, times = measure(function, text, options['min_time'], options['max_runs'])
+                    result = self._result(name, kind, size, times)
+                    if verify:
+                        expected, reference_times = measure(reference, text, 0, 1)
+                        result['verified'] = output == expected
+                        result['reference_s'] = reference_times[0]
+                        if not result['verified']:
+                            failures.append(result)
+                    results.append(result)
+                    self._report(result, baseline)
+                    del output
+
+                if size <= options['http_max_size'] and (
+                        not options['only'] or 'http'.startswith(tuple(options['only']))):
+                    for result in self._benchmark_http(text, kind, size, options, verify):
+                        if result.get('verified') is False:
+                            failures.append(result)
+                        results.append(result)
+                        self._report(result, baseline)
+                del text
+
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'numpy': kernels.np.__version__ if kernels.available else None,
+                'numpy_threshold': getattr(settings, 'CIPHER_NUMPY_THRESHOLD', None),
+                'seed': options['seed'],
+                'cipher_cache': cache_info(),
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if failures:
+            names = ', '.join(f"{r['case']} ({r['kind']}, {_size_label(r['size'])})" for r in failures)
+            raise CommandError(f"Output differs from the reference implementation: {names}")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} cases benchmarked"))
+
+    @staticmethod
+    def _case_key(result):
+        return result['case'], result['kind'], result['size']
+
+    @staticmethod
+    def _result(name, kind, size, times):
+        best = min(times)
+        return {
+            'case': name,
+            'kind': kind,
+            'size': size,
+            'runs': len(times),
+            'best_s': best,
+            'median_s': statistics.median(times),
+            'mb_per_s': size / best / (1024 * 1024) if best else None,
+            'verified': None,
+        }
+
+    def _report(self, result, baseline):
+        line = (
+            f"{result['case']:<36} {result['kind']:<8} {_size_label(result['size']):>6} "
+            f"{result['best_s'] * 1000:>11.3f} ms {result['mb_per_s'] or 0:>10.1f} MB/s"
+        )
+        if result.get('reference_s'):
+            line += f"  x{result['reference_s'] / result['best_s']:.1f} vs reference"
+        previous = baseline.get(self._case_key(result))
+        if previous:
+            line += f"  x{previous['best_s'] / result['best_s']:.2f} vs baseline"
+        self.stdout.write(line)
+
+    def _benchmark_http(self, text, kind, size, options, verify):
+        """Time POST /ciphers/process/ for each cipher type"""
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+        results = []
+        # The user and its session only exist for the duration of the run
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(username=f'benchmark-{uuid.uuid4().hex}')
+            client.force_login(user)
+            for cipher_type in ('atbash', 'caesar', 'vigenere'):
+                body = json.dumps({'text': text, 'cipher_type': cipher_type, 'shift': 7, 'key': LONG_KEY})
+
+                def post(_text, body=body):
+                    response = client.post('/ciphers/process/', body, content_type='application/json')
+                    return response.json().get('result')
+
+                output, times = measure(post, text, options['min_time'], options['max_runs'])
+                result = self._result(f'http/process/{cipher_type}', kind, size, times)
+                if verify:
+                    result['verified'] = output == ReferenceCipherUtils.process_text(
+                        text, cipher_type, shift=7, key=LONG_KEY
+                    )
+                results.append(result)
+            transaction.set_rollback(True)
+        return results
@@ -0,0 +1,316 @@
+"""
+Registry of cipher types and a cache of compiled cipher objects
+
+Every cipher type is a Cipher subclass registered under its name. Calling
+get_cipher() compiles the parameters (cleaned key, normalised shift, ...)
+into an instance once; instances are kept in a bounded LRU cache and shared,
+so they are never modified after they are built. Parameters are checked and
+brought to a canonical form (cipher_key()) before they are looked up, so
+equal values of another type (3.0 or True for a shift of 3 or 1) are
+rejected instead of sharing, or poisoning, the entry of a valid one.
+
+Adding a cipher only takes a subclass decorated with @register.
+
+get_pipeline() chains several ciphers. Ciphers that describe themselves
+through affine() are composed algebraically before any text is touched, so
+a chain of Atbash, Caesar and Vigenere layers costs a single pass.
+"""
+import functools
+import math
+
+from . import engine
+
+# Maximum number of compiled ciphers kept in the cache
+CACHE_SIZE = 256
+
+# Vigenere layers with coprime key lengths combine into a key as long as
+# the product of the lengths; past this length the layers are kept apart
+MAX_FUSED_PERIOD = 4096
+
+_registry = {}
+
+
+def register(cls):
+    """Class decorator adding a Cipher subclass to the registry"""
+    _registry[cls.name] = cls
+    return cls
+
+
+def cipher_names():
+    """Return the names of all registered cipher types"""
+    return list(_registry)
+
+
+class Cipher:
+    """
+    A cipher with its parameters compiled in
+
+    Subclasses set ``name`` and ``defaults`` (the keyword parameters they
+    accept, with their default values) and implement compile() and
+    __call__(), and clean() when their parameters have a canonical form.
+    Instances are shared through the cache, so they must not be changed once
+    compile() has run.
+    """
+    __slots__ = ('mode',)
+
+    name = None
+    defaults = {}
+    # True when encrypting and decrypting are the same operation
+    symmetric = False
+
+    def __init__(self, mode='encrypt', **params):
+        self.mode = mode
+        self.compile(**params)
+
+    @classmethod
+    def clean(cls, **params):
+        """
+        Check the parameters and return them in the form they are cached
+        under; raises TypeError or ValueError for invalid ones
+        """
+        return params
+
+    def compile(self, **params):
+        """Precompute whatever __call__ needs from the parameters"""
+
+    def __call__(self, text):
+        """Encrypt or decrypt a text"""
+        raise NotImplementedError
+
+    def affine(self):
+        """
+        Describe the cipher as a map of letter indexes (0-25), if possible
+
+        Returns (sign, offsets): the n-th letter x becomes
+        sign * x + offsets[n % len(offsets)] (mod 26). Returns None for
+        ciphers that can't be written this way; pipelines then apply them
+        on their own.
+        """
+        return None
+
+    def stream(self, position=0):
+        """
+        Return a function to feed consecutive chunks of one text through
+
+        ``position`` is the number of letters before the first chunk. Ciphers
+        that don't depend on the position can process every chunk alone.
+        """
+        return self
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.mode}>"
+
+
+@register
+class AtbashCipher(Cipher):
+    """Atbash cipher: reverses the alphabet (A->Z, B->Y, etc.)"""
+    __slots__ = ()
+
+    name = 'atbash'
+    symmetric = True
+
+    def __call__(self, text):
+        return engine.atbash(text)
+
+    def affine(self):
+        return -1, (25,)
+
+
+@register
+class CaesarCipher(Cipher):
+    """Caesar cipher: shifts each letter by a fixed number"""
+    __slots__ = ('shift',)
+
+    name = 'caesar'
+    defaults = {'shift': 3}
+
+    @classmethod
+    def clean(cls, shift):
+        return {'shift': engine.normalize_shift(shift)}
+
+    def compile(self, shift):
+        self.shift = engine.normalize_shift(shift, self.mode)
+
+    def __call__(self, text):
+        return engine.caesar(text, self.shift)
+
+    def affine(self):
+        return 1, (self.shift,)
+
+
+@register
+class Rot13Cipher(Cipher):
+    """ROT13: Caesar cipher with a shift of 13, which is its own inverse"""
+    __slots__ = ()
+
+    name = 'rot13'
+    symmetric = True
+
+    def __call__(self, text):
+        return engine.caesar(text, 13)
+
+    def affine(self):
+        return 1, (13,)
+
+
+@register
+class VigenereCipher(Cipher):
+    """Vigenere cipher: uses a repeating keyword to shift letters"""
+    __slots__ = ('shifts',)
+
+    name = 'vigenere'
+    defaults = {'key': 'KEY'}
+
+    @classmethod
+    def clean(cls, key):
+        if not isinstance(key, str):
+            raise TypeError(f"Key must be a string, not {type(key).__name__}")
+        # Only the letters of a key count, whatever their case
+        return {'key': ''.join(filter(str.isalpha, key.upper()))}
+
+    def compile(self, key):
+        self.shifts = engine.key_shifts(key, self.mode) if key else ()
+
+    def __call__(self, text):
+        return engine.vigenere(text, self.shifts)
+
+    def affine(self):
+        return 1, self.shifts or (0,)
+
+    def stream(self, position=0):
+        return engine.VigenereStream(self.shifts, position)
+
+
+def _compose(first, second):
+    """Compose two affine descriptions: ``first`` is applied, then ``second``"""
+    sign1, offsets1 = first
+    sign2, offsets2 = second
+    period = math.lcm(len(offsets1), len(offsets2))
+    offsets = tuple(
+        (sign2 * offsets1[i % len(offsets1)] + offsets2[i % len(offsets2)]) % 26
+        for i in range(period)
+    )
+    # A combined key like ABCABC only needs to be ABC
+    for length in range(1, period):
+        if period % length == 0 and offsets[:length] * (period // length) == offsets:
+            offsets = offsets[:length]
+            break
+    return sign1 * sign2, offsets
+
+
+class Pipeline:
+    """
+    Several ciphers applied one after another
+
+    Runs of ciphers with an affine() description are fused into a single
+    engine.substitute() pass; the rest are applied as they are. Like
+    compiled ciphers, pipelines are cached and must not be changed.
+    """
+    __slots__ = ('ciphers', 'stages')
+
+    def __init__(self, ciphers):
+        self.ciphers = tuple(ciphers)
+        self.stages = []
+        pending = None
+        for cipher in self.ciphers:
+            description = cipher.affine()
+            if description is None:
+                self._add_stage(pending)
+                pending = None
+                self.stages.append(cipher)
+            elif pending is None:
+                pending = description
+            elif math.lcm(len(pending[1]), len(description[1])) > MAX_FUSED_PERIOD:
+                self._add_stage(pending)
+                pending = description
+            else:
+                pending = _compose(pending, description)
+        self._add_stage(pending)
+
+    def _add_stage(self, description):
+        if description is None:
+            return
+        sign, offsets = description
+        if sign == 1 and not any(offsets):
+            return
+        self.stages.append(functools.partial(engine.substitute, offsets=offsets, reflect=sign < 0))
+
+    def __call__(self, text):
+        # The fused stages only cover ASCII letters exactly; the rare texts
+        # with other letters go through every cipher in turn
+        stages = self.ciphers if engine.has_extra_letters(text) else self.stages
+        for stage in stages:
+            text = stage(text)
+        return text
+
+    def __repr__(self):
+        return f"<Pipeline {self.ciphers!r}>"
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _compile(cipher_type, mode, params):
+    return _registry[cipher_type](mode, **dict(params))
+
+
+def cipher_key(cipher_type, mode='encrypt', **kwargs):
+    """
+    Return the (cipher type, mode, parameters) a cipher is cached under
+
+    Parameters the cipher type doesn't take are ignored, missing ones get
+    their defaults and the rest are cleaned (Cipher.clean()), so equivalent
+    requests have the same key. Raises TypeError or ValueError for an
+    unknown cipher type or invalid parameters.
+    """
+    if not isinstance(cipher_type, str) or cipher_type not in _registry:
+        raise ValueError(f"Unknown cipher type: {cipher_type}")
+    cls = _registry[cipher_type]
+    # Anything but 'decrypt' encrypts, as in the original implementation
+    if cls.symmetric or mode != 'decrypt':
+        mode = 'encrypt'
+    params = cls.clean(**{name: kwargs.get(name, default) for name, default in cls.defaults.items()})
+    return cipher_type, mode, tuple(params.items())
+
+
+def get_cipher(cipher_type, mode='encrypt', **kwargs):
+    """
+    Return the compiled cipher for a type, mode and parameters
+
+    Equivalent requests share one cache entry, see cipher_key().
+    """
+    return _compile(*cipher_key(cipher_type, mode, **kwargs))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _compile_pipeline(ciphers):
+    return Pipeline(ciphers)
+
+
+def get_pipeline(steps):
+    """
+    Return the compiled pipeline for a list of steps
+
+    Each step is a dict with cipher_type, mode and the cipher's parameters,
+    with the same defaults as get_cipher().
+    """
+    ciphers = []
+    for step in steps:
+        params = {name: value for name, value in step.items() if name not in ('cipher_type', 'mode')}
+        ciphers.append(get_cipher(step.get('cipher_type', 'caesar'), step.get('mode', 'encrypt'), **params))
+    return _compile_pipeline(tuple(ciphers))
+
+
+def cache_info():
+    """Return hit/miss counters and the size of the compiled cipher cache"""
+    info = _compile.cache_info()
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+    }
+
+
+def clear_cache():
+    """Drop every compiled cipher and reset the counters"""
+    _compile.cache_clear()
+    _compile_pipeline.cache_clear()
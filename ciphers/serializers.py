@@ -1,10 +1,26 @@
 from rest_framework import serializers
+from .registry import cipher_names
+
+class CipherStepSerializer(serializers.Serializer):
+    """Serializer for one step of a cipher pipeline"""
+    cipher_type = serializers.ChoiceField(
+        choices=cipher_names(),
+        default='caesar',
+        help_text="Type of cipher to use"
+    )
+    mode = serializers.ChoiceField(
+        choices=['encrypt', 'decrypt'],
+        default='encrypt',
+        help_text="Whether to encrypt or decrypt the text"
+    )
+    shift = serializers.IntegerField(required=False, default=3, help_text="Shift value for Caesar cipher")
+    key = serializers.CharField(required=False, default='KEY', help_text="Key for Vigenere cipher")
 
 class CipherRequestSerializer(serializers.Serializer):
     """Serializer for cipher request parameters"""
     text = serializers.CharField(required=True, help_text="Text to encrypt/decrypt")
     cipher_type = serializers.ChoiceField(
-        choices=['atbash', 'caesar', 'vigenere'],
+        choices=cipher_names(),
         default='caesar',
         help_text="Type of cipher to use"
     )
@@ -15,6 +31,11 @@ class CipherRequestSerializer(serializers.Serializer):
     )
     shift = serializers.IntegerField(required=False, default=3, help_text="Shift value for Caesar cipher")
     key = serializers.CharField(required=False, default='KEY', help_text="Key for Vigenere cipher")
+    steps = CipherStepSerializer(
+        many=True,
+        required=False,
+        help_text="Ciphers to apply in order; when given, cipher_type, mode, shift and key are ignored"
+    )
 
 class CipherResponseSerializer(serializers.Serializer):
     """Serializer for cipher response"""
@@ -23,4 +44,48 @@ class CipherResponseSerializer(serializers.Serializer):
     original = serializers.CharField(required=False)
     cipher_type = serializers.CharField(required=False)
     mode = serializers.CharField(required=False)
+    steps = CipherStepSerializer(many=True, required=False)
+    error = serializers.CharField(required=False)
+
+class CipherBatchRequestSerializer(serializers.Serializer):
+    """Serializer for batch cipher request parameters"""
+    items = CipherRequestSerializer(many=True, help_text="Texts to process, each with its own cipher parameters")
+
+class CipherBatchItemResultSerializer(serializers.Serializer):
+    """Serializer for the result of a single batch item"""
+    success = serializers.BooleanField()
+    result = serializers.CharField(required=False)
+    error = serializers.CharField(required=False)
+
+class CipherBatchResponseSerializer(serializers.Serializer):
+    """Serializer for batch cipher response"""
+    success = serializers.BooleanField()
+    count = serializers.IntegerField(required=False)
+    results = CipherBatchItemResultSerializer(many=True, required=False, help_text="Results in the same order as the request items")
+    error = serializers.CharField(required=False)
+
+class CrackRequestSerializer(serializers.Serializer):
+    """Serializer for cryptanalysis request parameters"""
+    text = serializers.CharField(required=True, help_text="Ciphertext to crack")
+    cipher_type = serializers.ChoiceField(
+        choices=['caesar', 'vigenere'],
+        default='caesar',
+        help_text="Cipher the text was encrypted with"
+    )
+    max_key_length = serializers.IntegerField(required=False, default=20, help_text="Longest Vigenere key to consider")
+    top = serializers.IntegerField(required=False, default=5, help_text="Number of candidates to return")
+
+class CrackCandidateSerializer(serializers.Serializer):
+    """Serializer for a single cryptanalysis candidate"""
+    shift = serializers.IntegerField(required=False, help_text="Caesar shift (caesar only)")
+    key = serializers.CharField(required=False, help_text="Vigenere key (vigenere only)")
+    score = serializers.FloatField(help_text="Chi-squared distance from English; lower is better")
+    preview = serializers.CharField(help_text="Start of the decrypted text")
+
+class CrackResponseSerializer(serializers.Serializer):
+    """Serializer for cryptanalysis response"""
+    success = serializers.BooleanField()
+    result = serializers.CharField(required=False, help_text="Text decrypted with the best candidate")
+    candidates = CrackCandidateSerializer(many=True, required=False, help_text="Candidates, most likely first")
+    cipher_type = serializers.CharField(required=False)
     error = serializers.CharField(required=False)
@@ -1,3 +1,489 @@
-from django.test import TestCase
+import io
+import os
+import random
+import string
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import buffers, cryptanalysis, kernels, registry
+from .reference import ReferenceCipherUtils
+from .utils import CipherUtils
+
+# Non-ASCII characters of every kind: accented letters, other scripts,
+# characters whose case mapping changes their length, and emoji
+NON_ASCII = 'éÉàçñöÅßøæœ' 'ΑλφαβητοΩ' 'Москва' '東京' '…—«»¿¡' '😀🔐'
+
+# Non-ASCII characters the reference treats as letters (their upper() is an
+# ASCII letter): dotless i and long s
+FOLDED_LETTERS = 'ıſ'
+
+# The "st" ligatures upper-case to "ST", which the reference also treats as a
+# letter; its Atbash fails on them, so they are only used with the others
+LIGATURES = 'ﬅﬆ'
+
+SHIFTS = (0, 1, 3, 13, 25, 26, 27, -1, -29, 1000)
+KEYS = ('KEY', 'key', 'Security System', 'k-e-y 42', 'a', 'z', 'Clé', 'ſecret')
+
+
+def random_text(seed, size, alphabet=string.printable + NON_ASCII + FOLDED_LETTERS):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(alphabet) for _ in range(size))
+
+
+class ReferenceEquivalenceTests(SimpleTestCase):
+    """The optimised engine gives exactly the output of ciphers.reference"""
+
+    def texts(self, size=2000, alphabet=None):
+        texts = ['', 'A', 'Hello, World!', 'ıſ ıſ', NON_ASCII]
+        for seed in range(5):
+            texts.append(random_text(seed, size) if alphabet is None else random_text(seed, size, alphabet))
+        return texts
+
+    def test_atbash(self):
+        for text in self.texts():
+            for mode in ('encrypt', 'decrypt'):
+                self.assertEqual(
+                    CipherUtils.atbash_cipher(text, mode), ReferenceCipherUtils.atbash_cipher(text, mode)
+                )
+
+    def test_caesar(self):
+        for text in self.texts() + [random_text(9, 2000, string.ascii_letters + LIGATURES)]:
+            for shift in SHIFTS:
+                for mode in ('encrypt', 'decrypt'):
+                    self.assertEqual(
+                        CipherUtils.caesar_cipher(text, shift, mode),
+                        ReferenceCipherUtils.caesar_cipher(text, shift, mode),
+                        msg=f"shift={shift} mode={mode}"
+                    )
+
+    def test_vigenere(self):
+        for text in self.texts() + [random_text(9, 2000, string.ascii_letters + LIGATURES + ' ')]:
+            for key in KEYS:
+                for mode in ('encrypt', 'decrypt'):
+                    self.assertEqual(
+                        CipherUtils.vigenere_cipher(text, key, mode),
+                        ReferenceCipherUtils.vigenere_cipher(text, key, mode),
+                        msg=f"key={key!r} mode={mode}"
+                    )
+
+    def test_vigenere_without_letters_in_the_key_leaves_the_text(self):
+        text = random_text(1, 500)
+        for key in ('', '1234', ' -!?', '42 😀'):
+            for mode in ('encrypt', 'decrypt'):
+                self.assertEqual(CipherUtils.vigenere_cipher(text, key, mode), text)
+                self.assertEqual(ReferenceCipherUtils.vigenere_cipher(text, key, mode), text)
+
+    def test_pipeline_matches_the_reference_step_by_step(self):
+        steps = [
+            {'cipher_type': 'caesar', 'mode': 'encrypt', 'shift': 5},
+            {'cipher_type': 'vigenere', 'mode': 'encrypt', 'key': 'KEY'},
+            {'cipher_type': 'atbash', 'mode': 'encrypt'},
+            {'cipher_type': 'vigenere', 'mode': 'decrypt', 'key': 'Lemon'},
+        ]
+        for text in self.texts():
+            expected = text
+            for step in steps:
+                params = {name: value for name, value in step.items() if name in ('shift', 'key')}
+                expected = ReferenceCipherUtils.process_text(expected, step['cipher_type'], step['mode'], **params)
+            self.assertEqual(CipherUtils.process_pipeline(text, steps), expected)
+
+
+class RoundTripTests(SimpleTestCase):
+    """Decrypting an encrypted text gives the text back"""
+
+    # The non-ASCII letters are folded onto ASCII ones, so they can't round trip
+    alphabet = string.printable + NON_ASCII
+
+    def test_round_trips(self):
+        for seed in range(5):
+            text = random_text(seed, 3000, self.alphabet)
+            self.assertEqual(CipherUtils.atbash_cipher(CipherUtils.atbash_cipher(text)), text)
+            for shift in SHIFTS:
+                encrypted = CipherUtils.caesar_cipher(text, shift)
+                self.assertEqual(CipherUtils.caesar_cipher(encrypted, shift, 'decrypt'), text)
+            for key in KEYS:
+                encrypted = CipherUtils.vigenere_cipher(text, key)
+                self.assertEqual(CipherUtils.vigenere_cipher(encrypted, key, 'decrypt'), text)
+
+
+@unittest.skipUnless(kernels.available, "NumPy is not installed")
+@override_settings(CIPHER_NUMPY_THRESHOLD=1024)
+class NumpyKernelTests(SimpleTestCase):
+    """Texts above CIPHER_NUMPY_THRESHOLD go through the NumPy kernels, with the same output"""
+
+    size = 5000
+
+    def test_kernels_match_the_reference(self):
+        texts = [random_text(seed, self.size) for seed in range(3)]
+        # Pure ASCII: Atbash and Caesar stay on str.translate there, Vigenere doesn't
+        texts.append(random_text(3, self.size, string.printable))
+        for text in texts:
+            with mock.patch.object(kernels, 'vigenere', wraps=kernels.vigenere) as vigenere:
+                for key in KEYS:
+                    for mode in ('encrypt', 'decrypt'):
+                        self.assertEqual(
+                            CipherUtils.vigenere_cipher(text, key, mode),
+                            ReferenceCipherUtils.vigenere_cipher(text, key, mode)
+                        )
+            self.assertTrue(vigenere.called)
+            for shift in SHIFTS:
+                self.assertEqual(
+                    CipherUtils.caesar_cipher(text, shift), ReferenceCipherUtils.caesar_cipher(text, shift)
+                )
+            self.assertEqual(CipherUtils.atbash_cipher(text), ReferenceCipherUtils.atbash_cipher(text))
+
+    def test_non_ascii_atbash_and_caesar_use_the_kernels(self):
+        text = random_text(4, self.size)
+        with mock.patch.object(kernels, 'atbash', wraps=kernels.atbash) as atbash, \
+                mock.patch.object(kernels, 'caesar', wraps=kernels.caesar) as caesar:
+            self.assertEqual(CipherUtils.atbash_cipher(text), ReferenceCipherUtils.atbash_cipher(text))
+            self.assertEqual(CipherUtils.caesar_cipher(text, 7), ReferenceCipherUtils.caesar_cipher(text, 7))
+        self.assertTrue(atbash.called)
+        self.assertTrue(caesar.called)
+
+    def test_round_trips(self):
+        text = random_text(5, self.size, RoundTripTests.alphabet)
+        for key in KEYS:
+            self.assertEqual(CipherUtils.vigenere_cipher(CipherUtils.vigenere_cipher(text, key), key, 'decrypt'), text)
+        self.assertEqual(CipherUtils.caesar_cipher(CipherUtils.caesar_cipher(text, 11), 11, 'decrypt'), text)
+
+
+class RegistryTests(SimpleTestCase):
+    """The cache of compiled ciphers"""
+
+    def setUp(self):
+        registry.clear_cache()
+
+    def test_equivalent_parameters_share_an_entry(self):
+        cipher = registry.get_cipher('caesar', shift=3)
+        self.assertIs(registry.get_cipher('caesar', 'encrypt', shift=29), cipher)
+        self.assertIs(registry.get_cipher('caesar', 'encrypt', shift=-23, key='ignored'), cipher)
+        self.assertIs(registry.get_cipher('caesar'), cipher)
+        self.assertIs(registry.get_cipher('vigenere', key='k-e-y'), registry.get_cipher('vigenere', key='KEY'))
+        self.assertIs(registry.get_cipher('atbash', 'decrypt'), registry.get_cipher('atbash'))
+        self.assertEqual(registry.cache_info()['size'], 3)
+
+    def test_other_modes_and_parameters_get_their_own_entry(self):
+        self.assertIsNot(registry.get_cipher('caesar', 'decrypt', shift=3), registry.get_cipher('caesar', shift=3))
+        self.assertIsNot(registry.get_cipher('caesar', shift=4), registry.get_cipher('caesar', shift=3))
+        self.assertEqual(registry.cache_info()['size'], 3)
+
+    def test_equal_values_of_another_type_are_rejected(self):
+        # 3.0 == 3 and True == 1, so they would share the cache entries
+        registry.get_cipher('caesar', shift=3)
+        registry.get_cipher('caesar', shift=1)
+        for shift in (3.0, True, '3', None):
+            with self.assertRaises(TypeError):
+                registry.get_cipher('caesar', shift=shift)
+        self.assertEqual(registry.cache_info()['size'], 2)
+        for key in (None, 42, b'KEY'):
+            with self.assertRaises(TypeError):
+                registry.get_cipher('vigenere', key=key)
+        with self.assertRaises(ValueError):
+            registry.get_cipher('enigma')
+
+    def test_hits_and_misses_are_counted(self):
+        for _ in range(3):
+            registry.get_cipher('vigenere', key='KEY')
+        info = registry.cache_info()
+        self.assertEqual((info['hits'], info['misses'], info['size']), (2, 1, 1))
+        registry.clear_cache()
+        self.assertEqual(registry.cache_info()['size'], 0)
+
+    def test_pipelines_of_equivalent_steps_share_an_entry(self):
+        pipeline = registry.get_pipeline([{'cipher_type': 'caesar', 'shift': 1}, {'cipher_type': 'atbash'}])
+        equivalent = [{'cipher_type': 'caesar', 'shift': 27}, {'cipher_type': 'atbash', 'mode': 'decrypt'}]
+        self.assertIs(registry.get_pipeline(equivalent), pipeline)
+        self.assertEqual(pipeline('abc'), 'yxw')
+
+
+class BatchTests(SimpleTestCase):
+    """CipherUtils.process_batch"""
+
+    def setUp(self):
+        registry.clear_cache()
+
+    def test_results_are_in_item_order(self):
+        items = [
+            {'text': 'Hello', 'cipher_type': 'caesar', 'shift': 3},
+            {'text': 'Hello', 'cipher_type': 'vigenere', 'key': 'KEY', 'mode': 'decrypt'},
+            {'text': 'Hello', 'cipher_type': 'atbash'},
+            {'text': 'Hello'},
+        ]
+        expected = [
+            ReferenceCipherUtils.process_text(
+                item['text'], item.get('cipher_type', 'caesar'), item.get('mode', 'encrypt'),
+                shift=item.get('shift', 3), key=item.get('key', 'KEY')
+            )
+            for item in items
+        ]
+        results = CipherUtils.process_batch(items)
+        self.assertEqual(results, [{'success': True, 'result': result} for result in expected])
+
+    def test_equivalent_parameters_share_a_group(self):
+        items = [
+            {'text': 'abc', 'shift': 3},
+            {'text': 'abc', 'shift': 29, 'key': 'other'},
+            {'text': 'abc'},
+            {'text': 'abc', 'cipher_type': 'vigenere', 'key': 'key'},
+            {'text': 'abc', 'cipher_type': 'vigenere', 'key': 'K E Y'},
+        ]
+        with mock.patch.object(CipherUtils, 'get_processor', wraps=CipherUtils.get_processor) as get_processor:
+            results = CipherUtils.process_batch(items)
+        self.assertEqual(get_processor.call_count, 2)
+        self.assertEqual([result['result'] for result in results], ['def'] * 3 + ['kfa'] * 2)
+
+    def test_equal_values_of_another_type_fail_on_their_own(self):
+        items = [
+            {'text': 'abc', 'shift': 3.0},
+            {'text': 'abc', 'shift': 3},
+            {'text': 'abc', 'shift': True},
+            {'text': 'abc', 'shift': 1},
+            {'text': 'abc', 'cipher_type': 'vigenere', 'key': ['K']},
+        ]
+        results = CipherUtils.process_batch(items)
+        self.assertEqual(results[1], {'success': True, 'result': 'def'})
+        self.assertEqual(results[3], {'success': True, 'result': 'bcd'})
+        for index in (0, 2, 4):
+            self.assertFalse(results[index]['success'])
+        self.assertIn('float', results[0]['error'])
+        self.assertIn('bool', results[2]['error'])
+
+    def test_bad_items_dont_affect_the_others(self):
+        results = CipherUtils.process_batch([
+            'not an object',
+            {'text': 'abc', 'cipher_type': 'enigma'},
+            {'text': 'abc', 'cipher_type': {'unhashable': True}},
+            {'text': 42, 'shift': 1},
+            {'text': 'abc', 'shift': 1},
+        ])
+        self.assertEqual([result['success'] for result in results], [False] * 4 + [True])
+        self.assertEqual(results[0]['error'], 'Item must be an object')
+        self.assertEqual(results[1]['error'], 'Unknown cipher type: enigma')
+
+
+# Plain English for the cryptanalysis tests, about 800 letters
+ENGLISH = (
+    "It was the best of times, it was the worst of times, it was the age of wisdom, it was the age "
+    "of foolishness, it was the epoch of belief, it was the epoch of incredulity, it was the season "
+    "of Light, it was the season of Darkness, it was the spring of hope, it was the winter of "
+    "despair, we had everything before us, we had nothing before us, we were all going direct to "
+    "Heaven, we were all going direct the other way. In short, the period was so far like the "
+    "present period, that some of its noisiest authorities insisted on its being received, for "
+    "good or for evil, in the superlative degree of comparison only. There were a king with a "
+    "large jaw and a queen with a plain face, on the throne of England; there were a king with a "
+    "large jaw and a queen with a fair face, on the throne of France."
+)
+
+
+class CryptanalysisTests(SimpleTestCase):
+    """Cracking Caesar and Vigenere ciphertexts of English text"""
+
+    def test_caesar_shift_is_the_top_candidate(self):
+        for shift in (0, 1, 3, 13, 25, 29):
+            candidates = cryptanalysis.crack_caesar(CipherUtils.caesar_cipher(ENGLISH, shift))
+            self.assertEqual(candidates[0]['shift'], shift % 26, msg=f"shift={shift}")
+            self.assertEqual(candidates[0]['preview'], ENGLISH[:cryptanalysis.PREVIEW_LENGTH])
+            scores = [candidate['score'] for candidate in candidates]
+            self.assertEqual(scores, sorted(scores))
+
+    def test_vigenere_key_is_the_top_candidate(self):
+        for key in ('KEY', 'LEMON', 'CIPHER', 'SECURITY'):
+            candidates = cryptanalysis.crack_vigenere(CipherUtils.vigenere_cipher(ENGLISH, key))
+            self.assertEqual(candidates[0]['key'], key)
+            self.assertEqual(candidates[0]['preview'], ENGLISH[:cryptanalysis.PREVIEW_LENGTH])
+
+    def test_vigenere_key_with_a_repeated_pattern_is_reduced(self):
+        candidates = cryptanalysis.crack_vigenere(CipherUtils.vigenere_cipher(ENGLISH, 'ABCABC'))
+        self.assertEqual(candidates[0]['key'], 'ABC')
+
+    def test_top_limits_the_candidates(self):
+        ciphertext = CipherUtils.caesar_cipher(ENGLISH, 7)
+        self.assertEqual(len(cryptanalysis.crack(ciphertext, 'caesar', top=3)), 3)
+        self.assertLessEqual(len(cryptanalysis.crack(ciphertext, 'vigenere', top=2)), 2)
+
+    def test_very_short_texts(self):
+        # Too short to be sure, but the shift is among the candidates
+        candidates = cryptanalysis.crack_caesar(CipherUtils.caesar_cipher("Hello", 3))
+        self.assertEqual(len(candidates), 5)
+        self.assertIn(3, [candidate['shift'] for candidate in candidates])
+        # Vigenere keys are never longer than the text allows
+        for text in ("Hi", "A"):
+            candidates = cryptanalysis.crack_vigenere(text)
+            self.assertTrue(candidates)
+            self.assertTrue(all(len(candidate['key']) == 1 for candidate in candidates))
+
+    def test_texts_without_letters(self):
+        for text in ('', '1234 !?', '東京 😀'):
+            candidates = cryptanalysis.crack_caesar(text)
+            self.assertEqual({candidate['score'] for candidate in candidates}, {0.0})
+            self.assertEqual({candidate['preview'] for candidate in candidates}, {text})
+            self.assertEqual(cryptanalysis.crack_vigenere(text), [])
+
+    def test_unknown_cipher_type(self):
+        with self.assertRaises(ValueError):
+            cryptanalysis.crack(ENGLISH, 'atbash')
+
+
+class BufferCipherTests(SimpleTestCase):
+    """Ciphers over byte buffers, fed in chunks"""
+
+    # Multi-byte UTF-8 characters that aren't letters, so the str ciphers
+    # leave them alone like the buffer ciphers do
+    text = 'Héllo… «wörld» 😀 — the quick brown fox €42 jumps! ' * 3
+    data = text.encode('utf-8')
+
+    def ciphers(self, cipher_type, mode='encrypt', **params):
+        """The buffer cipher through NumPy (when installed) and through pure Python"""
+        cipher = registry.get_cipher(cipher_type, mode, **params)
+        numpy = buffers.BufferCipher(cipher)
+        python = buffers.BufferCipher(cipher)
+        python.lookup = None
+        return [numpy, python] if numpy.lookup is not None else [python]
+
+    def chunked(self, cipher, data, chunk_size):
+        """Encipher ``data`` chunk by chunk in place, carrying the position"""
+        buffer = bytearray(data)
+        view = memoryview(buffer)
+        position = 0
+        for start in range(0, len(buffer), chunk_size):
+            position += cipher.into(view[start:start + chunk_size], position=position)
+        return bytes(buffer), position
+
+    def test_multi_byte_characters_split_across_chunks(self):
+        for cipher in self.ciphers('caesar', shift=5):
+            whole = bytearray(self.data)
+            cipher.into(whole)
+            for chunk_size in range(1, 9):
+                result, _ = self.chunked(cipher, self.data, chunk_size)
+                self.assertEqual(result, whole, msg=f"chunk_size={chunk_size}")
+                # Bytes of the multi-byte characters are never changed; é is
+                # kept out of the str cipher, which treats it as a letter
+                self.assertEqual(
+                    result.decode('utf-8'),
+                    CipherUtils.caesar_cipher(self.text.replace('é', '\0'), 5).replace('\0', 'é')
+                )
+
+    def test_vigenere_key_index_carries_between_chunks(self):
+        text = self.text.replace('é', 'e')
+        expected = CipherUtils.vigenere_cipher(text, 'SECRET').encode('utf-8')
+        for cipher in self.ciphers('vigenere', key='SECRET'):
+            for chunk_size in (1, 2, 3, 5, 6, 7, 64):
+                result, letters = self.chunked(cipher, text.encode('utf-8'), chunk_size)
+                self.assertEqual(result, expected, msg=f"chunk_size={chunk_size}")
+                self.assertEqual(letters, buffers.count_letters(text.encode('utf-8')))
+
+    def test_position_starts_mid_text(self):
+        data = self.text.replace('é', 'e').encode('utf-8')
+        expected = CipherUtils.vigenere_cipher(data.decode('utf-8'), 'KEY').encode('utf-8')
+        split = 23
+        tail = bytearray(data[split:])
+        buffers.encrypt_into(tail, cipher_type='vigenere', key='KEY', position=buffers.count_letters(data[:split]))
+        self.assertEqual(bytes(tail), expected[split:])
+
+    def test_blocks_carry_the_position(self):
+        data = self.text.replace('é', 'e').encode('utf-8')
+        expected = CipherUtils.vigenere_cipher(data.decode('utf-8'), 'LEMON').encode('utf-8')
+        with mock.patch.object(buffers, 'BLOCK_SIZE', 5):
+            for cipher in self.ciphers('vigenere', key='LEMON'):
+                out = bytearray(len(data))
+                cipher.into(data, out)
+                self.assertEqual(bytes(out), expected)
+
+    def test_decrypt_round_trips(self):
+        ciphers = zip(self.ciphers('vigenere', key='KEY'), self.ciphers('vigenere', 'decrypt', key='KEY'))
+        for encrypt, decrypt in ciphers:
+            encrypted, _ = self.chunked(encrypt, self.data, 4)
+            decrypted, _ = self.chunked(decrypt, encrypted, 3)
+            self.assertEqual(decrypted, self.data)
+
+    def test_output_buffer_checks(self):
+        with self.assertRaises(TypeError):
+            buffers.encrypt_into(b'read-only bytes')
+        with self.assertRaises(ValueError):
+            buffers.encrypt_into(b'abc', bytearray(2))
+        out = bytearray(3)
+        self.assertEqual(buffers.encrypt_into(b'abc', out, shift=1), 3)
+        self.assertEqual(out, b'bcd')
+
+
+class CipherFileCommandTests(SimpleTestCase):
+    """manage.py cipher_file"""
+
+    text = b'Attack at dawn! \xe6\x9d\xb1 The quick brown fox.\n' * 100
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input = os.path.join(directory.name, 'input.txt')
+        self.output = os.path.join(directory.name, 'output.txt')
+        with open(self.input, 'wb') as f:
+            f.write(self.text)
+
+    def test_enciphers_the_file(self):
+        call_command('cipher_file', self.input, self.output, cipher_type='vigenere', key='LEMON', workers=1,
+                     stdout=io.StringIO())
+        expected = bytearray(self.text)
+        buffers.encrypt_into(expected, cipher_type='vigenere', key='LEMON')
+        with open(self.output, 'rb') as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_bad_parameters_are_command_errors(self):
+        for options in ({'workers': 0}, {'workers': -2}, {'shift': 1.5}):
+            with self.assertRaises(CommandError, msg=options):
+                call_command('cipher_file', self.input, self.output, **options)
+        with self.assertRaises(CommandError):
+            call_command('cipher_file', self.input + '.missing', self.output, workers=1)
+        self.assertFalse(os.path.exists(self.output))
+
+
+@override_settings(CIPHER_STREAM_CHUNK_SIZE=7)
+class StreamEndpointTests(TestCase):
+    """/ciphers/process/stream/ reads and writes the body in small chunks"""
+
+    text = 'Héllo, Wörld! 東京 The quick brown fox ıſ. ' * 5
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('streamer', 'streamer@example.com', 'pw-12345678')
+        self.client.force_login(user)
+        self.async_client.force_login(user)
+
+    def stream(self, body, content_type, query='cipher_type=vigenere&key=JOKE'):
+        response = self.client.post(f'/ciphers/process/stream/?{query}', body, content_type=content_type)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_output_matches_the_whole_text_enciphered(self):
+        expected = ReferenceCipherUtils.vigenere_cipher(self.text, 'JOKE')
+        output = self.stream(self.text.encode('utf-8'), 'text/plain; charset=utf-8')
+        self.assertEqual(output.decode('utf-8'), expected)
+
+    def test_encodings_with_a_bom_write_it_once(self):
+        expected = ReferenceCipherUtils.vigenere_cipher(self.text, 'JOKE')
+        for encoding in ('utf-16', 'utf-8-sig'):
+            # The test client encodes the text with the charset
+            output = self.stream(self.text, f'text/plain; charset={encoding}')
+            self.assertEqual(output, expected.encode(encoding), msg=encoding)
+
+    async def test_asgi_gets_the_chunks_one_by_one(self):
+        expected = ReferenceCipherUtils.vigenere_cipher(self.text, 'JOKE')
+        for content_type in ('text/plain; charset=utf-8', 'application/octet-stream'):
+            response = await self.async_client.post(
+                '/ciphers/process/stream/?cipher_type=vigenere&key=JOKE', self.text.encode('utf-8'),
+                content_type=content_type
+            )
+            # An async iterator, which Django's ASGI handler doesn't buffer
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+            self.assertGreater(len(chunks), 1)
+            if content_type == 'application/octet-stream':
+                buffer = bytearray(self.text.encode('utf-8'))
+                buffers.encrypt_into(buffer, cipher_type='vigenere', key='JOKE')
+                self.assertEqual(b''.join(chunks), buffer)
+            else:
+                self.assertEqual(b''.join(chunks).decode('utf-8'), expected)
@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.cipher_tools_view, name='cipher_tools'),
     path('process/', views.process_cipher, name='process_cipher'),
+    path('process/batch/', views.process_cipher_batch, name='process_cipher_batch'),
+    path('process/stream/', views.process_cipher_stream, name='process_cipher_stream'),
+    path('crack/', views.crack_cipher, name='crack_cipher'),
 ]
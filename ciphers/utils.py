@@ -1,7 +1,10 @@
 """
 Cipher utility functions for encryption and decryption
+
+The heavy lifting is done by the compiled ciphers in ciphers.registry;
+CipherUtils keeps the original API on top of them.
 """
-import string
+from .registry import cipher_key, get_cipher, get_pipeline
 
 
 class CipherUtils:
@@ -13,85 +16,44 @@ class CipherUtils:
         Atbash cipher: reverses the alphabet (A->Z, B->Y, etc.)
         Mode doesn't matter for Atbash as encryption = decryption
         """
-        result = []
-        
-        for char in text:
-            if char.upper() in string.ascii_uppercase:
-                # Get position (0-25)
-                pos = ord(char.upper()) - ord('A')
-                # Reverse position
-                new_pos = 25 - pos
-                # Convert back to character
-                new_char = chr(new_pos + ord('A'))
-                # Preserve case
-                if char.islower():
-                    new_char = new_char.lower()
-                result.append(new_char)
-            else:
-                # Keep non-alphabetic characters as is
-                result.append(char)
-        
-        return ''.join(result)
+        return get_cipher('atbash', mode)(text)
     
     @staticmethod
     def caesar_cipher(text, shift=3, mode='encrypt'):
         """
         Caesar cipher: shifts each letter by a fixed number
         """
-        if mode == 'decrypt':
-            shift = -shift
-        
-        result = []
-        
-        for char in text:
-            if char.upper() in string.ascii_uppercase:
-                # Get ASCII value
-                ascii_offset = ord('A') if char.isupper() else ord('a')
-                # Shift character
-                shifted = (ord(char) - ascii_offset + shift) % 26
-                result.append(chr(shifted + ascii_offset))
-            else:
-                # Keep non-alphabetic characters as is
-                result.append(char)
-        
-        return ''.join(result)
+        return get_cipher('caesar', mode, shift=shift)(text)
     
     @staticmethod
     def vigenere_cipher(text, key, mode='encrypt'):
         """
         Vigenere cipher: uses a repeating keyword to shift letters
         """
-        if not key:
-            return text
-        
-        # Clean the key (letters only, uppercase)
-        key = ''.join(filter(str.isalpha, key.upper()))
-        if not key:
-            return text
-        
-        result = []
-        key_index = 0
+        return get_cipher('vigenere', mode, key=key)(text)
+    
+    @staticmethod
+    def get_processor(cipher_type, mode='encrypt', **kwargs):
+        """
+        Return the compiled cipher for the given parameters
         
-        for char in text:
-            if char.upper() in string.ascii_uppercase:
-                # Get shift from key
-                shift = ord(key[key_index % len(key)]) - ord('A')
-                
-                if mode == 'decrypt':
-                    shift = -shift
-                
-                # Apply shift
-                ascii_offset = ord('A') if char.isupper() else ord('a')
-                shifted = (ord(char) - ascii_offset + shift) % 26
-                result.append(chr(shifted + ascii_offset))
-                
-                # Move to next key character
-                key_index += 1
-            else:
-                # Keep non-alphabetic characters as is
-                result.append(char)
+        The Caesar table and Vigenere key schedule are worked out once and
+        cached (see ciphers.registry), so calling the returned object
+        repeatedly doesn't redo that work.
+        """
+        return get_cipher(cipher_type, mode, **kwargs)
+    
+    @staticmethod
+    def get_stream_processor(cipher_type, mode='encrypt', **kwargs):
+        """
+        Like get_processor, for a text that is processed in consecutive chunks
         
-        return ''.join(result)
+        The returned function must be fed the chunks in order; for Vigenere it
+        carries the key position from one chunk to the next. Pass ``position``
+        (the number of letters before the first chunk) to start mid-text.
+        """
+        position = kwargs.pop('position', 0)
+        return get_cipher(cipher_type, mode, **kwargs).stream(position)
     
     @staticmethod
     def process_text(text, cipher_type, mode='encrypt', **kwargs):
@@ -100,17 +62,77 @@ class CipherUtils:
         
         Args:
             text: Text to process
-            cipher_type: 'atbash', 'caesar', or 'vigenere'
+            cipher_type: 'atbash', 'caesar', 'vigenere' or any other
+                         registered cipher type
             mode: 'encrypt' or 'decrypt'
             **kwargs: Additional parameters (shift for Caesar, key for Vigenere)
         """
-        if cipher_type == 'atbash':
-            return CipherUtils.atbash_cipher(text, mode)
-        elif cipher_type == 'caesar':
-            shift = kwargs.get('shift', 3)
-            return CipherUtils.caesar_cipher(text, shift, mode)
-        elif cipher_type == 'vigenere':
-            key = kwargs.get('key', 'KEY')
-            return CipherUtils.vigenere_cipher(text, key, mode)
-        else:
-            raise ValueError(f"Unknown cipher type: {cipher_type}")
+        return CipherUtils.get_processor(cipher_type, mode, **kwargs)(text)
+    
+    @staticmethod
+    def process_pipeline(text, steps):
+        """
+        Process text with several ciphers in a row
+        
+        Args:
+            text: Text to process
+            steps: List of dicts with cipher_type, mode, shift and key, applied
+                   in order (same defaults as process_text)
+        
+        Atbash, Caesar and Vigenere steps are composed into a single
+        substitution before the text is touched, so the text is only
+        processed once however many steps there are.
+        """
+        return get_pipeline(steps)(text)
+    
+    @staticmethod
+    def process_batch(items):
+        """
+        Process many texts, each with its own cipher parameters
+        
+        Args:
+            items: List of dicts with text, cipher_type, mode, shift and key
+                   (same defaults as the single-text API)
+        
+        Returns a list in the same order as items, holding either
+        {'success': True, 'result': ...} or {'success': False, 'error': ...}.
+        Items are grouped by their cleaned parameters (see
+        ciphers.registry.cipher_key), so each cipher is only prepared once
+        and equivalent parameters share a group, and a bad item doesn't
+        affect the others.
+        """
+        results = [None] * len(items)
+        groups = {}
+        
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'success': False, 'error': 'Item must be an object'}
+                continue
+            try:
+                params = cipher_key(
+                    item.get('cipher_type', 'caesar'),
+                    item.get('mode', 'encrypt'),
+                    shift=item.get('shift', 3),
+                    key=item.get('key', 'KEY'),
+                )
+            except (TypeError, ValueError) as e:
+                results[index] = {'success': False, 'error': str(e)}
+                continue
+            groups.setdefault(params, []).append(index)
+        
+        for (cipher_type, mode, params), indexes in groups.items():
+            try:
+                processor = CipherUtils.get_processor(cipher_type, mode, **dict(params))
+            except Exception as e:
+                for index in indexes:
+                    results[index] = {'success': False, 'error': str(e)}
+                continue
+            
+            for index in indexes:
+                try:
+                    result = processor(items[index].get('text', ''))
+                    results[index] = {'success': True, 'result': result}
+                except Exception as e:
+                    results[index] = {'success': False, 'error': str(e)}
+        
+        return results
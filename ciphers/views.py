@@ -1,13 +1,24 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.http import parse_header_parameters
+import codecs
 import json
 from .utils import CipherUtils
+from . import buffers, cryptanalysis
+from .registry import cipher_names
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.decorators import api_view
-from .serializers import CipherRequestSerializer, CipherResponseSerializer
+from django.conf import settings
+from .serializers import (
+    CipherRequestSerializer, CipherResponseSerializer,
+    CipherBatchRequestSerializer, CipherBatchResponseSerializer,
+    CrackRequestSerializer, CrackResponseSerializer,
+)
 
 
 @login_required
@@ -19,7 +30,7 @@ def cipher_tools_view(request):
 @swagger_auto_schema(
     method='post',
     request_body=CipherRequestSerializer,
-    operation_description="Process text with specified cipher algorithm",
+    operation_description="Process text with specified cipher algorithm, or with a chain of ciphers given as steps",
     responses={
         200: CipherResponseSerializer,
         400: "Bad Request",
@@ -42,6 +53,18 @@ def process_cipher(request):
             # Additional parameters
             shift = data.get('shift', 3)
             key = data.get('key', 'KEY')
+            steps = data.get('steps')
+            
+            if steps:
+                # Chain of ciphers, fused into a single pass
+                result = CipherUtils.process_pipeline(text, steps)
+                return JsonResponse({
+                    'success': True,
+                    'result': result,
+                    'original': text,
+                    'cipher_type': 'pipeline',
+                    'steps': steps
+                })
             
             # Process the text
             result = CipherUtils.process_text(
@@ -67,3 +90,224 @@ def process_cipher(request):
             })
     
     return JsonResponse({'success': False, 'error': 'Method not allowed'})
+
+
+@swagger_auto_schema(
+    method='post',
+    request_body=CipherBatchRequestSerializer,
+    operation_description="Process many texts in one request; results are returned in the same order as the items",
+    responses={
+        200: CipherBatchResponseSerializer,
+        400: "Bad Request",
+        500: "Internal Server Error"
+    },
+    tags=['ciphers']
+)
+@api_view(['POST'])
+@login_required
+@csrf_exempt
+def process_cipher_batch(request):
+    """API endpoint to process a batch of cipher requests"""
+    try:
+        data = json.loads(request.body)
+        # Accept both {"items": [...]} and a bare array
+        items = data.get('items', []) if isinstance(data, dict) else data
+        
+        if not isinstance(items, list):
+            return JsonResponse({
+                'success': False,
+                'error': 'items must be a list'
+            })
+        
+        max_items = settings.CIPHER_BATCH_MAX_ITEMS
+        if len(items) > max_items:
+            return JsonResponse({
+                'success': False,
+                'error': f'Too many items (maximum is {max_items})'
+            })
+        
+        results = CipherUtils.process_batch(items)
+        
+        return JsonResponse({
+            'success': True,
+            'count': len(results),
+            'results': results
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+
+
+def _stream_cipher(request, processor, encoding):
+    """Read the request body chunk by chunk and yield the processed chunks"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='surrogateescape')
+    # One encoder for the whole response, so encodings with a BOM (utf-16,
+    # utf-8-sig) write it once rather than before every chunk
+    encoder = codecs.getincrementalencoder(encoding)(errors='surrogateescape')
+    chunk_size = settings.CIPHER_STREAM_CHUNK_SIZE
+    
+    while True:
+        data = request.read(chunk_size)
+        # The decoder holds back incomplete multi-byte characters until
+        # the next chunk arrives
+        text = decoder.decode(data, final=not data)
+        output = encoder.encode(processor(text) if text else '', final=not data)
+        if output:
+            yield output
+        if not data:
+            break
+
+
+async def _async_chunks(chunks):
+    """Yield the chunks of a sync iterator, each one pulled on the sync thread"""
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def _stream_bytes(request, cipher):
+    """Read a binary body chunk by chunk and yield the enciphered chunks"""
+    chunk_size = settings.CIPHER_STREAM_CHUNK_SIZE
+    # One output buffer reused for every chunk; each yielded view is copied
+    # out by the response before the next chunk is read
+    output = memoryview(bytearray(chunk_size))
+    position = 0
+    
+    while True:
+        data = request.read(chunk_size)
+        if not data:
+            break
+        chunk = output[:len(data)]
+        position += cipher.into(data, chunk, position)
+        yield chunk
+
+
+@swagger_auto_schema(
+    method='post',
+    manual_parameters=[
+        openapi.Parameter('cipher_type', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          enum=cipher_names(), default='caesar',
+                          description="Type of cipher to use"),
+        openapi.Parameter('mode', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          enum=['encrypt', 'decrypt'], default='encrypt',
+                          description="Whether to encrypt or decrypt the text"),
+        openapi.Parameter('shift', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=3,
+                          description="Shift value for Caesar cipher"),
+        openapi.Parameter('key', openapi.IN_QUERY, type=openapi.TYPE_STRING, default='KEY',
+                          description="Key for Vigenere cipher"),
+    ],
+    operation_description=(
+        "Process a raw text/plain or application/octet-stream body chunk by chunk "
+        "and stream the result back in the same content type"
+    ),
+    responses={
+        200: "Processed body",
+        400: "Bad Request",
+        500: "Internal Server Error"
+    },
+    tags=['ciphers']
+)
+@api_view(['POST'])
+@login_required
+@csrf_exempt
+def process_cipher_stream(request):
+    """
+    API endpoint to process a large raw body without holding it in memory
+
+    Under ASGI the processed chunks are served through an async iterator:
+    Django's ASGI handler would otherwise read a sync iterator to the end
+    and hold the whole response in memory before sending any of it. (The
+    ASGI handler still spools the request body to a temporary file before
+    the view runs.)
+    """
+    content_type, content_params = parse_header_parameters(request.META.get('CONTENT_TYPE', ''))
+    if content_type not in ('text/plain', 'application/octet-stream'):
+        return JsonResponse({
+            'success': False,
+            'error': 'Content-Type must be text/plain or application/octet-stream'
+        })
+    
+    try:
+        params = {
+            'cipher_type': request.GET.get('cipher_type', 'caesar'),
+            'mode': request.GET.get('mode', 'encrypt'),
+            'shift': int(request.GET.get('shift', 3)),
+            'key': request.GET.get('key', 'KEY'),
+        }
+        if content_type == 'application/octet-stream':
+            # Processed as bytes: ASCII letters are enciphered, every other
+            # byte is left untouched
+            content = _stream_bytes(request, buffers.get_buffer_cipher(**params))
+        else:
+            encoding = content_params.get('charset', 'utf-8')
+            codecs.lookup(encoding)
+            content = _stream_cipher(request, CipherUtils.get_stream_processor(**params), encoding)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+    
+    # api_view wraps the request; the handler's own request tells ASGI apart
+    if isinstance(request._request, ASGIRequest):
+        content = _async_chunks(content)
+    return StreamingHttpResponse(content, content_type=request.META.get('CONTENT_TYPE'))
+
+
+@swagger_auto_schema(
+    method='post',
+    request_body=CrackRequestSerializer,
+    operation_description="Recover the plaintext of a Caesar or Vigenere ciphertext without knowing the key",
+    responses={
+        200: CrackResponseSerializer,
+        400: "Bad Request",
+        500: "Internal Server Error"
+    },
+    tags=['ciphers']
+)
+@api_view(['POST'])
+@login_required
+@csrf_exempt
+def crack_cipher(request):
+    """API endpoint to crack a ciphertext with an unknown key"""
+    try:
+        data = json.loads(request.body)
+        text = data.get('text', '')
+        cipher_type = data.get('cipher_type', 'caesar')
+        max_key_length = int(data.get('max_key_length', 20))
+        top = int(data.get('top', 5))
+        
+        candidates = cryptanalysis.crack(
+            text=text,
+            cipher_type=cipher_type,
+            max_key_length=max_key_length,
+            top=top
+        )
+        
+        # Decrypt the whole text with the best candidate only
+        result = text
+        if candidates:
+            best = candidates[0]
+            result = CipherUtils.process_text(
+                text=text,
+                cipher_type=cipher_type,
+                mode='decrypt',
+                shift=best.get('shift', 0),
+                key=best.get('key', '')
+            )
+        
+        return JsonResponse({
+            'success': True,
+            'result': result,
+            'candidates': candidates,
+            'cipher_type': cipher_type
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class JokesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'jokes'
+
+    def ready(self):
+        from . import checks  # noqa: F401
@@ -0,0 +1,184 @@
+"""
+Local buffer of prefetched jokes
+
+Request paths and tasks take jokes from a bounded FIFO kept in Django's
+cache instead of calling the joke source themselves; the refill_joke_buffer
+task keeps it filled. The FIFO is a ring of cache keys indexed by two
+counters (head and tail), so a pop is a constant number of cache operations.
+With a shared cache (CACHE_URL) the buffer is shared by every web and Celery
+process.
+
+A joke isn't buffered twice: a hash of its text is remembered while it is
+in the buffer. Refills make at most JOKE_REFILL_MAX_FETCHES calls to the
+source, and once the source has nothing new (a small corpus that is all
+buffered, or an outage) the following refills are skipped for
+JOKE_REFILL_BACKOFF seconds, doubled on every fruitless run up to an hour,
+so the refill task stays well within the source's rate limit.
+
+When the buffer is empty the source is called directly, as happens on every
+request of a web process when the cache is local to each process (no
+CACHE_URL) and only the Celery worker's buffer gets refilled. The last joke
+handed out is kept without expiry and served again when the source fails,
+so an outage of the source doesn't reach the request paths.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import qr
+from . import variants as joke_variants
+from .sources import JokeSourceError, content_hash, get_source
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'jokes:buffer'
+HEAD_KEY = f'{KEY_PREFIX}:head'
+TAIL_KEY = f'{KEY_PREFIX}:tail'
+STALE_KEY = f'{KEY_PREFIX}:stale'
+# Refill runs in a row that added nothing, and the marker skipping refills
+IDLE_KEY = f'{KEY_PREFIX}:idle'
+BACKOFF_KEY = f'{KEY_PREFIX}:backoff'
+
+# Longest pause of the refills, in seconds
+MAX_BACKOFF = 60 * 60
+
+# Buffered jokes that are never popped (lost in a race) expire after this
+ITEM_TIMEOUT = 24 * 60 * 60
+
+
+def _item_key(index):
+    return f'{KEY_PREFIX}:item:{index}'
+
+
+def _seen_key(digest):
+    return f'{KEY_PREFIX}:seen:{digest}'
+
+
+def _incr(key, delta=1):
+    # incr() fails on a missing key, and add() is a no-op on an existing one
+    cache.add(key, 0, None)
+    return cache.incr(key, delta)
+
+
+def size():
+    """Number of jokes waiting in the buffer"""
+    return max(0, cache.get(TAIL_KEY, 0) - cache.get(HEAD_KEY, 0))
+
+
+def push(joke):
+    """
+    Add a joke to the buffer
+
+    Returns False when the buffer is full or already holds the joke.
+    """
+    if size() >= settings.JOKE_BUFFER_SIZE:
+        return False
+    if not cache.add(_seen_key(content_hash(joke)), True, ITEM_TIMEOUT):
+        return False
+    index = _incr(TAIL_KEY) - 1
+    cache.set(_item_key(index), joke, ITEM_TIMEOUT)
+    cache.add(STALE_KEY, joke, None)
+    return True
+
+
+def pop():
+    """Take the oldest joke from the buffer, or return None if it is empty"""
+    tail = cache.get(TAIL_KEY, 0)
+    while cache.get(HEAD_KEY, 0) < tail:
+        index = _incr(HEAD_KEY) - 1
+        if index >= tail:
+            # Another process took the last joke first
+            cache.decr(HEAD_KEY)
+            break
+        joke = cache.get(_item_key(index))
+        cache.delete(_item_key(index))
+        if joke is not None:
+            # The joke may be buffered again once it has left the buffer
+            cache.delete(_seen_key(content_hash(joke)))
+            cache.set(STALE_KEY, joke, None)
+            return joke
+    return None
+
+
+def get_joke():
+    """
+    Return a joke without waiting on the joke source when possible
+
+    Calls the source when the buffer is empty, and falls back to the last
+    joke handed out when the source fails.
+    """
+    joke = pop()
+    if joke is not None:
+        return joke
+    try:
+        joke = get_source()()
+    except JokeSourceError as e:
+        joke = cache.get(STALE_KEY)
+        if joke is None:
+            raise
+        logger.warning(f"Joke buffer is empty and the source failed, serving a stale joke: {str(e)}")
+        return joke
+    cache.set(STALE_KEY, joke, None)
+    return joke
+
+
+def refill(limit=None, store=False):
+    """
+    Fetch jokes from the source until the buffer is full
+
+    Makes at most ``limit`` fetches (by default JOKE_REFILL_MAX_FETCHES) and
+    stops at the first source error. With ``store`` the new jokes are also
+    saved to the local corpus (Joke). A run that fetches without adding a
+    joke pauses the refills, see the module docstring. Returns the number of
+    jokes added.
+    """
+    if cache.get(BACKOFF_KEY):
+        return 0
+    if limit is None:
+        limit = settings.JOKE_REFILL_MAX_FETCHES
+    source = get_source()
+    fetches = 0
+    added = []
+    for _ in range(limit):
+        if size() >= settings.JOKE_BUFFER_SIZE:
+            break
+        fetches += 1
+        try:
+            joke = source()
+        except (JokeSourceError, OSError, ValueError) as e:
+            logger.error(f"Joke source failed while refilling the buffer: {str(e)}")
+            break
+        # Cipher variants are computed here, off the request path
+        joke_variants.materialize(joke)
+        if push(joke):
+            added.append(joke)
+    if added:
+        cache.delete(IDLE_KEY)
+    elif fetches:
+        _back_off()
+    if added and settings.QR_CACHE_BACKEND:
+        # The QR images land in the shared cache tier for the web processes
+        qr.prerender([text for joke in added for text in joke_variants.qr_texts(joke).values()])
+    if store and added:
+        from .models import Joke
+        Joke.objects.ingest(added, source=settings.JOKE_SOURCE.rsplit('.', 1)[-1])
+    return len(added)
+
+
+def _back_off():
+    idle = _incr(IDLE_KEY)
+    delay = min(settings.JOKE_REFILL_BACKOFF * 2 ** (idle - 1), MAX_BACKOFF)
+    if delay > 0:
+        cache.set(BACKOFF_KEY, True, delay)
+        logger.warning(f"Joke source gave no new joke, refills paused for {delay}s")
+
+
+def clear():
+    """Empty the buffer (the stale joke is kept) and resume the refills"""
+    head = cache.get(HEAD_KEY, 0)
+    tail = cache.get(TAIL_KEY, 0)
+    keys = [_item_key(index) for index in range(head, tail)]
+    jokes = cache.get_many(keys).values()
+    cache.delete_many(keys + [_seen_key(content_hash(joke)) for joke in jokes] + [IDLE_KEY, BACKOFF_KEY])
+    cache.set(HEAD_KEY, tail, None)
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends whose data lives in a single process
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_buffer(app_configs, **kwargs):
+    """The joke buffer is filled by Celery, so web processes must share its cache"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            "The joke buffer is kept in a per-process cache, so web processes "
+            "never see the jokes the Celery worker prefetches and call the "
+            "joke source on every request.",
+            hint="Set CACHE_URL to a Redis cache shared by the web and Celery processes.",
+            obj=backend,
+            id='jokes.W001',
+        )
+    ]
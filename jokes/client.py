@@ -0,0 +1,202 @@
+"""
+Shared HTTP client for JokeAPI
+
+One client per process holds a pooled requests.Session (keep-alive
+connections), so fetching jokes doesn't open a new connection every time.
+Every request has connect and read timeouts and is retried with jittered
+exponential backoff on connection errors, timeouts, 429 and 5xx responses.
+
+A circuit breaker fails fast instead of waiting on an upstream that is down:
+after JOKEAPI_BREAKER_THRESHOLD consecutive failed calls it opens for
+JOKEAPI_BREAKER_RESET seconds, then lets one trial call through.
+
+Call counts and latencies are kept per outcome; see stats().
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .sources import JokeSourceError
+
+# Responses worth retrying; other errors won't change on a second try
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+OUTCOMES = ('success', 'http_error', 'timeout', 'connection_error', 'circuit_open')
+
+
+class CircuitOpenError(JokeSourceError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class _RetryableError(Exception):
+    def __init__(self, outcome, message):
+        super().__init__(message)
+        self.outcome = outcome
+
+
+class JokeAPIClient:
+    """Pooled session with timeouts, retries, a circuit breaker and counters"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.JOKEAPI_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.timeout = (settings.JOKEAPI_CONNECT_TIMEOUT, settings.JOKEAPI_READ_TIMEOUT)
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._counts = dict.fromkeys(OUTCOMES, 0)
+        self._latency = dict.fromkeys(OUTCOMES, 0.0)
+        self._max_latency = dict.fromkeys(OUTCOMES, 0.0)
+
+    def get_json(self, url):
+        """
+        GET a URL and return the decoded JSON body
+
+        Raises CircuitOpenError when the breaker is open and JokeSourceError
+        once the retries are used up.
+        """
+        if not self._allow():
+            self._record('circuit_open', 0.0)
+            raise CircuitOpenError("JokeAPI circuit breaker is open")
+
+        attempts = settings.JOKEAPI_RETRIES + 1
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                data = self._get(url)
+            except _RetryableError as e:
+                self._record(e.outcome, time.perf_counter() - started)
+                if attempt + 1 == attempts:
+                    self._failed()
+                    raise JokeSourceError(f"JokeAPI request failed after {attempts} attempts: {e}")
+                self._sleep(attempt)
+            except JokeSourceError:
+                self._record('http_error', time.perf_counter() - started)
+                self._failed()
+                raise
+            else:
+                self._record('success', time.perf_counter() - started)
+                self._succeeded()
+                return data
+
+    def _get(self, url):
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.Timeout as e:
+            raise _RetryableError('timeout', str(e))
+        except requests.ConnectionError as e:
+            raise _RetryableError('connection_error', str(e))
+        except requests.RequestException as e:
+            raise JokeSourceError(f"JokeAPI request failed: {e}")
+        if response.status_code in RETRY_STATUSES:
+            raise _RetryableError('http_error', f"HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise JokeSourceError(f"JokeAPI returned HTTP {response.status_code}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise JokeSourceError(f"JokeAPI returned invalid JSON: {e}")
+
+    @staticmethod
+    def _sleep(attempt):
+        # Full jitter: a random wait up to the exponential backoff
+        backoff = settings.JOKEAPI_BACKOFF * (2 ** attempt)
+        time.sleep(random.uniform(0, backoff))
+
+    def _allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < settings.JOKEAPI_BREAKER_RESET or self._trial_running:
+                return False
+            # Half-open: let a single trial call decide
+            self._trial_running = True
+            return True
+
+    def _failed(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= settings.JOKEAPI_BREAKER_THRESHOLD:
+                self._opened_at = time.monotonic()
+
+    def _succeeded(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def _record(self, outcome, latency):
+        with self._lock:
+            self._counts[outcome] += 1
+            self._latency[outcome] += latency
+            self._max_latency[outcome] = max(self._max_latency[outcome], latency)
+
+    def stats(self):
+        """Return the breaker state and count/latency per outcome"""
+        with self._lock:
+            if self._opened_at is None:
+                state = 'closed'
+            elif time.monotonic() - self._opened_at < settings.JOKEAPI_BREAKER_RESET:
+                state = 'open'
+            else:
+                state = 'half_open'
+            return {
+                'circuit': state,
+                'consecutive_failures': self._failures,
+                'outcomes': {
+                    outcome: {
+                        'count': self._counts[outcome],
+                        'mean_latency_ms': round(1000 * self._latency[outcome] / self._counts[outcome], 3)
+                        if self._counts[outcome] else 0.0,
+                        'max_latency_ms': round(1000 * self._max_latency[outcome], 3),
+                    }
+                    for outcome in OUTCOMES
+                },
+            }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return this process's shared client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = JokeAPIClient()
+    return _client
+
+
+def reset_client():
+    """Drop the shared client (its pooled connections are closed)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def stats():
+    """Counters of this process's shared client"""
+    return get_client().stats()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Pooled sockets must not be shared with forked workers (gunicorn, Celery
+    # prefork); the child builds its own client on first use
+    os.register_at_fork(after_in_child=lambda: globals().update(_client=None, _client_lock=threading.Lock()))
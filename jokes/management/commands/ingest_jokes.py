@@ -0,0 +1,116 @@
+"""
+Load jokes into the local corpus from JSON or JSON lines dumps
+
+Each entry is a joke in JokeAPI's format or a plain string. A dump is either
+one JSON document (a list of jokes, or a JokeAPI response with a "jokes"
+list) or one of those per line; JSON lines are streamed, so dumps larger than
+memory can be loaded. Jokes are inserted in batches with
+bulk_create(ignore_conflicts=True), and jokes already stored (same content
+hash) are skipped.
+
+The cipher variants of the jokes (see jokes.variants) are computed as they
+are loaded; --refresh-variants recomputes those of stored jokes after the
+default shift or key changed.
+
+Loaded jokes are added to the search index (see jokes.search) as they are
+stored; --reindex rebuilds the index from scratch.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jokes import search
+from jokes.models import Joke
+from jokes.sources import JokeSourceError, normalize_joke
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load jokes from JSON or JSON lines files into the local corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='JSON or JSON lines files')
+        parser.add_argument('--source', default='dump', help='Source name stored with the jokes')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Jokes per INSERT')
+        parser.add_argument('--refresh-variants', action='store_true',
+                            help='Recompute outdated cipher variants of stored jokes')
+        parser.add_argument('--reindex', action='store_true',
+                            help='Rebuild the search index of stored jokes')
+
+    def handle(self, *args, **options):
+        if not (options['paths'] or options['refresh_variants'] or options['reindex']):
+            raise CommandError("Give files to load, --refresh-variants or --reindex")
+        started = time.perf_counter()
+        self.skipped = 0
+        added = 0
+        for path in options['paths']:
+            try:
+                added += Joke.objects.ingest(
+                    self._read(path), source=options['source'], batch_size=options['batch_size']
+                )
+            except OSError as e:
+                raise CommandError(str(e))
+
+        if options['refresh_variants']:
+            updated = Joke.objects.refresh_variants(options['batch_size'])
+            self.stdout.write(f"Recomputed the cipher variants of {updated} jokes")
+
+        if options['reindex']:
+            indexed = search.rebuild(options['batch_size'])
+            self.stdout.write(f"Indexed {indexed} jokes for search")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {added} jokes in {elapsed:.2f}s "
+            f"({self.skipped} invalid entries skipped, {Joke.objects.count()} stored)"
+        ))
+
+    def _read(self, path):
+        """Yield the valid jokes of a file, normalised"""
+        with open(path, encoding='utf-8') as f:
+            if self._is_json_lines(f):
+                entries = self._parse_lines(f, path)
+            else:
+                try:
+                    entries = [json.load(f)]
+                except ValueError as e:
+                    raise CommandError(f"{path}: {e}")
+            for entry in entries:
+                for joke in self._expand(entry):
+                    try:
+                        yield normalize_joke(joke)
+                    except (JokeSourceError, AttributeError):
+                        self.skipped += 1
+
+    @staticmethod
+    def _expand(entry):
+        """The jokes of a document: a list, a JokeAPI response or one joke"""
+        if isinstance(entry, list):
+            return entry
+        if isinstance(entry, dict) and isinstance(entry.get('jokes'), list):
+            return entry['jokes']
+        return [entry]
+
+    @staticmethod
+    def _is_json_lines(f):
+        # A complete document on the first line: JSON lines, or a compact
+        # JSON file, which is read the same way
+        line = f.readline()
+        while line and not line.strip():
+            line = f.readline()
+        f.seek(0)
+        try:
+            json.loads(line)
+        except ValueError:
+            return False
+        return True
+
+    def _parse_lines(self, f, path):
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                self.skipped += 1
+                self.stderr.write(f"{path}:{number}: skipping invalid line: {e}")
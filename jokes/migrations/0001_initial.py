@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-17 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Joke',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('setup', models.TextField(blank=True)),
+                ('delivery', models.TextField(blank=True)),
+                ('category', models.CharField(default='Unknown', max_length=50)),
+                ('joke_type', models.CharField(choices=[('single', 'Single'), ('twopart', 'Two-part')], default='single', max_length=10)),
+                ('source', models.CharField(blank=True, max_length=50)),
+                ('source_id', models.CharField(blank=True, max_length=64)),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Joke',
+                'verbose_name_plural': 'Jokes',
+                'db_table': 'jokes',
+                'indexes': [models.Index(fields=['category', 'id'], name='jokes_category_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jokes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='joke',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
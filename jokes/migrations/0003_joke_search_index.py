@@ -0,0 +1,45 @@
+# Generated by Django 4.2.16 on 2026-10-17 13:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jokes', '0002_joke_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JokeTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, unique=True)),
+            ],
+            options={
+                'db_table': 'joke_terms',
+            },
+        ),
+        migrations.AddField(
+            model_name='joke',
+            name='indexed',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.CreateModel(
+            name='JokePosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveSmallIntegerField(default=1)),
+                ('joke', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='jokes.joke')),
+                ('term', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='jokes.joketerm')),
+            ],
+            options={
+                'db_table': 'joke_postings',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='jokeposting',
+            constraint=models.UniqueConstraint(fields=('term', 'joke'), name='joke_postings_term_joke_uniq'),
+        ),
+    ]
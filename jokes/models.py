@@ -1,3 +1,162 @@
+import random
+
 from django.db import models
 
-# Create your models here.
+from . import variants as joke_variants
+from .sources import content_hash, format_joke
+
+
+class JokeManager(models.Manager):
+    """Manager with bulk ingestion and an indexed random pick"""
+
+    def random(self, category=None):
+        """
+        Return a random joke, or None if there is none
+
+        Picks a random id between the smallest and largest one and takes the
+        first joke at or after it, so the query only walks the primary key
+        index instead of sorting the table (ORDER BY RAND()). Jokes after
+        gaps in the ids are slightly more likely to be picked.
+        """
+        queryset = self.get_queryset()
+        if category:
+            queryset = queryset.filter(category=category)
+        bounds = queryset.aggregate(low=models.Min('id'), high=models.Max('id'))
+        if bounds['low'] is None:
+            return None
+        pivot = random.randint(bounds['low'], bounds['high'])
+        return queryset.filter(id__gte=pivot).order_by('id').first()
+
+    def ingest(self, jokes, source='', batch_size=1000):
+        """
+        Store jokes (dicts in JokeAPI's format) in batches
+
+        Jokes already stored (same content hash) are skipped. Returns the
+        number of jokes added.
+        """
+        before = self.count()
+        batch = []
+        for joke in jokes:
+            batch.append(self.model.from_dict(joke, source))
+            if len(batch) >= batch_size:
+                self.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            self.bulk_create(batch, ignore_conflicts=True)
+        from .search import index_pending
+        index_pending(batch_size)
+        return self.count() - before
+
+    def refresh_variants(self, batch_size=1000):
+        """
+        Recompute the cipher variants computed with other settings
+
+        Returns the number of jokes updated.
+        """
+        outdated = self.get_queryset().exclude(variants__version=joke_variants.version())
+        updated = 0
+        batch = []
+        for joke in outdated.iterator(chunk_size=batch_size):
+            joke.variants = joke_variants.compute(joke.to_dict())
+            batch.append(joke)
+            if len(batch) >= batch_size:
+                updated += self.bulk_update(batch, ['variants'])
+                batch = []
+        if batch:
+            updated += self.bulk_update(batch, ['variants'])
+        return updated
+
+
+class Joke(models.Model):
+    """A joke stored locally, from JokeAPI or an ingested dump"""
+    TYPE_CHOICES = [
+        ('single', 'Single'),
+        ('twopart', 'Two-part'),
+    ]
+
+    text = models.TextField()
+    setup = models.TextField(blank=True)
+    delivery = models.TextField(blank=True)
+    category = models.CharField(max_length=50, default='Unknown')
+    joke_type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='single')
+    source = models.CharField(max_length=50, blank=True)
+    source_id = models.CharField(max_length=64, blank=True)
+    content_hash = models.CharField(max_length=64, unique=True)
+    # Cipher variants and SMS text, see jokes.variants
+    variants = models.JSONField(default=dict, blank=True)
+    # Set once the joke's postings are in the search index
+    indexed = models.BooleanField(default=False, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = JokeManager()
+
+    def __str__(self):
+        return self.text[:50]
+
+    @classmethod
+    def from_dict(cls, joke, source=''):
+        """Build an unsaved Joke from a dict in JokeAPI's format"""
+        joke_type = 'single' if joke.get('type') == 'single' else 'twopart'
+        return cls(
+            text=format_joke(joke),
+            setup=joke.get('setup', '') if joke_type == 'twopart' else '',
+            delivery=joke.get('delivery', '') if joke_type == 'twopart' else '',
+            category=joke.get('category') or 'Unknown',
+            joke_type=joke_type,
+            source=source,
+            source_id=str(joke.get('id', '')),
+            content_hash=content_hash(joke),
+            variants=joke_variants.materialize(joke),
+        )
+
+    def to_dict(self):
+        """Return the joke in JokeAPI's format, as the joke sources do"""
+        joke = {'id': self.source_id or self.id, 'type': self.joke_type, 'category': self.category}
+        if self.joke_type == 'single':
+            joke['joke'] = self.text
+        else:
+            joke['setup'] = self.setup
+            joke['delivery'] = self.delivery
+        if self.variants:
+            joke['variants'] = self.variants
+        return joke
+
+    def current_variants(self):
+        """Return the cipher variants, recomputing and saving them if outdated"""
+        if not joke_variants.is_current(self.variants):
+            self.variants = joke_variants.compute(self.to_dict())
+            self.save(update_fields=['variants'])
+        return self.variants
+
+    class Meta:
+        db_table = 'jokes'
+        verbose_name = 'Joke'
+        verbose_name_plural = 'Jokes'
+        indexes = [
+            models.Index(fields=['category', 'id'], name='jokes_category_id_idx'),
+        ]
+
+
+class JokeTerm(models.Model):
+    """A term of the search index, see jokes.search"""
+    term = models.CharField(max_length=64, unique=True)
+
+    def __str__(self):
+        return self.term
+
+    class Meta:
+        db_table = 'joke_terms'
+
+
+class JokePosting(models.Model):
+    """An occurrence of a term in a joke: a row of integers only"""
+    term = models.ForeignKey(JokeTerm, on_delete=models.CASCADE, db_index=False)
+    joke = models.ForeignKey(Joke, on_delete=models.CASCADE)
+    count = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        db_table = 'joke_postings'
+        constraints = [
+            # Also the index postings lists are read with, ordered by joke
+            models.UniqueConstraint(fields=['term', 'joke'], name='joke_postings_term_joke_uniq'),
+        ]
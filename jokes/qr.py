@@ -0,0 +1,359 @@
+"""
+QR code rendering with a content-addressed cache
+
+A QR image depends only on its data and rendering options, so images are
+cached under a hash of (data, error correction, box size, border) plus the
+image format. The first tier is a per-process LRU bounded by the total size
+of the images it holds; the optional second tier is a Django cache
+(QR_CACHE_BACKEND, e.g. 'default' with CACHE_URL set) shared by every
+process. Rendering the same joke or cipher variant again is a dictionary
+lookup. Secrets such as 2FA provisioning URIs are rendered with
+``use_cache=False`` and never reach either tier.
+
+qr_url() makes a QR code available by URL (/jokes/qr/<token>.<format>): the
+token is the data and options signed with SECRET_KEY, so any process can
+render the image when the URL is requested, with no shared state and after a
+restart. Only signed QR codes are served; changing SECRET_KEY invalidates
+the URLs handed out before.
+
+Several QR codes are rendered concurrently by get_qr_many() and prerender()
+on a pool shared by the whole process and bounded by QR_RENDER_WORKERS, so a
+burst of requests queues instead of oversubscribing the CPU. PNG encoding
+(zlib) releases the GIL, so threads help; building the module matrix is pure
+Python, and QR_RENDER_PROCESSES moves the whole render to a process pool.
+
+Two rendering backends produce the same pixels: 'pil' goes through qrcode's
+image factories, 'raster' (jokes.qr_raster) writes the 1-bit PNG or SVG path
+straight from the module matrix. Building the matrix dominates a render, so
+end to end 'raster' is only about 1.2-1.5x faster; its PNGs are about 25%
+smaller and its SVGs about half the size. QR_RENDER_BACKEND picks the
+default; every function takes ``backend``.
+"""
+import base64
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.urls import reverse
+
+from . import qr_raster
+
+ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+IMAGE_FORMATS = ('png', 'svg')
+
+BACKENDS = ('pil', 'raster')
+
+# Salt of the QR URL tokens, so no other signed value can pass for one
+TOKEN_SALT = 'jokes.qr'
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def _options(error_correction, box_size, border, backend):
+    """Rendering options as passed to render_qr(), with the backend resolved"""
+    return {
+        'error_correction': error_correction,
+        'box_size': box_size,
+        'border': border,
+        'backend': backend or settings.QR_RENDER_BACKEND,
+    }
+
+
+def qr_digest(data, error_correction='L', box_size=10, border=4, backend='pil'):
+    """Hash identifying a QR code: its data and every rendering option"""
+    spec = json.dumps([data, error_correction, box_size, border, backend], ensure_ascii=False)
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()
+
+
+def render_qr(data, error_correction='L', box_size=10, border=4, image_format='png', backend='pil'):
+    """Render a QR code without the cache and return the image bytes"""
+    if error_correction not in ERROR_CORRECTION:
+        raise ValueError(f"Unknown error correction level: {error_correction}")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown QR backend: {backend}")
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    if backend == 'raster':
+        matrix = qr.get_matrix()
+        if image_format == 'svg':
+            return qr_raster.svg(matrix, box_size)
+        return qr_raster.png(matrix, box_size)
+
+    buffer = BytesIO()
+    if image_format == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRCache:
+    """
+    Two-tier cache of rendered QR images keyed by digest and format
+
+    ``max_bytes`` bounds the images kept in memory; the least recently used
+    ones are evicted first. ``backend`` is an optional Django cache used as
+    a second, shared tier.
+    """
+
+    def __init__(self, max_bytes, backend=None, timeout=None):
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counts = {'memory_hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """Return the cached image, or None"""
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self._counts['memory_hits'] += 1
+                return image
+        if self.backend is not None:
+            image = self.backend.get(f'qr:{key}')
+            if image is not None:
+                self._remember(key, image)
+                with self._lock:
+                    self._counts['shared_hits'] += 1
+                return image
+        with self._lock:
+            self._counts['misses'] += 1
+        return None
+
+    def set(self, key, image):
+        """Store an image in both tiers"""
+        self._remember(key, image)
+        if self.backend is not None:
+            self.backend.set(f'qr:{key}', image, self.timeout)
+
+    def _remember(self, key, image):
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = image
+            self._bytes += len(image)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counts['evictions'] += 1
+
+    def get_or_render(self, key, render):
+        """Return the cached image for ``key``, calling ``render()`` on a miss"""
+        image = self.get(key)
+        if image is None:
+            image = render()
+            self.set(key, image)
+        return image
+
+    def stats(self):
+        """Hit/miss/eviction counters and the size of the memory tier"""
+        with self._lock:
+            lookups = self._counts['memory_hits'] + self._counts['shared_hits'] + self._counts['misses']
+            hits = lookups - self._counts['misses']
+            return {
+                **self._counts,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        """Empty the memory tier and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._counts = dict.fromkeys(self._counts, 0)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return this process's QR cache, built from the QR_CACHE_* settings"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = caches[settings.QR_CACHE_BACKEND] if settings.QR_CACHE_BACKEND else None
+                _cache = QRCache(settings.QR_CACHE_MAX_BYTES, backend, settings.QR_CACHE_TIMEOUT)
+    return _cache
+
+
+def get_qr(data, error_correction='L', box_size=10, border=4, image_format='png', backend=None, use_cache=True):
+    """
+    Return the image bytes of a QR code, rendering it only on a cache miss
+
+    With ``use_cache=False`` the cache is neither read nor written, for data
+    that must not be kept, such as 2FA secrets.
+    """
+    options = _options(error_correction, box_size, border, backend)
+    if not use_cache:
+        return render_qr(data, image_format=image_format, **options)
+    key = f'{qr_digest(data, **options)}.{image_format}'
+    return get_cache().get_or_render(key, lambda: render_qr(data, image_format=image_format, **options))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide pool QR codes are rendered on"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if settings.QR_RENDER_PROCESSES:
+                    _executor = ProcessPoolExecutor(max_workers=settings.QR_RENDER_PROCESSES)
+                else:
+                    _executor = ThreadPoolExecutor(
+                        max_workers=settings.QR_RENDER_WORKERS,
+                        thread_name_prefix='qr-render'
+                    )
+    return _executor
+
+
+def _store(key, future):
+    if future.exception() is None:
+        get_cache().set(key, future.result())
+
+
+def _submit_missing(texts, image_format, options):
+    """
+    Start rendering the texts whose images aren't cached
+
+    Returns (cache keys, cached images or None, {key: future}). Each future
+    stores its image in the cache when it completes.
+    """
+    qr_cache = get_cache()
+    keys = [f'{qr_digest(text, **options)}.{image_format}' for text in texts]
+    images = [qr_cache.get(key) for key in keys]
+    futures = {}
+    for text, key, image in zip(texts, keys, images):
+        if image is None and key not in futures:
+            future = get_executor().submit(render_qr, text, image_format=image_format, **options)
+            future.add_done_callback(functools.partial(_store, key))
+            futures[key] = future
+    return keys, images, futures
+
+
+def get_qr_many(texts, error_correction='L', box_size=10, border=4, image_format='png', backend=None):
+    """
+    Return the images of several QR codes, rendering the misses concurrently
+
+    Same options and cache as get_qr(); the images are in the order of
+    ``texts``.
+    """
+    options = _options(error_correction, box_size, border, backend)
+    keys, images, futures = _submit_missing(texts, image_format, options)
+    return [
+        image if image is not None else futures[key].result()
+        for key, image in zip(keys, images)
+    ]
+
+
+def prerender(texts, error_correction='L', box_size=10, border=4, image_format='png', backend=None):
+    """Start rendering QR codes into the cache in the background"""
+    options = _options(error_correction, box_size, border, backend)
+    _submit_missing(texts, image_format, options)
+
+
+def qr_token(data, error_correction='L', box_size=10, border=4, backend=None):
+    """The signed token naming a QR code in its URL"""
+    options = _options(error_correction, box_size, border, backend)
+    spec = [data, options['error_correction'], options['box_size'], options['border'], options['backend']]
+    return signing.Signer(salt=TOKEN_SALT).sign_object(spec, compress=True)
+
+
+def _load_token(token):
+    try:
+        data, error_correction, box_size, border, backend = signing.Signer(salt=TOKEN_SALT).unsign_object(token)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return data, _options(error_correction, box_size, border, backend)
+
+
+def token_digest(token):
+    """The digest of the QR code a token names, or None if the token isn't valid"""
+    spec = _load_token(token)
+    if spec is None:
+        return None
+    data, options = spec
+    return qr_digest(data, **options)
+
+
+def get_qr_by_token(token, image_format='png'):
+    """Return the image of the QR code a token names, or None if the token isn't valid"""
+    spec = _load_token(token)
+    if spec is None:
+        return None
+    data, options = spec
+    return get_qr(data, image_format=image_format, **options)
+
+
+def qr_url(data, image_format='png', **options):
+    """Return the URL a QR code is served from"""
+    return reverse('qr_code', args=[qr_token(data, **options), image_format])
+
+
+def _data_uri(image, image_format):
+    return f"data:{CONTENT_TYPES[image_format]};base64,{base64.b64encode(image).decode()}"
+
+
+def qr_data_uri(data, **options):
+    """Return a QR code as a base64 data URI"""
+    return _data_uri(get_qr(data, **options), options.get('image_format', 'png'))
+
+
+def qr_data_uris(texts, **options):
+    """Return several QR codes as base64 data URIs, rendered concurrently"""
+    image_format = options.get('image_format', 'png')
+    return [_data_uri(image, image_format) for image in get_qr_many(texts, **options)]
+
+
+def stats():
+    """Counters of this process's QR cache"""
+    return get_cache().stats()
+
+
+if hasattr(os, 'register_at_fork'):
+    # A pool's threads don't survive fork(); forked workers start their own
+    os.register_at_fork(after_in_child=lambda: globals().update(_executor=None, _executor_lock=threading.Lock()))
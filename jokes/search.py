@@ -0,0 +1,212 @@
+"""
+Full-text search over the local joke corpus
+
+The inverted index lives in two tables that work on every database Django
+supports, without a search server: JokeTerm gives each term an integer id,
+and JokePosting holds one (term, joke, count) row of integers per term of a
+joke. Postings are unique on (term, joke), so the postings list of a term is
+a range scan of that index. Jokes are indexed incrementally as they are
+ingested (Joke.objects.ingest calls index_pending).
+
+Terms are case-folded and stripped of accents, so 'Café' and 'cafe' or
+'Straße' and 'strasse' are one term, as MySQL's default collation
+(utf8mb4_unicode_ci) compares them anyway. Queries are tokenized like the
+jokes. The postings lists are read rarest term
+first and intersected (AND) or merged (OR); once few candidates are left, the
+lists of the remaining terms are only read for those. The top results are
+ranked with BM25 term weights. Results are cached under keys that include a
+generation counter, bumped whenever jokes are indexed.
+"""
+import hashlib
+import heapq
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Joke, JokePosting, JokeTerm
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+MAX_TERM_LENGTH = 64
+
+STOP_WORDS = frozenset("""
+    a an and are as at be but by do does for from has have he her his i if in
+    is it its me my of on or our she so than that the their them then there
+    they this to was we were what when which who will with you your
+""".split())
+
+MODES = ('and', 'or')
+
+GENERATION_KEY = 'jokes:search:generation'
+
+# Later postings lists are read only for the candidates left by the earlier
+# ones when there are at most this many
+CANDIDATE_LOOKUP_LIMIT = 500
+
+# BM25 term frequency saturation
+K1 = 1.2
+
+
+def fold(text):
+    """Case-fold a text and strip its accents"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """The index terms of a text: folded words, stop words left out"""
+    return [
+        token for token in TOKEN_RE.findall(fold(text))
+        if token not in STOP_WORDS and len(token) <= MAX_TERM_LENGTH
+    ]
+
+
+def _term_ids(terms):
+    """
+    Map the terms that are in the index to the ids of their JokeTerm rows
+
+    The database may still compare two folded terms as equal (collations
+    ignoring more than accents and case), in which case a row comes back
+    under the other spelling; such terms are looked up one by one.
+    """
+    term_ids = dict(JokeTerm.objects.filter(term__in=terms).values_list('term', 'id'))
+    for term in terms:
+        if term not in term_ids:
+            term_id = JokeTerm.objects.filter(term=term).values_list('id', flat=True).first()
+            if term_id is not None:
+                term_ids[term] = term_id
+    return term_ids
+
+
+def _bump_generation():
+    # incr() fails on a missing key, and add() is a no-op on an existing one
+    cache.add(GENERATION_KEY, 0, None)
+    cache.incr(GENERATION_KEY)
+
+
+def index_jokes(jokes):
+    """Add the postings of saved jokes to the index"""
+    counts = {joke.id: Counter(tokenize(joke.text)) for joke in jokes}
+    if not counts:
+        return
+    terms = set().union(*counts.values())
+    with transaction.atomic():
+        JokeTerm.objects.bulk_create([JokeTerm(term=term) for term in terms], ignore_conflicts=True)
+        term_ids = _term_ids(terms)
+        postings = Counter()
+        for joke_id, joke_terms in counts.items():
+            for term, count in joke_terms.items():
+                # Terms the database merged add up under one row
+                postings[term_ids[term], joke_id] += count
+        JokePosting.objects.bulk_create(
+            [
+                JokePosting(term_id=term_id, joke_id=joke_id, count=min(count, 32767))
+                for (term_id, joke_id), count in postings.items()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        Joke.objects.filter(id__in=counts).update(indexed=True)
+    _bump_generation()
+
+
+def index_pending(batch_size=1000):
+    """Index the jokes not indexed yet; returns how many were indexed"""
+    indexed = 0
+    while True:
+        batch = list(Joke.objects.filter(indexed=False).only('id', 'text').order_by('id')[:batch_size])
+        if not batch:
+            return indexed
+        index_jokes(batch)
+        indexed += len(batch)
+
+
+def rebuild(batch_size=1000):
+    """Drop the index and index every joke again"""
+    with transaction.atomic():
+        JokePosting.objects.all().delete()
+        JokeTerm.objects.all().delete()
+        Joke.objects.update(indexed=False)
+    return index_pending(batch_size)
+
+
+def search(query, categories=(), mode='and', limit=20):
+    """
+    Return the ids and scores of the best matches of a query, best first
+
+    With mode 'and' the jokes must contain every term of the query, with
+    'or' any of them; ``categories`` restricts the results to jokes of those
+    categories. At most ``limit`` (joke id, score) pairs are returned.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    terms = sorted(set(tokenize(query)))
+    if not terms or limit < 1:
+        return []
+    categories = sorted(set(categories))
+    spec = json.dumps([cache.get(GENERATION_KEY, 0), terms, categories, mode, limit])
+    key = f"jokes:search:{hashlib.sha256(spec.encode('utf-8')).hexdigest()}"
+    results = cache.get(key)
+    if results is None:
+        results = _search(terms, categories, mode, limit)
+        cache.set(key, results, settings.JOKE_SEARCH_CACHE_TIMEOUT)
+    return results
+
+
+def _search(terms, categories, mode, limit):
+    term_ids = _term_ids(terms)
+    if not term_ids or (mode == 'and' and len(term_ids) < len(terms)):
+        return []
+    # Document frequencies over the whole corpus, for the weights and the
+    # order the postings lists are read in
+    frequencies = dict(
+        JokePosting.objects.filter(term_id__in=set(term_ids.values())).values_list('term_id').annotate(n=Count('id'))
+    )
+    if not frequencies or (mode == 'and' and len(frequencies) < len(set(term_ids.values()))):
+        return []
+    total = Joke.objects.filter(indexed=True).count()
+
+    postings = JokePosting.objects.all()
+    if categories:
+        postings = postings.filter(joke__category__in=categories)
+    scores = {}
+    for position, term_id in enumerate(sorted(frequencies, key=frequencies.get)):
+        frequency = frequencies[term_id]
+        weight = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+        term_postings = postings.filter(term_id=term_id)
+        intersect = mode == 'and' and position > 0
+        if intersect:
+            if not scores:
+                return []
+            if len(scores) <= CANDIDATE_LOOKUP_LIMIT:
+                term_postings = term_postings.filter(joke_id__in=list(scores))
+        matches = {}
+        for joke_id, count in term_postings.values_list('joke_id', 'count').iterator():
+            if intersect and joke_id not in scores:
+                continue
+            matches[joke_id] = scores.get(joke_id, 0.0) + weight * count * (K1 + 1) / (count + K1)
+        if mode == 'and':
+            scores = matches
+        else:
+            scores.update(matches)
+
+    best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+    return [(joke_id, round(score, 4)) for joke_id, score in best]
+
+
+def search_jokes(query, categories=(), mode='and', limit=20):
+    """Like search(), but return the jokes themselves with their scores"""
+    results = search(query, categories, mode, limit)
+    jokes = Joke.objects.in_bulk([joke_id for joke_id, _ in results])
+    return [
+        {'id': joke_id, 'joke': jokes[joke_id].text, 'category': jokes[joke_id].category, 'score': score}
+        for joke_id, score in results
+        if joke_id in jokes
+    ]
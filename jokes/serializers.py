@@ -10,5 +10,19 @@ class JokeResponseSerializer(serializers.Serializer):
     joke = serializers.CharField(required=False)
     category = serializers.CharField(required=False)
     encrypted = serializers.DictField(required=False)
-    qr_codes = serializers.DictField(required=False)
+    qr_codes = serializers.DictField(
+        required=False,
+        help_text="QR code image URLs per variant, or base64 data URIs with inline=true"
+    )
+    error = serializers.CharField(required=False)
+
+class JokeSearchResponseSerializer(serializers.Serializer):
+    """Serializer for joke search response"""
+    success = serializers.BooleanField()
+    count = serializers.IntegerField(required=False)
+    results = serializers.ListField(
+        child=serializers.DictField(),
+        required=False,
+        help_text="Matching jokes (id, joke, category, score), best first"
+    )
     error = serializers.CharField(required=False)
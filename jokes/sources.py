@@ -0,0 +1,123 @@
+"""
+Joke sources
+
+A joke source is a callable taking no arguments and returning one joke as a
+dict in JokeAPI's format: ``type`` ('single' or 'twopart'), ``joke`` or
+``setup``/``delivery``, ``category`` and optionally ``id``. The source used by
+the joke buffer is chosen with the JOKE_SOURCE setting (a dotted path), so a
+local file, the local database or a stub server can replace the live API.
+"""
+import functools
+import hashlib
+import json
+import logging
+import random
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Fields kept from a JokeAPI response
+JOKE_FIELDS = ('id', 'type', 'category', 'joke', 'setup', 'delivery')
+
+
+class JokeSourceError(Exception):
+    """Raised when a source can't produce a joke"""
+
+
+def normalize_joke(data):
+    """Keep the fields of a JokeAPI joke that the app uses"""
+    if isinstance(data, str):
+        joke = {'type': 'single', 'joke': data, 'category': 'Unknown'}
+    elif data.get('error'):
+        raise JokeSourceError(data.get('message') or 'Joke source returned an error')
+    else:
+        joke = {field: data[field] for field in JOKE_FIELDS if field in data}
+    if not format_joke(joke, '').strip():
+        raise JokeSourceError("Joke source returned an empty joke")
+    return joke
+
+
+def format_joke(joke, separator='\n\n'):
+    """Return the text of a joke; two-part jokes are joined with ``separator``"""
+    if joke.get('type') == 'single':
+        return joke.get('joke', '')
+    return f"{joke.get('setup', '')}{separator}{joke.get('delivery', '')}"
+
+
+def content_hash(joke):
+    """Hash identifying a joke by its text, whatever its source or id"""
+    text = ' '.join(format_joke(joke, ' ').split()).lower()
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def jokeapi_source():
+    """Fetch a random joke from JokeAPI (JOKEAPI_URL) with the shared client"""
+    # Imported here: the client module needs JokeSourceError from this one
+    from .client import get_client
+    return normalize_joke(get_client().get_json(settings.JOKEAPI_URL))
+
+
+def _parse_lines(path, content):
+    # One JSON value per line; invalid lines are skipped
+    for number, line in enumerate(content.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            logger.warning(f"{path}:{number}: skipping invalid line: {e}")
+
+
+@functools.lru_cache(maxsize=4)
+def _load_file(path):
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    try:
+        entries = json.loads(content)
+    except ValueError:
+        entries = list(_parse_lines(path, content))
+    if not isinstance(entries, list):
+        entries = [entries]
+    jokes = []
+    for entry in entries:
+        try:
+            jokes.append(normalize_joke(entry))
+        except (JokeSourceError, AttributeError) as e:
+            logger.warning(f"{path}: skipping invalid joke {entry!r}: {e}")
+    if entries and not jokes:
+        raise ValueError("no valid jokes")
+    return jokes
+
+
+def file_source():
+    """
+    Pick a random joke from JOKE_SOURCE_FILE
+
+    The file holds a JSON list or JSON lines of JokeAPI jokes or plain
+    strings. Invalid entries are skipped with a warning.
+    """
+    try:
+        jokes = _load_file(settings.JOKE_SOURCE_FILE)
+    except (OSError, ValueError) as e:
+        raise JokeSourceError(f"Can't read jokes from {settings.JOKE_SOURCE_FILE!r}: {e}")
+    if not jokes:
+        raise JokeSourceError(f"No jokes in {settings.JOKE_SOURCE_FILE!r}")
+    return dict(random.choice(jokes))
+
+
+def database_source():
+    """Pick a random joke from the local corpus (jokes.models.Joke)"""
+    # Imported here: the models module uses the helpers of this one
+    from .models import Joke
+    joke = Joke.objects.random()
+    if joke is None:
+        raise JokeSourceError("No jokes stored; load some with manage.py ingest_jokes")
+    joke.current_variants()
+    return joke.to_dict()
+
+
+def get_source():
+    """Return the configured joke source"""
+    return import_string(settings.JOKE_SOURCE)
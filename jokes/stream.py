@@ -0,0 +1,167 @@
+"""
+Server-Sent Events stream of jokes for the dashboards
+
+Every JOKE_STREAM_INTERVAL seconds one joke is taken from the buffer and
+published, with its cipher variants and QR code URLs, to every open
+dashboard. The first process to ask for the joke of an interval publishes it
+to the cache (a cache.add() on the interval decides which), and the other
+processes pick it up from there, so the joke source sees one fetch per
+interval however many dashboards are open.
+
+Within a process a single Broadcaster task polls the cache and fans the
+events out to the streams, each of which waits on its own queue. Streams are
+async generators served by the ASGI handler (security_system/asgi.py), so an
+idle connection holds no thread; under WSGI, which would buffer a stream
+whole, there is no stream and dashboards fetch jokes themselves. Streams end after JOKE_STREAM_MAX_AGE
+seconds and EventSource reconnects, which bounds the life of streams whose
+client went away unnoticed.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import buffer, qr
+from . import variants as joke_variants
+from .sources import format_joke
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'jokes:stream'
+EVENT_KEY = f'{KEY_PREFIX}:event'
+
+# Seconds between two looks at the cache for a new event, per process
+POLL_INTERVAL = 1.0
+
+# Seconds of silence after which a comment is sent to keep proxies from
+# closing the connection
+KEEPALIVE_INTERVAL = 15
+
+# Milliseconds EventSource waits before reconnecting
+RETRY_MS = 3000
+
+
+def _slot_key(slot):
+    return f'{KEY_PREFIX}:slot:{slot}'
+
+
+def joke_event(joke, slot):
+    """The event of a joke: the fields of a /jokes/fetch/ response"""
+    texts = joke_variants.qr_texts(joke)
+    qr.prerender(list(texts.values()))
+    return {
+        'id': slot,
+        'joke': format_joke(joke),
+        'category': joke.get('category', 'Unknown'),
+        'encrypted': {name: texts[name] for name in joke_variants.CIPHER_VARIANTS},
+        'qr_codes': {name: qr.qr_url(text) for name, text in texts.items()},
+    }
+
+
+def current_event():
+    """
+    Return the event of the current interval, publishing it if nobody has
+
+    Returns the previous event (or None) while another process publishes.
+    """
+    slot = int(time.time() // settings.JOKE_STREAM_INTERVAL)
+    event = cache.get(EVENT_KEY)
+    if event is not None and event['id'] >= slot:
+        return event
+    if cache.add(_slot_key(slot), True, settings.JOKE_STREAM_INTERVAL * 2):
+        try:
+            event = joke_event(buffer.get_joke(), slot)
+        except Exception as e:
+            logger.error(f"Could not publish a joke to the stream: {str(e)}")
+        else:
+            cache.set(EVENT_KEY, event, None)
+    return event
+
+
+def format_event(event):
+    """An event in the text/event-stream format"""
+    data = {key: value for key, value in event.items() if key != 'id'}
+    return f"id: {event['id']}\ndata: {json.dumps(data)}\n\n"
+
+
+def _offer(queue, event):
+    # Streams only need the latest event, so a slow one drops older ones
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class Broadcaster:
+    """Fans the published events out to the open streams of a process"""
+
+    def __init__(self):
+        self.queues = set()
+        self.event = None
+        self._task = None
+
+    def subscribe(self):
+        """Return a queue receiving the events, starting with the current one"""
+        queue = asyncio.Queue(maxsize=1)
+        if self.event is not None:
+            queue.put_nowait(self.event)
+        self.queues.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+
+    async def _run(self):
+        # Runs while there are streams; the next subscriber starts it again
+        while self.queues:
+            try:
+                event = await sync_to_async(current_event)()
+            except Exception as e:
+                logger.error(f"Joke stream could not read the current event: {str(e)}")
+                event = None
+            if event is not None and (self.event is None or event['id'] != self.event['id']):
+                self.event = event
+                for queue in list(self.queues):
+                    _offer(queue, event)
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+broadcaster = Broadcaster()
+
+
+async def events(last_event_id=None, updates_only=False):
+    """
+    Yield the text/event-stream of a dashboard
+
+    The current joke comes first unless the client, reconnecting, already
+    has it (``last_event_id``), or only wants the jokes published from now
+    on (``updates_only``) because it fetched one itself.
+    """
+    try:
+        seen = int(last_event_id)
+    except (TypeError, ValueError):
+        seen = -1
+        if updates_only:
+            seen = int(time.time() // settings.JOKE_STREAM_INTERVAL)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.JOKE_STREAM_MAX_AGE
+    queue = broadcaster.subscribe()
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                event = await asyncio.wait_for(queue.get(), min(KEEPALIVE_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            # Events are numbered by interval, so older ones are never sent
+            if event['id'] > seen:
+                seen = event['id']
+                yield format_event(event)
+    finally:
+        broadcaster.unsubscribe(queue)
@@ -0,0 +1,30 @@
+from celery import shared_task
+from celery.signals import worker_ready
+from django.conf import settings
+from . import buffer
+from .checks import check_shared_buffer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refill_joke_buffer():
+    """
+    Celery task to keep the local joke buffer filled from the joke source
+    """
+    try:
+        added = buffer.refill(store=settings.JOKE_STORE_FETCHED)
+        logger.info(f"Added {added} jokes to the buffer ({buffer.size()} buffered)")
+        return f"Added {added} jokes to the buffer"
+    except Exception as e:
+        logger.error(f"Error in refill_joke_buffer task: {str(e)}")
+        return f"Error: {str(e)}"
+
+
+
+@worker_ready.connect
+def warn_unshared_buffer(**kwargs):
+    """Workers don't run Django's system checks, so report jokes.W001 here"""
+    for warning in check_shared_buffer(None):
+        logger.warning(f"{warning.msg} {warning.hint}")
@@ -1,3 +1,521 @@
-from django.test import TestCase
+import asyncio
+import time
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from . import buffer, qr, search, stream
+from . import variants as joke_variants
+from .client import CircuitOpenError, JokeAPIClient
+from .models import Joke, JokeTerm
+from .sources import JokeSourceError
+
+
+def single(text, category='Misc'):
+    return {'type': 'single', 'joke': text, 'category': category}
+
+
+def counting_source(jokes):
+    """A joke source cycling through ``jokes``; ``calls`` counts its calls"""
+    def source():
+        source.calls += 1
+        return dict(jokes[(source.calls - 1) % len(jokes)])
+    source.calls = 0
+    return source
+
+
+def failing_source():
+    raise JokeSourceError("JokeAPI is down")
+
+
+def response(status_code=200, data=None):
+    return mock.Mock(status_code=status_code, json=mock.Mock(return_value=data))
+
+
+@override_settings(JOKE_BUFFER_SIZE=3, JOKE_REFILL_MAX_FETCHES=5, JOKE_REFILL_BACKOFF=60, QR_CACHE_BACKEND='')
+class BufferTests(SimpleTestCase):
+    """The prefetched joke buffer, its refills and deduplication"""
+
+    def setUp(self):
+        cache.clear()
+        self.jokes = [single(f"Joke number {number}") for number in range(10)]
+
+    def refill(self, source):
+        with mock.patch('jokes.buffer.get_source', return_value=source):
+            return buffer.refill()
+
+    def test_pop_returns_jokes_in_push_order(self):
+        for joke in self.jokes[:3]:
+            self.assertTrue(buffer.push(joke))
+        self.assertEqual(buffer.size(), 3)
+        self.assertEqual([buffer.pop() for _ in range(4)], self.jokes[:3] + [None])
+        self.assertEqual(buffer.size(), 0)
+
+    def test_push_refuses_when_full(self):
+        for joke in self.jokes[:3]:
+            buffer.push(joke)
+        self.assertFalse(buffer.push(self.jokes[3]))
+        self.assertEqual(buffer.size(), 3)
+
+    def test_duplicates_are_only_refused_while_buffered(self):
+        self.assertTrue(buffer.push(single("Same joke")))
+        # Same text, other spacing and case
+        self.assertFalse(buffer.push(single("same   JOKE")))
+        buffer.pop()
+        self.assertTrue(buffer.push(single("Same joke")))
+
+    def test_refill_fills_the_buffer(self):
+        source = counting_source(self.jokes)
+        self.assertEqual(self.refill(source), 3)
+        self.assertEqual(source.calls, 3)
+        self.assertEqual(buffer.size(), 3)
+        # The cipher variants are computed on the way in
+        self.assertTrue(joke_variants.is_current(buffer.pop()['variants']))
+
+    def test_refill_of_a_full_buffer_calls_nothing(self):
+        self.refill(counting_source(self.jokes))
+        source = counting_source(self.jokes)
+        self.assertEqual(self.refill(source), 0)
+        self.assertEqual(source.calls, 0)
+        # and isn't taken for a source without new jokes
+        self.assertIsNone(cache.get(buffer.BACKOFF_KEY))
+
+    def test_refill_fetches_at_most_the_limit(self):
+        source = counting_source([single("The only joke")])
+        self.assertEqual(self.refill(source), 1)
+        self.assertEqual(source.calls, 5)
+
+    def test_refills_back_off_once_the_source_has_nothing_new(self):
+        source = counting_source([single("The only joke")])
+        self.refill(source)
+        with self.assertLogs('jokes.buffer', 'WARNING') as logs:
+            self.assertEqual(self.refill(source), 0)
+        self.assertIn("refills paused for 60s", logs.output[0])
+        self.assertEqual(source.calls, 10)
+        # The next runs don't call the source at all
+        self.assertEqual(self.refill(source), 0)
+        self.assertEqual(source.calls, 10)
+        buffer.clear()
+        self.assertEqual(self.refill(source), 1)
+
+    def test_backoff_doubles_up_to_an_hour(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set, self.assertLogs('jokes.buffer'):
+            for _ in range(8):
+                cache.delete(buffer.BACKOFF_KEY)
+                self.refill(failing_source)
+        delays = [call.args[2] for call in cache_set.call_args_list if call.args[0] == buffer.BACKOFF_KEY]
+        self.assertEqual(delays, [60, 120, 240, 480, 960, 1920, 3600, 3600])
+
+    def test_a_run_adding_jokes_resets_the_backoff(self):
+        with self.assertLogs('jokes.buffer'):
+            self.refill(failing_source)
+        cache.delete(buffer.BACKOFF_KEY)
+        self.refill(counting_source(self.jokes))
+        self.assertIsNone(cache.get(buffer.IDLE_KEY))
+
+    def test_get_joke_calls_the_source_when_the_buffer_is_empty(self):
+        source = counting_source(self.jokes)
+        with mock.patch('jokes.buffer.get_source', return_value=source):
+            self.assertEqual(buffer.get_joke(), self.jokes[0])
+        self.assertEqual(source.calls, 1)
+
+    def test_get_joke_serves_the_last_joke_when_the_source_fails(self):
+        with mock.patch('jokes.buffer.get_source', return_value=failing_source):
+            with self.assertRaises(JokeSourceError):
+                buffer.get_joke()
+            buffer.push(self.jokes[0])
+            self.assertEqual(buffer.get_joke(), self.jokes[0])
+            with self.assertLogs('jokes.buffer', 'WARNING'):
+                self.assertEqual(buffer.get_joke(), self.jokes[0])
+
+
+@override_settings(JOKEAPI_RETRIES=2, JOKEAPI_BACKOFF=0, JOKEAPI_BREAKER_THRESHOLD=2, JOKEAPI_BREAKER_RESET=30)
+class JokeAPIClientTests(SimpleTestCase):
+    """Retries and the circuit breaker of the JokeAPI client"""
+
+    URL = 'https://jokeapi.test/joke'
+
+    def setUp(self):
+        self.client = JokeAPIClient()
+        self.addCleanup(self.client.close)
+
+    def get(self, *responses):
+        with mock.patch.object(self.client.session, 'get', side_effect=responses) as get:
+            try:
+                return self.client.get_json(self.URL)
+            finally:
+                self.calls = get.call_count
+
+    def test_retries_timeouts_and_server_errors(self):
+        data = self.get(requests.Timeout("slow"), response(503), response(200, {'joke': 'Hi'}))
+        self.assertEqual(data, {'joke': 'Hi'})
+        self.assertEqual(self.calls, 3)
+        outcomes = self.client.stats()['outcomes']
+        self.assertEqual(outcomes['timeout']['count'], 1)
+        self.assertEqual(outcomes['http_error']['count'], 1)
+        self.assertEqual(outcomes['success']['count'], 1)
+
+    def test_gives_up_after_the_retries(self):
+        with self.assertRaises(JokeSourceError):
+            self.get(*[requests.ConnectionError("refused")] * 3)
+        self.assertEqual(self.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(JokeSourceError):
+            self.get(response(404))
+        self.assertEqual(self.calls, 1)
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            with self.assertRaises(JokeSourceError):
+                self.get(response(400))
+        self.assertEqual(self.client.stats()['circuit'], 'open')
+        with self.assertRaises(CircuitOpenError):
+            self.get(response(200, {}))
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.client.stats()['outcomes']['circuit_open']['count'], 1)
+
+    def test_breaker_lets_one_trial_call_through_after_the_reset(self):
+        for _ in range(2):
+            with self.assertRaises(JokeSourceError):
+                self.get(response(400))
+        with override_settings(JOKEAPI_BREAKER_RESET=0):
+            self.assertEqual(self.client.stats()['circuit'], 'half_open')
+            # A failed trial opens the breaker again
+            with self.assertRaises(JokeSourceError):
+                self.get(response(400))
+            self.assertEqual(self.get(response(200, {'joke': 'Hi'})), {'joke': 'Hi'})
+        self.assertEqual(self.client.stats()['circuit'], 'closed')
+        self.assertEqual(self.client.stats()['consecutive_failures'], 0)
+
+    def test_only_one_trial_call_at_a_time(self):
+        for _ in range(2):
+            with self.assertRaises(JokeSourceError):
+                self.get(response(400))
+        with override_settings(JOKEAPI_BREAKER_RESET=0):
+            self.assertTrue(self.client._allow())
+            self.assertFalse(self.client._allow())
+
+
+@override_settings(JOKE_CAESAR_SHIFT=3, JOKE_VIGENERE_KEY='JOKE')
+class VariantsTests(SimpleTestCase):
+    """Materialized cipher variants of jokes"""
+
+    def test_compute(self):
+        variants = joke_variants.compute({'type': 'twopart', 'setup': "Knock knock", 'delivery': "Who's there?"})
+        self.assertEqual(variants['atbash'], "Pmlxp pmlxp\n\nDsl'h gsviv?")
+        self.assertEqual(variants['caesar'], "Nqrfn nqrfn\n\nZkr'v wkhuh?")
+        self.assertEqual(variants['vigenere'], "Tbygt yxsly\n\nGlx'g dlnfo?")
+        self.assertEqual(variants['sms'], "Knock knock Who's there?")
+
+    def test_sms_is_cut_to_the_sms_length(self):
+        self.assertEqual(len(joke_variants.compute(single('ha' * 200))['sms']), joke_variants.SMS_LENGTH)
+
+    def test_materialize_computes_once(self):
+        joke = single("Hello")
+        with mock.patch('jokes.variants.compute', wraps=joke_variants.compute) as compute:
+            first = joke_variants.materialize(joke)
+            self.assertIs(joke_variants.materialize(joke), first)
+        self.assertEqual(compute.call_count, 1)
+        self.assertIs(joke['variants'], first)
+
+    def test_changed_settings_outdate_the_variants(self):
+        joke = single("Hello")
+        joke_variants.materialize(joke)
+        with override_settings(JOKE_CAESAR_SHIFT=5):
+            self.assertFalse(joke_variants.is_current(joke['variants']))
+            self.assertEqual(joke_variants.materialize(joke)['caesar'], "Mjqqt")
+
+    def test_qr_texts(self):
+        texts = joke_variants.qr_texts(single("Hello"))
+        self.assertEqual(list(texts), ['original', 'atbash', 'caesar', 'vigenere'])
+        self.assertEqual(texts['original'], "Hello")
+        self.assertEqual(texts['caesar'], "Khoor")
+
+
+class QRCacheTests(SimpleTestCase):
+    """The two-tier cache of rendered QR images"""
+
+    def setUp(self):
+        caches['default'].clear()
+        qr.get_cache().clear()
+
+    def test_lru_evicts_the_least_recently_used_images(self):
+        qr_cache = qr.QRCache(max_bytes=10)
+        qr_cache.set('a', b'aaaa')
+        qr_cache.set('b', b'bbbb')
+        qr_cache.get('a')
+        qr_cache.set('c', b'cccc')
+        self.assertIsNone(qr_cache.get('b'))
+        self.assertEqual(qr_cache.get('a'), b'aaaa')
+        self.assertEqual(qr_cache.get('c'), b'cccc')
+        stats = qr_cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (2, 8, 1))
+
+    def test_images_larger_than_the_memory_tier_are_not_kept(self):
+        qr_cache = qr.QRCache(max_bytes=3)
+        qr_cache.set('a', b'aaaa')
+        self.assertIsNone(qr_cache.get('a'))
+
+    def test_shared_tier_serves_other_processes(self):
+        qr.QRCache(1024, caches['default']).set('a', b'image')
+        # A fresh memory tier, as in another process
+        qr_cache = qr.QRCache(1024, caches['default'])
+        self.assertEqual(qr_cache.get('a'), b'image')
+        self.assertEqual(qr_cache.get('a'), b'image')
+        stats = qr_cache.stats()
+        self.assertEqual((stats['shared_hits'], stats['memory_hits'], stats['misses']), (1, 1, 0))
+
+    def test_get_qr_renders_once(self):
+        with mock.patch('jokes.qr.render_qr', wraps=qr.render_qr) as render:
+            first = qr.get_qr("Hello")
+            self.assertEqual(qr.get_qr("Hello"), first)
+            qr.get_qr("Hello", image_format='svg')
+            qr.get_qr("Hello", box_size=5)
+        self.assertEqual(render.call_count, 3)
+
+    @override_settings(QR_CACHE_BACKEND='default')
+    def test_uncached_images_reach_neither_tier(self):
+        with mock.patch('jokes.qr._cache', None):
+            image = qr.get_qr("otpauth://totp/secret", use_cache=False)
+            self.assertEqual(image, qr.render_qr("otpauth://totp/secret", backend='raster'))
+            stats = qr.stats()
+        self.assertEqual((stats['entries'], stats['misses']), (0, 0))
+        digest = qr.qr_digest("otpauth://totp/secret", backend='raster')
+        self.assertIsNone(caches['default'].get(f'qr:{digest}.png'))
+
+    def test_get_qr_many_renders_each_missing_image_once(self):
+        qr.get_qr("cached")
+        with mock.patch('jokes.qr.render_qr', wraps=qr.render_qr) as render:
+            images = qr.get_qr_many(["cached", "new", "new"])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(images, [qr.get_qr("cached"), qr.get_qr("new"), qr.get_qr("new")])
+
+
+class QRCodeImageTests(TestCase):
+    """QR images served by signed URL"""
+
+    def setUp(self):
+        qr.get_cache().clear()
+        user = get_user_model().objects.create_user('tester', password='secret')
+        self.client.force_login(user)
+        self.url = qr.qr_url("Hello")
+
+    def test_serves_the_image_the_url_names(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, qr.get_qr("Hello"))
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(qr.qr_url("Hello", image_format='svg', box_size=5))
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response.content, qr.get_qr("Hello", image_format='svg', box_size=5))
+
+    def test_matching_etag_gets_a_304_without_rendering(self):
+        etag = self.client.get(self.url)['ETag']
+        qr.get_cache().clear()
+        with mock.patch('jokes.qr.render_qr') as render:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        render.assert_not_called()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_etag_depends_on_the_content(self):
+        self.assertEqual(self.client.get(self.url)['ETag'], self.client.get(qr.qr_url("Hello"))['ETag'])
+        self.assertNotEqual(self.client.get(self.url)['ETag'], self.client.get(qr.qr_url("Bye"))['ETag'])
+
+    def test_tampered_token_is_not_found(self):
+        token = self.url.rsplit('/', 1)[1][:-len('.png')]
+        data, signature = token.rsplit(':', 1)
+        forged = qr.qr_token("Forged").rsplit(':', 1)[0]
+        for bad in (f'{data}x:{signature}', f'{forged}:{signature}', f'{data}:{signature[:-1]}A'):
+            self.assertIsNone(qr.get_qr_by_token(bad))
+            self.assertEqual(self.client.get(f'/jokes/qr/{bad}.png').status_code, 404)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class RasterBackendTests(SimpleTestCase):
+    """The PIL-free renderer draws exactly the pixels of qrcode's PIL images"""
+
+    TEXTS = ("Hello", "A longer joke, with punctuation and ünïcödé!", "x" * 300)
+
+    def pixels(self, image):
+        image = Image.open(BytesIO(image))
+        return image.size, list(image.convert('L').getdata())
+
+    def test_png_pixels_match_pil(self):
+        for text in self.TEXTS:
+            for box_size, border in ((10, 4), (3, 0), (1, 2)):
+                options = {'box_size': box_size, 'border': border}
+                self.assertEqual(
+                    self.pixels(qr.render_qr(text, backend='raster', **options)),
+                    self.pixels(qr.render_qr(text, backend='pil', **options)),
+                    msg=f"{text[:10]!r} {options}"
+                )
+
+    def test_png_is_one_bit(self):
+        image = Image.open(BytesIO(qr.render_qr("Hello", backend='raster')))
+        self.assertEqual(image.mode, '1')
+
+    def test_svg_has_the_size_of_the_png(self):
+        png = Image.open(BytesIO(qr.render_qr("Hello", backend='raster')))
+        svg = qr.render_qr("Hello", image_format='svg', backend='raster').decode()
+        self.assertIn(f'width="{png.width}" height="{png.height}"', svg)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            qr.render_qr("Hello", backend='ascii')
+
+
+@override_settings(JOKE_STREAM_INTERVAL=30, JOKE_STREAM_MAX_AGE=5)
+class StreamTests(TestCase):
+    """The Server-Sent Events stream of jokes"""
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user('tester', password='secret')
+        self.client.force_login(user)
+        self.async_client.force_login(user)
+        self.source = counting_source([single(f"Joke number {number}") for number in range(10)])
+        patches = [
+            mock.patch('jokes.buffer.get_source', return_value=self.source),
+            # Every test gets a broadcaster on its own event loop
+            mock.patch('jokes.stream.broadcaster', stream.Broadcaster()),
+            mock.patch('jokes.qr.prerender'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_one_joke_is_published_per_interval(self):
+        first = stream.current_event()
+        self.assertEqual(stream.current_event(), first)
+        self.assertEqual(self.source.calls, 1)
+        self.assertEqual(first['id'], int(time.time() // 30))
+        self.assertEqual(first['joke'], "Joke number 0")
+        self.assertEqual(set(first['encrypted']), set(joke_variants.CIPHER_VARIANTS))
+        self.assertTrue(first['qr_codes']['original'].startswith('/jokes/qr/'))
+
+    def test_format_event(self):
+        self.assertEqual(stream.format_event({'id': 7, 'joke': "Hi"}), 'id: 7\ndata: {"joke": "Hi"}\n\n')
+
+    async def read(self, events, count):
+        messages = []
+        try:
+            async for message in events:
+                messages.append(message)
+                if len(messages) == count:
+                    break
+        finally:
+            await events.aclose()
+        return messages
+
+    async def test_stream_sends_the_current_joke(self):
+        response = await self.async_client.get('/jokes/stream/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        retry, event = await asyncio.wait_for(self.read(response.streaming_content, 2), 5)
+        self.assertEqual(retry, b'retry: 3000\n\n')
+        self.assertTrue(event.startswith(f'id: {int(time.time() // 30)}\n'.encode()))
+        self.assertIn(b'"joke": "Joke number 0"', event)
+
+    async def test_stream_skips_the_joke_the_client_has(self):
+        # Reconnecting with the current joke, or fetched one already: only
+        # the keepalives come until the next interval
+        slot = str(int(time.time() // 30))
+        for events in (stream.events(slot), stream.events(updates_only=True)):
+            with mock.patch('jokes.stream.KEEPALIVE_INTERVAL', 0.5):
+                messages = await asyncio.wait_for(self.read(events, 3), 5)
+            self.assertEqual(messages[1:], [': keepalive\n\n'] * 2)
+
+    def test_no_stream_under_wsgi(self):
+        self.assertEqual(self.client.get('/jokes/stream/').status_code, 204)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/jokes/stream/').status_code, 302)
+
+
+class SearchTests(TestCase):
+    """The inverted index and its queries"""
+
+    def setUp(self):
+        cache.clear()
+        Joke.objects.ingest([
+            single("A man walks into a café and orders a cipher", 'Pun'),
+            single("The cafe owner says the cipher is on the house", 'Misc'),
+            single("Cipher cipher cipher, said the cryptographer", 'Programming'),
+            single("I live on a long Straße in Berlin", 'Misc'),
+            single("Why do programmers confuse Halloween and Christmas?", 'Programming'),
+        ])
+        self.texts = dict(Joke.objects.values_list('id', 'text'))
+
+    def find(self, query, **options):
+        return [self.texts[joke_id] for joke_id, _ in search.search(query, **options)]
+
+    def test_tokenize_folds_case_and_accents(self):
+        self.assertEqual(
+            search.tokenize("Café STRASSE Straße naïve the ﬁsh"), ['cafe', 'strasse', 'strasse', 'naive', 'fish']
+        )
+
+    def test_ingested_jokes_are_indexed(self):
+        self.assertFalse(Joke.objects.filter(indexed=False).exists())
+        # Accented and unaccented spellings share one term
+        self.assertEqual(JokeTerm.objects.filter(term__in=['cafe', 'café']).count(), 1)
+        self.assertTrue(JokeTerm.objects.filter(term='strasse').exists())
+
+    def test_accented_terms_match_either_spelling(self):
+        cafe_jokes = {
+            "A man walks into a café and orders a cipher",
+            "The cafe owner says the cipher is on the house",
+        }
+        self.assertEqual(set(self.find('CAFÉ')), cafe_jokes)
+        self.assertEqual(set(self.find('cafe')), cafe_jokes)
+        self.assertEqual(self.find('strasse'), ["I live on a long Straße in Berlin"])
+
+    def test_and_needs_every_term_or_needs_any(self):
+        self.assertEqual(self.find('cafe owner'), ["The cafe owner says the cipher is on the house"])
+        self.assertEqual(self.find('cafe halloween'), [])
+        self.assertEqual(len(self.find('cafe halloween', mode='or')), 3)
+        # A term missing from the index only fails AND queries
+        self.assertEqual(self.find('cafe unicorn'), [])
+        self.assertEqual(len(self.find('cafe unicorn', mode='or')), 2)
+
+    def test_categories_filter_the_results(self):
+        self.assertEqual(
+            self.find('cipher', categories=['Programming']), ["Cipher cipher cipher, said the cryptographer"]
+        )
+        self.assertEqual(len(self.find('cipher', categories=['Pun', 'Misc'])), 2)
+        self.assertEqual(self.find('cipher', categories=['Dark']), [])
+
+    def test_bm25_ranks_frequent_and_rare_terms_higher(self):
+        # The joke repeating the term comes first
+        self.assertEqual(self.find('cipher')[0], "Cipher cipher cipher, said the cryptographer")
+        # A rare term outweighs a common one
+        results = self.find('owner cipher', mode='or')
+        self.assertEqual(results[0], "The cafe owner says the cipher is on the house")
+        scores = [score for _, score in search.search('cipher')]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_new_jokes_are_found_without_waiting_for_the_cache(self):
+        self.assertEqual(self.find('unicorn'), [])
+        Joke.objects.ingest([single("A unicorn walks into a café")])
+        self.assertEqual(len(search.search('unicorn')), 1)
+        self.assertEqual(len(search.search('café')), 3)
+
+    def test_rebuild_indexes_every_joke_again(self):
+        self.assertEqual(search.rebuild(), 5)
+        self.assertEqual(len(search.search('cipher')), 3)
+
+    def test_search_jokes_returns_the_jokes(self):
+        results = search.search_jokes('strasse')
+        self.assertEqual([result['joke'] for result in results], ["I live on a long Straße in Berlin"])
+        self.assertEqual(results[0]['category'], 'Misc')
@@ -1,7 +1,10 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     path('', views.jokes_dashboard_view, name='jokes_dashboard'),
     path('fetch/', views.fetch_joke, name='fetch_joke'),
+    path('search/', views.search_jokes, name='search_jokes'),
+    path('stream/', views.joke_stream, name='joke_stream'),
+    re_path(r'^qr/(?P<token>[-\w.]+:[-\w]+)\.(?P<image_format>png|svg)$', views.qr_code_image, name='qr_code'),
 ]
@@ -0,0 +1,68 @@
+"""
+Materialized cipher variants of jokes
+
+Every joke is served with its Atbash, Caesar (JOKE_CAESAR_SHIFT) and
+Vigenere (JOKE_VIGENERE_KEY) encryptions and an SMS-length text. They are
+computed once and stored with the joke: in the ``variants`` field of stored
+jokes, and under the ``variants`` key of the joke dicts kept in the buffer.
+
+The stored variants carry a version, a hash of the settings they were
+computed with; changing the default shift or key changes the version, and
+outdated variants are recomputed on first use (or all at once with
+``manage.py ingest_jokes --refresh-variants``).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+
+from ciphers.registry import get_cipher
+from .sources import format_joke
+
+# SMS messages are cut to this many characters
+SMS_LENGTH = 160
+
+CIPHER_VARIANTS = ('atbash', 'caesar', 'vigenere')
+
+
+def version():
+    """Hash of the settings the variants depend on"""
+    spec = json.dumps([settings.JOKE_CAESAR_SHIFT, settings.JOKE_VIGENERE_KEY, SMS_LENGTH])
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()[:12]
+
+
+def compute(joke):
+    """Compute the variants of a joke (a dict in JokeAPI's format)"""
+    text = format_joke(joke)
+    return {
+        'version': version(),
+        'atbash': get_cipher('atbash')(text),
+        'caesar': get_cipher('caesar', shift=settings.JOKE_CAESAR_SHIFT)(text),
+        'vigenere': get_cipher('vigenere', key=settings.JOKE_VIGENERE_KEY)(text),
+        'sms': format_joke(joke, ' ')[:SMS_LENGTH],
+    }
+
+
+def is_current(variants):
+    """True if stored variants were computed with the current settings"""
+    return bool(variants) and variants.get('version') == version()
+
+
+def materialize(joke):
+    """
+    Return the variants of a joke dict, computing them if missing or outdated
+
+    The variants are stored in the dict, so they travel with it through the
+    buffer.
+    """
+    if not is_current(joke.get('variants')):
+        joke['variants'] = compute(joke)
+    return joke['variants']
+
+
+def qr_texts(joke):
+    """The texts of a joke's QR codes: the joke itself and its cipher variants"""
+    variants = materialize(joke)
+    texts = {'original': format_joke(joke)}
+    texts.update((name, variants[name]) for name in CIPHER_VARIANTS)
+    return texts
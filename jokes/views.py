@@ -1,15 +1,19 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-import requests
-import qrcode
-from io import BytesIO
-import base64
-from ciphers.utils import CipherUtils
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, HttpResponseNotAllowed, Http404, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.decorators import api_view
-from .serializers import JokeRequestSerializer, JokeResponseSerializer
+from . import buffer, qr, search, stream
+from . import variants as joke_variants
+from .sources import format_joke
+from .serializers import JokeRequestSerializer, JokeResponseSerializer, JokeSearchResponseSerializer
 
 
 @login_required
@@ -20,7 +24,14 @@ def jokes_dashboard_view(request):
 
 @swagger_auto_schema(
     method='get',
-    operation_description="Fetch a random joke from JokeAPI with QR code generation",
+    operation_description="Get a random joke (prefetched from JokeAPI) with QR code generation. "
+                          "QR codes are returned as URLs of /jokes/qr/ images unless inline=true.",
+    manual_parameters=[
+        openapi.Parameter(
+            'inline', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+            description="Return QR codes as base64 data URIs instead of URLs"
+        ),
+    ],
     responses={
         200: JokeResponseSerializer,
         400: "Bad Request",
@@ -33,44 +44,32 @@ def jokes_dashboard_view(request):
 def fetch_joke(request):
     """Fetch a random joke from JokeAPI"""
     try:
-        # Fetch joke from JokeAPI
-        response = requests.get('https://v2.jokeapi.dev/joke/Any?safe-mode')
-        joke_data = response.json()
+        # Take a prefetched joke from the local buffer
+        joke_data = buffer.get_joke()
+        joke_text = format_joke(joke_data)
         
-        # Format joke text
-        if joke_data.get('type') == 'single':
-            joke_text = joke_data.get('joke', '')
-        else:
-            setup = joke_data.get('setup', '')
-            delivery = joke_data.get('delivery', '')
-            joke_text = f"{setup}\n\n{delivery}"
-        
-        # Generate QR codes for original and encrypted versions
-        qr_codes = {}
-        
-        # Original joke QR code
-        qr_codes['original'] = generate_qr_code(joke_text)
-        
-        # Atbash encrypted
-        atbash_text = CipherUtils.atbash_cipher(joke_text)
-        qr_codes['atbash'] = generate_qr_code(atbash_text)
-        
-        # Caesar encrypted (shift=3)
-        caesar_text = CipherUtils.caesar_cipher(joke_text, shift=3)
-        qr_codes['caesar'] = generate_qr_code(caesar_text)
+        # Original and encrypted versions, computed once per joke
+        variants = joke_variants.qr_texts(joke_data)
         
-        # Vigenere encrypted (key="JOKE")
-        vigenere_text = CipherUtils.vigenere_cipher(joke_text, key="JOKE")
-        qr_codes['vigenere'] = generate_qr_code(vigenere_text)
+        # QR codes are served by URL and rendered in the background meanwhile;
+        # old clients can ask for inline images, rendered concurrently
+        if request.GET.get('inline', '').lower() in ('1', 'true', 'yes'):
+            qr_codes = dict(zip(variants, qr.qr_data_uris(list(variants.values()))))
+        else:
+            qr_codes = {
+                name: request.build_absolute_uri(qr.qr_url(text))
+                for name, text in variants.items()
+            }
+            qr.prerender(list(variants.values()))
         
         return JsonResponse({
             'success': True,
             'joke': joke_text,
             'category': joke_data.get('category', 'Unknown'),
             'encrypted': {
-                'atbash': atbash_text,
-                'caesar': caesar_text,
-                'vigenere': vigenere_text
+                'atbash': variants['atbash'],
+                'caesar': variants['caesar'],
+                'vigenere': variants['vigenere']
             },
             'qr_codes': qr_codes
         })
@@ -82,20 +81,103 @@ def fetch_joke(request):
         })
 
 
-def generate_qr_code(text):
-    """Generate QR code from text and return base64 encoded image"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+@swagger_auto_schema(
+    method='get',
+    operation_description="Full-text search over the local joke corpus, best matches first",
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                          description="Words to search for"),
+        openapi.Parameter('category', openapi.IN_QUERY, type=openapi.TYPE_ARRAY,
+                          items=openapi.Items(type=openapi.TYPE_STRING),
+                          description="Only return jokes of these categories (repeated or comma separated)"),
+        openapi.Parameter('mode', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          enum=list(search.MODES), default='and',
+                          description="Match jokes containing all the words (and) or any of them (or)"),
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=20,
+                          description="Number of results"),
+    ],
+    responses={
+        200: JokeSearchResponseSerializer,
+        400: "Bad Request",
+        500: "Internal Server Error"
+    },
+    tags=['jokes']
+)
+@api_view(['GET'])
+@login_required
+def search_jokes(request):
+    """Search the local joke corpus"""
+    try:
+        categories = [
+            category.strip()
+            for value in request.GET.getlist('category')
+            for category in value.split(',')
+            if category.strip()
+        ]
+        limit = min(int(request.GET.get('limit', 20)), settings.JOKE_SEARCH_MAX_RESULTS)
+        results = search.search_jokes(
+            request.GET.get('q', ''),
+            categories=categories,
+            mode=request.GET.get('mode', 'and').lower(),
+            limit=limit,
+        )
+        return JsonResponse({
+            'success': True,
+            'count': len(results),
+            'results': results
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+
+
+async def joke_stream(request):
+    """Server-Sent Events stream pushing the published jokes to the dashboard"""
+    # Django's view decorators are sync only, hence the checks done here
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return redirect_to_login(request.get_full_path())
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server drains an async stream before sending any of it, so
+        # the stream is off there; a 204 stops EventSource from reconnecting
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        stream.events(
+            request.headers.get('Last-Event-ID'),
+            updates_only=request.GET.get('updates', '').lower() in ('1', 'true', 'yes')
+        ),
+        content_type='text/event-stream'
     )
-    qr.add_data(text)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_str}"
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def generate_qr_code(text):
+    """Generate QR code from text and return base64 encoded image (cached)"""
+    return qr.qr_data_uri(text)
+
+
+def _qr_etag(request, token, image_format):
+    # The URL names the content, so the ETag only depends on it
+    digest = qr.token_digest(token)
+    if digest is None:
+        return None
+    return f'{digest}.{image_format}'
+
+
+@require_GET
+@login_required
+@cache_control(private=True, max_age=365 * 24 * 60 * 60, immutable=True)
+@condition(etag_func=_qr_etag)
+def qr_code_image(request, token, image_format):
+    """Serve a QR code whose URL was handed out by fetch_joke, rendered on first request"""
+    image = qr.get_qr_by_token(token, image_format)
+    if image is None:
+        raise Http404("Unknown QR code")
+    return HttpResponse(image, content_type=qr.CONTENT_TYPES[image_format])
@@ -20,6 +20,14 @@ app.conf.beat_schedule = {
         'task': 'automation.tasks.send_joke_emails',
         'schedule': crontab(hour=9, minute=0),  # Daily at 9:00 AM
     },
+    'refill-joke-buffer': {
+        'task': 'jokes.tasks.refill_joke_buffer',
+        'schedule': 30.0,  # Every 30 seconds
+    },
+    'retry-deliveries': {
+        'task': 'automation.tasks.retry_deliveries',
+        'schedule': 60.0,  # Every minute
+    },
     'cleanup-sessions-weekly': {
         'task': 'automation.tasks.cleanup_old_sessions',
         'schedule': crontab(hour=2, minute=0, day_of_week=1),  # Weekly on Monday at 2:00 AM
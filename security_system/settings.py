@@ -176,14 +176,117 @@ EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+# Seconds before a stalled SMTP connection is given up on
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', 30))
+# Messages built at a time by the bulk joke emails (automation.mailer)
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 100))
+# Recipients per Celery task the joke emails are split into
+EMAIL_CHUNK_SIZE = int(os.getenv('EMAIL_CHUNK_SIZE', 500))
+# Failed email and SMS deliveries are retried after DELIVERY_RETRY_DELAY
+# seconds, doubled on every attempt, up to DELIVERY_MAX_ATTEMPTS attempts
+DELIVERY_RETRY_DELAY = int(os.getenv('DELIVERY_RETRY_DELAY', 60))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', 5))
+# Seconds after which deliveries claimed by a run that never recorded them
+# (a worker that died mid-batch) go to the retry queue
+DELIVERY_CLAIM_TIMEOUT = int(os.getenv('DELIVERY_CLAIM_TIMEOUT', 60 * 60))
 
 # Celery Configuration for automation
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+# send_joke_emails fans out as a chord, which needs a result backend
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Delivery retries have their own queue: celery -A security_system worker -Q retries
+CELERY_TASK_ROUTES = {
+    'automation.tasks.retry_deliveries': {'queue': 'retries'},
+}
+
+# Messages per second and burst sent to each outbound provider, shared by all
+# workers through Redis (automation.ratelimit); a rate of 0 means no limit
+RATE_LIMITS = {
+    'smtp': {
+        'rate': float(os.getenv('SMTP_RATE_LIMIT', 0)),
+        'burst': int(os.getenv('SMTP_RATE_BURST', 10)),
+    },
+    'sms': {
+        'rate': float(os.getenv('SMS_RATE_LIMIT', 0)),
+        'burst': int(os.getenv('SMS_RATE_BURST', 5)),
+    },
+}
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', CELERY_BROKER_URL)
+
+# Cipher engine: texts at least this many characters long use the NumPy
+# kernels (when NumPy is installed) instead of the translation tables
+CIPHER_NUMPY_THRESHOLD = int(os.getenv('CIPHER_NUMPY_THRESHOLD', 64 * 1024))
+
+# Maximum number of items accepted by /ciphers/process/batch/
+CIPHER_BATCH_MAX_ITEMS = int(os.getenv('CIPHER_BATCH_MAX_ITEMS', 1000))
+
+# Bytes read from the request body at a time by /ciphers/process/stream/
+CIPHER_STREAM_CHUNK_SIZE = int(os.getenv('CIPHER_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Cache: shared Redis cache when CACHE_URL is set (needed for the joke buffer
+# to be shared between web and Celery processes), per-process memory otherwise
+if os.getenv('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Jokes: where jokes come from and the local buffer the request paths read
+JOKEAPI_URL = os.getenv('JOKEAPI_URL', 'https://v2.jokeapi.dev/joke/Any?safe-mode')
+# Shared JokeAPI client (jokes.client): timeouts in seconds, retries with
+# jittered backoff, and a circuit breaker opening after consecutive failures
+JOKEAPI_CONNECT_TIMEOUT = float(os.getenv('JOKEAPI_CONNECT_TIMEOUT', 3.05))
+JOKEAPI_READ_TIMEOUT = float(os.getenv('JOKEAPI_READ_TIMEOUT', 5))
+JOKEAPI_RETRIES = int(os.getenv('JOKEAPI_RETRIES', 2))
+JOKEAPI_BACKOFF = float(os.getenv('JOKEAPI_BACKOFF', 0.25))
+JOKEAPI_BREAKER_THRESHOLD = int(os.getenv('JOKEAPI_BREAKER_THRESHOLD', 5))
+JOKEAPI_BREAKER_RESET = float(os.getenv('JOKEAPI_BREAKER_RESET', 30))
+JOKEAPI_POOL_SIZE = int(os.getenv('JOKEAPI_POOL_SIZE', 10))
+# Dotted path of the joke source (jokes.sources.file_source reads JOKE_SOURCE_FILE)
+JOKE_SOURCE = os.getenv('JOKE_SOURCE', 'jokes.sources.jokeapi_source')
+JOKE_SOURCE_FILE = os.getenv('JOKE_SOURCE_FILE', '')
+JOKE_BUFFER_SIZE = int(os.getenv('JOKE_BUFFER_SIZE', 50))
+# Most calls to the joke source per refill run (every 30 seconds), and the
+# seconds refills pause after a run adds no joke, doubled on every such run
+JOKE_REFILL_MAX_FETCHES = int(os.getenv('JOKE_REFILL_MAX_FETCHES', 20))
+JOKE_REFILL_BACKOFF = int(os.getenv('JOKE_REFILL_BACKOFF', 60))
+# Default Caesar shift and Vigenere key of the joke cipher variants (changing
+# them invalidates the stored variants)
+JOKE_CAESAR_SHIFT = int(os.getenv('JOKE_CAESAR_SHIFT', 3))
+JOKE_VIGENERE_KEY = os.getenv('JOKE_VIGENERE_KEY', 'JOKE')
+# Save the jokes fetched by the buffer refill task to the local corpus
+JOKE_STORE_FETCHED = os.getenv('JOKE_STORE_FETCHED', 'True') == 'True'
+# Seconds search results are cached, and the most results a search returns
+JOKE_SEARCH_CACHE_TIMEOUT = int(os.getenv('JOKE_SEARCH_CACHE_TIMEOUT', 5 * 60))
+JOKE_SEARCH_MAX_RESULTS = int(os.getenv('JOKE_SEARCH_MAX_RESULTS', 100))
+# Seconds between the jokes pushed to the dashboards by /jokes/stream/, and
+# seconds a stream stays open before the browser reconnects
+JOKE_STREAM_INTERVAL = int(os.getenv('JOKE_STREAM_INTERVAL', 30))
+JOKE_STREAM_MAX_AGE = int(os.getenv('JOKE_STREAM_MAX_AGE', 5 * 60))
+
+# QR code cache: bytes of images kept in memory per process, and an optional
+# Django cache alias (e.g. 'default') used as a shared second tier
+QR_CACHE_MAX_BYTES = int(os.getenv('QR_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+QR_CACHE_BACKEND = os.getenv('QR_CACHE_BACKEND', '')
+QR_CACHE_TIMEOUT = int(os.getenv('QR_CACHE_TIMEOUT', 24 * 60 * 60))
+# Concurrent QR renders per process: threads, or processes when
+# QR_RENDER_PROCESSES is set
+QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+QR_RENDER_PROCESSES = int(os.getenv('QR_RENDER_PROCESSES', 0))
+# Default QR renderer: 'raster' (1-bit PNG/SVG straight from the matrix) or 'pil'
+QR_RENDER_BACKEND = os.getenv('QR_RENDER_BACKEND', 'raster')
 
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "tailwind"